@@ -0,0 +1,293 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, re, hashlib, colorsys, subprocess, threading, resultcache
+from xml.sax.saxutils import escape
+
+from oboe import EXPORT_FORMATS
+
+"""
+Caches of the Graphviz renders of the GO graphs, so that unchanged graphs
+are not rendered again (RenderCache, keyed by their dot files) and that
+graphs with the same terms, structure and term names are laid out once
+and then only recoloured (LayoutCache).
+
+Lists often share the same significant GO sub-graph and differ only in
+the p-values (e.g. replicates or threshold sweeps). The dot files that
+OBOe.write_dot makes of them then only differ in the colour and in the
+last two label lines (p-value and counts) of the enriched terms. The
+colour does not move the layout, but those lines set the width of the
+node boxes: the key of a graph is the hash of its dot file (and of the
+Graphviz version) with the colours masked and the digits of those lines
+masked as '0', so that graphs share a layout only if their label lines
+have the same characters but for the digits, which are all as wide in
+the fonts Graphviz uses (Times by default). The SVG is then made from
+the cached one by rewriting the colours and lines in place.
+"""
+
+# default size bound of the caches (bytes)
+MAXSIZE = 64 << 20
+
+# the enriched (styled) term statements of the OBOe.write_dot dot files
+STYLED_NODE = re.compile(r'^("([^"]+)" \[ id="\2" shape="note" '
+                         r'style="filled" color=")([^"]*)(" label=")([^"]*)"',
+                         re.M)
+
+DIGIT = re.compile(r'[0-9]')
+
+SVG_TEXT = re.compile(r'(<text[^>]*>)(.*?)(</text>)', re.S)
+SVG_COLOUR = re.compile(r'\b(fill|stroke)="#[0-9a-fA-F]{6}"')
+SVG_TITLE = re.compile(r'<title>(.*?)</title>')
+
+_graphviz_version = None
+
+
+class LayoutCache(object):
+
+    """
+    Keeps the SVG files of the laid out GO graphs in a directory (one
+    '<key>.svg' file each), bounded in size with the least recently
+    used graphs evicted first (see resultcache.ResultCache). Counts the
+    graphs made from cached layouts (hits) and the ones to lay out
+    (misses).
+    """
+
+    def __init__(self, cachedir, maxsize=MAXSIZE):
+
+        self.store = resultcache.ResultCache(cachedir, maxsize, ".svg")
+        self.cachedir = cachedir
+        self.hits = 0
+        self.misses = 0
+
+
+    def fetch(self, dotfile):
+
+        """
+        Makes the SVG of 'dotfile' (next to it) from a cached layout of
+        the same graph, if any. Returns whether it did.
+        """
+
+        with open(dotfile) as fh:
+            key, styles = layout_key(fh.read())
+
+        svgfile = os.path.splitext(dotfile)[0]+".svg"
+        try:
+            if not self.store.fetch(key, svgfile):
+                self.misses += 1
+                return False
+
+            with open(svgfile) as fh:
+                svg = recolour(fh.read(), styles)
+            with open(svgfile, "w") as fh:
+                fh.write(svg)
+        except (IOError, ValueError):
+            # unusable layout: laid out again (and re-cached)
+            if os.path.exists(svgfile):
+                os.remove(svgfile)
+            self.misses += 1
+            return False
+
+        self.hits += 1
+        return True
+
+
+    def add(self, dotfile):
+
+        """
+        Caches the layout of 'dotfile' (the SVG Graphviz made of it).
+        """
+
+        with open(dotfile) as fh:
+            key = layout_key(fh.read())[0]
+
+        self.store.store(key, os.path.splitext(dotfile)[0]+".svg")
+
+
+    def hit_rate(self):
+
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.
+
+
+# ==============================================================================
+
+class RenderCache(object):
+
+    """
+    Keeps the outputs (svg, png...) Graphviz rendered of the dot files
+    in a directory, keyed by the hash of the dot file text, the output
+    type and the Graphviz version, and bounded in size (the least
+    recently used evicted first, see resultcache.ResultCache).
+
+    Cached outputs are hard-linked (or copied, across file systems) in
+    place of the renders, so the files they are linked to must be
+    replaced rather than rewritten (as render_dot and ResultCache.fetch
+    do). Safe to use from several threads (of one process): the store is
+    only used under a lock, the dot files are hashed outside of it.
+    """
+
+    def __init__(self, cachedir, maxsize=MAXSIZE):
+
+        self.store = resultcache.ResultCache(cachedir, maxsize, ".out")
+        self.cachedir = cachedir
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+
+    def key(self, dotfile, filetype):
+
+        h = hashlib.sha1()
+        h.update(graphviz_version())
+        h.update("\0%s\0" % filetype)
+        with open(dotfile) as fh:
+            h.update(fh.read())
+
+        return h.hexdigest()
+
+
+    def fetch(self, dotfile, filetype):
+
+        """
+        Puts the cached render of 'dotfile' (as 'filetype') next to it,
+        if any. Returns whether it did.
+        """
+
+        outfile = os.path.splitext(dotfile)[0]+EXPORT_FORMATS[filetype][0]
+        key = self.key(dotfile, filetype)
+
+        with self._lock:
+            found = self.store.fetch(key, outfile, link=True)
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+        return bool(found)
+
+
+    def add(self, dotfile, filetype):
+
+        """
+        Caches the render of 'dotfile' (as 'filetype') next to it.
+        """
+
+        outfile = os.path.splitext(dotfile)[0]+EXPORT_FORMATS[filetype][0]
+        key = self.key(dotfile, filetype)
+
+        # the store's running size (and pruning) is not thread-safe
+        with self._lock:
+            self.store.store(key, outfile)
+
+
+    def hit_rate(self):
+
+        total = self.hits + self.misses
+        return self.hits / float(total) if total else 0.
+
+
+# accessory helpers
+# ------------------------------------------------------------------------------
+
+def layout_key(dot):
+
+    """
+    Returns the layout key of a dot file's text (see the module notes)
+    and the styles of its enriched terms: {term: (hex colour, p-value
+    line, counts line)}.
+    """
+
+    styles = {}
+
+    def mask(match):
+        head, term, colour, middle, label = match.groups()
+        lines = label.split("\n")
+        if len(lines) < 3:
+            # not a write_dot label: kept as part of the layout
+            return match.group(0)
+        styles[term] = (hex_colour(colour), lines[-2], lines[-1])
+        # same width with other digits (but not with other characters)
+        return head+middle+"\n".join(lines[:-2]+[DIGIT.sub("0", l) for l in
+                                                 lines[-2:]])+'"'
+
+    masked = STYLED_NODE.sub(mask, dot)
+
+    h = hashlib.sha1()
+    h.update(graphviz_version())
+    h.update("\0")
+    h.update(masked)
+
+    return h.hexdigest(), styles
+
+
+def recolour(svg, styles):
+
+    """
+    Applies the enrichment styles (see layout_key) to the nodes of an
+    SVG made by Graphviz: their fill/stroke colours and the last two
+    lines of their labels. Raises ValueError if a styled node is not
+    found in it.
+    """
+
+    # the nodes and edges are each preceded by a '<!-- name -->' comment
+    starts = [0] + [m.start() for m in re.finditer(r'<!-- ', svg)]
+    parts = [svg[a:b] for a, b in zip(starts, starts[1:] + [len(svg)])]
+    done = set()
+
+    for i, part in enumerate(parts):
+        title = SVG_TITLE.search(part)
+        if 'class="node"' not in part or title is None:
+            continue
+        term = title.group(1)
+        if term not in styles:
+            continue
+
+        colour, pvalue, counts = styles[term]
+        texts = list(SVG_TEXT.finditer(part))
+        if len(texts) < 2:
+            raise ValueError("Unexpected layout of node %s" % term)
+
+        second, last = texts[-2], texts[-1]
+        part = (part[:second.start(2)]+escape(pvalue)+
+                part[second.end(2):last.start(2)]+escape(counts)+
+                part[last.end(2):])
+        parts[i] = SVG_COLOUR.sub(lambda m: '%s="%s"' % (m.group(1), colour),
+                                  part)
+        done.add(term)
+
+    if len(done) != len(styles):
+        raise ValueError("Layout without the nodes %s" %
+                         ", ".join(sorted(set(styles) - done)))
+
+    return "".join(parts)
+
+
+def hex_colour(hsv):
+
+    """
+    Converts a Graphviz "H S V" colour into its SVG hex (#rrggbb) form.
+    """
+
+    rgb = colorsys.hsv_to_rgb(*[float(x) for x in hsv.split()])
+    return "#%02x%02x%02x" % tuple(int(round(c * 255)) for c in rgb)
+
+
+def graphviz_version():
+
+    """
+    Returns the version string of the installed Graphviz ('dot -V'),
+    empty if it cannot be run.
+    """
+
+    global _graphviz_version
+
+    if _graphviz_version is None:
+        try:
+            proc = subprocess.Popen(["dot", "-V"], stdout=subprocess.PIPE,
+                                    stderr=subprocess.PIPE)
+            out, err = proc.communicate()
+            _graphviz_version = (err or out).strip()
+        except OSError:
+            _graphviz_version = ""
+
+    return _graphviz_version
@@ -1,7 +1,7 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import os
+import os, misc, resultcache
 import rpy2.robjects as robjects
 from rpy2.robjects.packages import importr
 
@@ -10,25 +10,33 @@ Classes to interface in a limited way (presets) with
 R's packages 'topGO' and 'GOstats' via rpy2.
 """
 
-#TODO: Re-write these classes without using the 'robject.globalenv'
-#      because that leads to issues, when "crossing" objects from 
-#      different methods. Add some input validation.
+#TODO: Re-write the remaining methods without using the 'robject.globalenv'
+#      (as GOrich.perform_go_enrichment) because that leads to issues, 
+#      when "crossing" objects from different methods. Add some input 
+#      validation.
 
 # ==============================================================================
 
 class KEGGer(object):
 
 
-    def __init__(self, keggmap, alpha, organism):
+    def __init__(self, keggmap, alpha, organism, cache=None):
 
         self.mappings = keggmap
         self.alpha = alpha
         self.organism = organism
+        self.cache = cache
 
         KEGGdb = importr('KEGG.db')
         GOstats = importr('GOstats')
         GSEABase = importr('GSEABase')
 
+        if cache is not None:
+            # what the results depend on, besides the gene set
+            self.cache_parts = ("KEGG", misc.file_digest(keggmap),
+                                package_version('KEGG.db'), 
+                                package_version('GOstats'), organism, alpha)
+
     def perform_kegg_enrichment(self, targetspath):
 
         """
@@ -41,11 +49,18 @@ class KEGGer(object):
         robjects.globalenv["organism"] = self.organism
 
 
-        read_target_group_of_interest(targetspath)
+        genes = read_targets(targetspath)
+        robjects.globalenv["targetset"] = robjects.StrVector(genes)
+
+        outname = handle_result_saving(targetspath, "keggenrich/")
 
-        handle_result_saving(targetspath, "keggenrich/")
+        if self.cache is not None:
+            key = self.cache.key(genes, *self.cache_parts)
+            cached = self.cache.fetch(key, outname)
+            if cached is not None:
+                return outname if cached else None
 
-        robjects.r('''tryCatch(
+        success = robjects.r('''tryCatch(
                     {
                       KEGGmap <- read.csv(mappings, sep="\t", colClasses=
                                     c("character", "character"), header=FALSE)
@@ -69,94 +84,85 @@ class KEGGer(object):
 
                       write.table(enrichRes, file = outname, sep = "\t", 
                          row.names = FALSE, quote = FALSE)
+                      TRUE
 
                     }, error = function(e){ print( paste(basename, 
                     " failed to have any KEGG pathways mapped to its members!") 
-                    ) }
+                    ) 
+                    FALSE }
                     )
-        ''')
+        ''')[0]
+
+        if not success:
+            outname = None
+        if self.cache is not None:
+            self.cache.store(key, outname)
+
+        return outname
 
 
 # ==============================================================================
 
 class GOrich(object):
 
-    # NOTE: alpha parameter is not currently been used, here.
-    #       Check possibily of using it as a filter later.
-    def __init__(self, gomap, ontology='BP', alpha=0.01):
+    # NOTE: alpha is the cutOff of the 'elim' algorithm (as the one of
+    #       nativerich.NativeGOrich), it does not filter the results.
+    def __init__(self, gomap, ontology='BP', alpha=0.01, 
+                 algorithms=('elim',), cache=None):
 
         self.mappings = gomap
         self.ontology = ontology
         self.alpha = alpha
+        self.algorithms = list(algorithms)
+        self.cache = cache
 
         topGO = importr('topGO')
         JSONlite = importr('jsonlite')
 
+        # the mapping is read once per process (and shared by the
+        # GOrich instances of the other ontologies), while the topGOdata
+        # object is built on the first list and then only has its
+        # selected genes updated
+        self.id2go = read_mappings(gomap)
+        self.run_list = robjects.r(GO_ENRICHMENT)(self.id2go, ontology,
+                                                  alpha)
+
+        if cache is not None:
+            # what the results depend on, besides the gene set (the GO
+            # graph comes from the GO.db package)
+            self.cache_parts = ("GO", misc.file_digest(gomap), 
+                                package_version('GO.db'), 
+                                package_version('topGO'), ontology,
+                                self.algorithms, 30, alpha)
+
     def perform_go_enrichment(self, targetspath):
 
         """
         Uses the R topGO package to calculate GO term enrichment in suplied
         lists of genes/transcripts of interest, saving results to file.
+        Raises RuntimeError if the enrichment failed in R.
         """
 
-        robjects.globalenv["mappings"] = self.mappings
-        robjects.globalenv["ontology"] = self.ontology
-        robjects.globalenv["alpha"] = self.alpha
+        failures = []
+        outname = perform_go_enrichment_batch([self], [targetspath], 
+                                              failures)[0][0]
+        if failures:
+            raise RuntimeError(failures[0][2])
 
-        read_target_group_of_interest(targetspath)
-        handle_result_saving(targetspath, "goenrich/"+self.ontology)
+        return outname
 
-        robjects.r('''
-        capture.output(id2go <- readMappings(file = mappings), file="/dev/null")
-        transcriptNames <- names(id2go)
 
-        interestingGenes <- factor(as.integer( 
-                        transcriptNames %in% as.character(unlist(targetset)) ), levels=c(0,1) )
-        names(interestingGenes) <- transcriptNames
+    def perform_go_enrichment_batch(self, targetspaths):
 
-        success = FALSE
-        ''')
+        """
+        Calculates the GO term enrichment of several lists of
+        genes/transcripts of interest in a single R call (see
+        enricher.perform_go_enrichment_batch), returning the results
+        paths (None for the lists without any GO term mapped or whose
+        enrichment failed).
+        """
 
-        robjects.r('''
-                      tryCatch(
-                      {
-                      capture.output(
-                        GOdata <- new("topGOdata", ontology = ontology,
-                        allGenes = interestingGenes, annot = annFUN.gene2GO, 
-                        gene2GO = id2go)
-                      , file="/dev/null" )
-                      success <- TRUE
-                      }, 
-                      error = function(e){ 
-                                print( paste(basename, 
-                                "failed to have any GO", ontology, 
-                                "terms mapped to its members!") )
-                                success <- FALSE 
-                                }
-                      )
-                   ''')
-
-        robjects.r('''
-                if (success == TRUE){
-                    capture.output(
-                        resultFisher <- runTest(GOdata, algorithm = "classic",
-                        statistic = "fisher")
-                    , file="/dev/null" )
-
-                    capture.output(
-                        resultFisher.Elim <- runTest(GOdata, algorithm = "elim",
-                        statistic = "fisher")
-                    , file="/dev/null" )
-
-                    enrichRes <- GenTable(GOdata, classicFisher = resultFisher,
-                               elimFisher = resultFisher.Elim, 
-                               orderBy = "elimFisher", ranksOf ="classicFisher",
-                               topNodes = 30)
-
-                    write.table(enrichRes, file = outname, sep = "\t", 
-                                row.names = FALSE, quote = FALSE)
-                }
-                   ''')
+        return perform_go_enrichment_batch([self], targetspaths)[0]
 
 
     def extract_full_annot_mapping(self, genelist, pathout):
@@ -164,15 +170,17 @@ class GOrich(object):
         """
         Extracts list of GO term annotations (ancestors included)
         into a psedo-json (.js w/ 'annotmap' var file.
+
+        Superseded by incidence.GeneTermMatrix.write_annotations, which
+        exports the same mapping without building the topGOdata objects.
         """
 
-        robjects.globalenv["mappings"] = self.mappings
+        robjects.globalenv["id2go"] = self.id2go
 
         robjects.globalenv["targetset"] = robjects.StrVector(genelist)
         robjects.globalenv["pathout"] = pathout
 
         robjects.r('''
-        capture.output(id2go <- readMappings(file = mappings), file="/dev/null")
         transcriptNames <- names(id2go)
 
         interestingGenes <- factor(as.integer( 
@@ -226,12 +234,227 @@ class GOrich(object):
 # accessory py2r helpers
 # ------------------------------------------------------------------------------
 
+# gene-to-GO mappings (R lists) already read, by file path
+_mappings = {}
+
+# R closure over a gene-to-GO mapping, ontology and elim cutoff, returning
+# the function that computes (and saves) the enrichment of one gene list;
+# the topGOdata object is kept in the closure between lists
+GO_ENRICHMENT = '''
+function(id2go, ontology, cutoff){
+
+    transcriptNames <- names(id2go)
+    GOdata <- NULL
+
+    function(targetset, algorithms, outname, basename){
+
+        interestingGenes <- factor(as.integer( 
+                        transcriptNames %in% targetset ), levels=c(0,1) )
+        names(interestingGenes) <- transcriptNames
+
+        mapped <- tryCatch(
+        {
+            capture.output(
+                if (is.null(GOdata)){
+                    GOdata <<- new("topGOdata", ontology = ontology,
+                                   allGenes = interestingGenes, 
+                                   annot = annFUN.gene2GO, gene2GO = id2go)
+                } else {
+                    GOdata <<- updateGenes(GOdata, interestingGenes)
+                }
+            , file="/dev/null" )
+            TRUE
+        },
+        error = function(e){ 
+            print( paste(basename, "failed to have any GO", ontology, 
+                         "terms mapped to its members!") )
+            FALSE
+        })
+
+        if (!mapped) return(list(mapped = FALSE, error = ""))
+
+        # an error only loses the results of this list
+        tryCatch(
+        {
+            capture.output(
+                results <- list(classicFisher = runTest(GOdata, 
+                                    algorithm = "classic", statistic = "fisher"))
+            , file="/dev/null" )
+
+            for (algorithm in algorithms){
+                test <- list(GOdata, algorithm = algorithm, 
+                             statistic = "fisher")
+                if (algorithm == "elim") test$cutOff <- cutoff
+                capture.output(
+                    results[[paste0(algorithm, "Fisher")]] <- do.call(runTest,
+                                                                      test)
+                , file="/dev/null" )
+            }
+
+            enrichRes <- do.call(GenTable, c(list(GOdata), results,
+                       list(orderBy = names(results)[min(2, length(results))],
+                            ranksOf = "classicFisher", topNodes = 30)))
+
+            write.table(enrichRes, file = outname, sep = "\t", 
+                        row.names = FALSE, quote = FALSE)
+
+            list(mapped = TRUE, error = "")
+        },
+        error = function(e){
+            if (file.exists(outname)) file.remove(outname)
+            list(mapped = NA, error = conditionMessage(e))
+        })
+    }
+}
+'''
+
+
+# loops over the enrichment functions (GO_ENRICHMENT) of several
+# ontologies and their gene lists in R, returning which lists had
+# terms mapped (NA if their enrichment failed) and the error messages
+GO_ENRICHMENT_BATCH = '''
+function(runs, targetsets, algorithms, outnames, basenames){
+
+    mapped <- list()
+    errors <- list()
+
+    for (i in seq_along(runs)){
+        mapped[[i]] <- logical(length(targetsets[[i]]))
+        errors[[i]] <- character(length(targetsets[[i]]))
+        for (j in seq_along(targetsets[[i]])){
+            run <- runs[[i]](targetsets[[i]][[j]], algorithms[[i]],
+                             outnames[[i]][j], basenames[[i]][j])
+            mapped[[i]][j] <- run$mapped
+            errors[[i]][j] <- run$error
+        }
+    }
+
+    list(mapped = mapped, errors = errors)
+}
+'''
+
+
+def perform_go_enrichment_batch(gorichs, targetspaths, failures=None):
+
+    """
+    Calculates the GO term enrichment of several lists of
+    genes/transcripts of interest for several GOrich instances (e.g. of
+    each ontology) at once: the lists (not found in the GOrich result
+    caches) are sent to R, tested and saved in a single call. Returns,
+    for each GOrich, the list of the results paths (None for the lists
+    without any GO term mapped).
+
+    A list whose enrichment fails in R only loses its own results (None,
+    and not cached): the failure is appended to the 'failures' list as
+    (targetspath, ontology, error), if given, and printed otherwise.
+    """
+
+    genes = [read_targets(t) for t in targetspaths]
+    basenames = [os.path.splitext(os.path.basename(t))[0] 
+                 for t in targetspaths]
+
+    results, pending = [], []
+    for E in gorichs:
+        outnames = [result_path(t, "goenrich/"+E.ontology) 
+                    for t in targetspaths]
+        todo = []
+        for j, outname in enumerate(outnames):
+            if E.cache is not None:
+                key = E.cache.key(genes[j], *E.cache_parts)
+                cached = E.cache.fetch(key, outname)
+                if cached is not None:
+                    outnames[j] = outname if cached else None
+                    continue
+            else:
+                key = None
+            todo.append((j, key))
+        results.append(outnames)
+        pending.append(todo)
+
+    if not any(pending):
+        return results
+
+    batch = robjects.r(GO_ENRICHMENT_BATCH)(
+                robjects.r['list'](*[E.run_list for E in gorichs]),
+                robjects.r['list'](*[robjects.r['list'](
+                        *[robjects.StrVector(genes[j]) for j, _ in todo])
+                                     for todo in pending]),
+                robjects.r['list'](*[robjects.StrVector(E.algorithms) 
+                                     for E in gorichs]),
+                robjects.r['list'](*[robjects.StrVector(
+                        [results[i][j] for j, _ in todo])
+                                     for i, todo in enumerate(pending)]),
+                robjects.r['list'](*[robjects.StrVector(
+                        [basenames[j] for j, _ in todo])
+                                     for todo in pending]))
+
+    mapped, errors = batch.rx2("mapped"), batch.rx2("errors")
+
+    for i, (E, todo) in enumerate(zip(gorichs, pending)):
+        for (j, key), success, error in zip(todo, mapped[i], errors[i]):
+            if error:
+                if failures is None:
+                    print "%s (%s) failed: %s" % (targetspaths[j], 
+                                                  E.ontology, error)
+                else:
+                    failures.append((targetspaths[j], E.ontology, error))
+                results[i][j] = None
+                continue
+            if not success:
+                results[i][j] = None
+            if E.cache is not None:
+                E.cache.store(key, results[i][j])
+
+    return results
+
+
+def package_version(package):
+
+    """
+    Returns the version of an (installed) R package.
+    """
+
+    return robjects.r('function(p) as.character(packageVersion(p))')(
+                                                                package)[0]
+
+
+def read_mappings(gomap):
+
+    """
+    Reads a gene-to-GO mapping file with topGO's readMappings, once per
+    process, returning it as an R list.
+    """
+
+    if gomap not in _mappings:
+        read = robjects.r('''
+            function(mappings){
+                capture.output(id2go <- readMappings(file = mappings), 
+                               file="/dev/null")
+                id2go
+            }''')
+        _mappings[gomap] = read(gomap)
+
+    return _mappings[gomap]
+
+
 def read_target_group_of_interest(targetspath):
 
     """
     Reads a tsv file, extracts the first column (while assuming they
     are transcript/gene identifiers) and sets them as a vector in R
-    global environament.
+    global environament (also returning it).
+    """
+
+    targetset = robjects.StrVector(read_targets(targetspath))
+    robjects.globalenv["targetset"] = targetset
+
+    return targetset
+
+
+def read_targets(targetspath):
+
+    """
+    Reads the first column (transcript/gene identifiers) of a tsv file.
     """
 
     genes = []
@@ -240,24 +463,38 @@ def read_target_group_of_interest(targetspath):
             token = line.split("\t")
             genes.append(token[0].strip())
 
-    robjects.globalenv["targetset"] = robjects.StrVector(genes)
+    return genes
 
 
 def handle_result_saving(targetspath, enrich):
 
     """
     Creates (if necessary) output folder to save enrichment results
-    and 'returns' full path to the results file being saved.
+    and 'returns' full path to the results file being saved (also as
+    'outname' in R global environment, next to the list 'basename').
     """
 
-    # SAVE IT TO DISK
     basename = os.path.splitext(os.path.basename(targetspath))[0]
-    foldername = os.path.dirname(targetspath)
+    outname = result_path(targetspath, enrich)
 
     robjects.globalenv["basename"] = basename
+    robjects.globalenv["outname"] = outname
+
+    return outname
+
+
+def result_path(targetspath, enrich):
+
+    """
+    Creates (if necessary) output folder to save enrichment results
+    and returns full path to the results file being saved.
+    """
+
+    # SAVE IT TO DISK
+    basename = os.path.splitext(os.path.basename(targetspath))[0]
+    foldername = os.path.dirname(targetspath)
 
     outname = os.path.join(foldername, enrich, basename+"_enrichment.tsv")
-    robjects.globalenv["outname"] = outname
 
     # if not exists, create folder to save enrichment results
     savepath = os.path.join(foldername, enrich)
@@ -265,4 +502,6 @@ def handle_result_saving(targetspath, enrich):
         os.makedirs(savepath)
     except OSError:
         if not os.path.isdir(savepath):
-            raise
\ No newline at end of file
+            raise
+
+    return outname
@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 
 import pandas as pd
-import re, json, pkg_resources
+import re, json, pkg_resources, misc
 
 from jinja2 import Template
 from decimal import *
@@ -13,10 +13,13 @@ pd.options.mode.chained_assignment = None  # default='warn'
 
 class Templater(object):
 
-    def __init__(self, title, annot, org, g2i, links=None):
+    def __init__(self, title, annot, org, g2i, links=None, incidence=None):
 
         self.title = title
         self.annots = annot
+        # gene x GO term matrix (incidence.GeneTermMatrix) the genes of
+        # the enriched terms are taken from, instead of the 'g2i' file
+        self.incidence = incidence
 
         self.svgpaths = {'bp': 'svg/'+title+'_enrichment_BP.svg', 
                          'mf': 'svg/'+title+'_enrichment_MF.svg', 
@@ -42,7 +45,8 @@ class Templater(object):
             self.link2 = '''<a name="{{ id }}" href="#null" alt="{{ id }}">
                             {{ id }}</a>'''
 
-        self.go2ids = self.read_annot_pseudo_json(g2i)
+        if incidence is None:
+            self.go2ids = self.read_annot_pseudo_json(g2i)
 
 
 
@@ -562,7 +566,8 @@ class Templater(object):
         enrichment results for displaying.
         """
 
-        ontslice = enrichRes.loc[enrichRes['elimFisher'] < alpha]
+        score = misc.score_column(enrichRes)
+        ontslice = enrichRes.loc[enrichRes[score] < alpha]
 
         targs = ontslice["GO.ID"].tolist()
         ug = len(self.get_unique_genes(targs))
@@ -581,7 +586,7 @@ class Templater(object):
                 lambda x: '<a href="http://amigo.geneontology.org/amigo/term/'
                 +str(x)+'" target="_blank">'+str(x)+'</a>')
 
-            cols = ['GO.ID', 'Term', 'Annotated', 'Significant', 'elimFisher']
+            cols = ['GO.ID', 'Term', 'Annotated', 'Significant', score]
             restable = ontslice[cols].to_html(index=False, 
                                               classes="etables sortable", 
                                               escape=False)
@@ -604,6 +609,9 @@ class Templater(object):
         genes annotated to those terms.
         """
 
+        if self.incidence is not None:
+            return list(self.incidence.genes_of(go_ids) & set(self.annots))
+
         l = []
         for go in go_ids:
             for x in self.go2ids[go]:
@@ -616,17 +624,17 @@ class Templater(object):
     def read_annot_pseudo_json(self, fpath):
 
         """
-        Reads the created pseudo-json file
-        and returns it as a dictionary
+        Reads the created pseudo-json file (either minified or pretty
+        printed) and returns it as a dictionary
         """
 
         with open(fpath, 'r') as fh:
-            data = fh.readlines()
+            data = fh.read()
 
-        data = [x.strip() for x in data[1:]]
-        outstr = ' '.join(data)
-        outstr = '{'+ outstr
-        td = json.loads(outstr)
+        # strips the 'var annotmap = ' assignment (and any trailing ';')
+        start = data.index('{')
+        end = data.rindex('}') + 1
+        td = json.loads(data[start:end])
 
         return td
 
@@ -0,0 +1,292 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, glob, json, shutil, hashlib, tempfile, misc
+import numpy as np
+import scipy.sparse as sp
+
+from libraries.ontology import GO_ASPECTS, TOPGO_RELATIONS
+
+"""
+The propagated gene x GO term incidence of a gene to GO terms mapping,
+as a scipy.sparse matrix. It is the one parsed form of the mapping,
+shared by the native enrichment (nativerich), the counting of the
+unique genes of enriched terms (hoarder) and the annotations export of
+the reports, and it is cached on disk as memory-mappable .npy arrays.
+"""
+
+# bumped whenever the layout of the cached matrices changes
+MATRIX_VERSION = 1
+
+# ==============================================================================
+
+class GeneTermMatrix(object):
+
+    """
+    Gene (row) x term (column) incidence of a mapping file (in the
+    topGO 'readMappings' format: gene<TAB>GO:x, GO:y, ...), with the
+    terms each gene is annotated to and all their ancestors (following
+    'relations'). Alternative ids are resolved and unknown or obsolete
+    terms are dropped.
+
+    The columns are the positions of the ontology closure, so that the
+    matrix can be used along with it; 'genes' and 'gene_index' intern
+    the row identifiers. The CSR arrays (indptr, indices) of the matrix
+    are the ones cached on disk (see load).
+    """
+
+    def __init__(self, genes, closure, indptr, indices):
+
+        self.genes = genes
+        self.gene_index = dict((g, i) for i, g in enumerate(genes))
+        self.closure = closure
+
+        self.indptr = indptr
+        self.indices = indices
+        self.matrix = sp.csr_matrix((np.ones(len(indices), dtype=np.int32),
+                                     indices, indptr),
+                                    shape=(len(genes), len(closure.objects)),
+                                    copy=False)
+        self._by_term = None
+
+
+    @classmethod
+    def build(cls, gomap, ontology, relations=TOPGO_RELATIONS):
+
+        """
+        Parses and propagates a mapping file.
+        """
+
+        closure = ontology.closure(relations)
+
+        genes, rows = [], []
+        for gene, goes in sorted(read_mappings(gomap).iteritems()):
+            known = set()
+            for go in goes:
+                try:
+                    go = ontology.resolve(go)
+                except ValueError:
+                    continue
+                if go not in ontology.obsolete:
+                    known.add(go)
+
+            genes.append(gene)
+            rows.append(closure.ancestors_of(sorted(known), True))
+
+        sizes = np.array([len(r) for r in rows], dtype=np.int64)
+        indptr = np.zeros(len(rows) + 1, dtype=np.int32)
+        np.cumsum(sizes, out=indptr[1:])
+        if rows:
+            indices = np.concatenate(rows).astype(np.int32)
+        else:
+            indices = np.zeros(0, dtype=np.int32)
+
+        return cls(genes, closure, indptr, indices)
+
+
+    @classmethod
+    def load(cls, gomap, ontology, relations=TOPGO_RELATIONS,
+             cachedir=None):
+
+        """
+        Returns the matrix of a mapping file, reading it (memory-mapped)
+        from its on-disk cache in 'cachedir' if the mapping and ontology
+        did not change since it was built, and building and caching it
+        otherwise. Without a 'cachedir' it is always built.
+        """
+
+        if cachedir is None:
+            return cls.build(gomap, ontology, relations)
+
+        closure = ontology.closure(relations)
+        path = os.path.join(cachedir, "%s-%s" % (os.path.basename(gomap),
+                            cache_key(gomap, closure, relations)))
+
+        if os.path.isdir(path):
+            try:
+                return cls.read(path, closure)
+            except (IOError, ValueError):
+                print "Discarding unreadable incidence cache", path
+                shutil.rmtree(path, ignore_errors=True)
+
+        matrix = cls.build(gomap, ontology, relations)
+        matrix.write(path)
+
+        # drop the caches of older versions of the same mapping file
+        for old in glob.glob(os.path.join(cachedir, "%s-*" %
+                                          os.path.basename(gomap))):
+            if old != path:
+                shutil.rmtree(old, ignore_errors=True)
+
+        return matrix
+
+
+    def write(self, path):
+
+        """
+        Atomically writes the matrix arrays and gene ids to directory
+        'path'.
+        """
+
+        temp = tempfile.mkdtemp(dir=os.path.dirname(path), suffix=".part")
+        try:
+            np.save(os.path.join(temp, "indptr.npy"), self.indptr)
+            np.save(os.path.join(temp, "indices.npy"), self.indices)
+            with open(os.path.join(temp, "genes.json"), "w") as fh:
+                json.dump(self.genes, fh)
+            os.rename(temp, path)
+        except OSError:
+            shutil.rmtree(temp, ignore_errors=True)
+            # written meanwhile by another process
+            if not os.path.isdir(path):
+                raise
+
+
+    @classmethod
+    def read(cls, path, closure):
+
+        """
+        Reads a matrix written by write (its arrays memory-mapped).
+        """
+
+        indptr = np.load(os.path.join(path, "indptr.npy"), mmap_mode="r")
+        indices = np.load(os.path.join(path, "indices.npy"), mmap_mode="r")
+        with open(os.path.join(path, "genes.json")) as fh:
+            genes = [str(g) for g in json.load(fh)]
+
+        if len(indptr) != len(genes) + 1 or indptr[-1] != len(indices):
+            raise ValueError("Inconsistent incidence cache %s" % path)
+
+        return cls(genes, closure, indptr, indices)
+
+
+    def by_term(self):
+
+        """
+        The term x gene (CSC) view of the matrix (built once).
+        """
+
+        if self._by_term is None:
+            self._by_term = self.matrix.tocsc()
+
+        return self._by_term
+
+
+    def genes_of(self, terms):
+
+        """
+        Returns the set of the genes annotated to any of 'terms' (ids).
+        """
+
+        position = self.closure.position
+        columns = [position[t] for t in terms if t in position]
+        if not columns:
+            return set()
+
+        csc = self.by_term()
+        rows = np.concatenate([csc.indices[csc.indptr[c]:csc.indptr[c + 1]]
+                               for c in columns])
+
+        genes = self.genes
+        return set(genes[i] for i in np.unique(rows))
+
+
+    def term_columns(self, aspects=("BP", "MF", "CC")):
+
+        """
+        Returns the (term id, column) of the terms of the given GO aspects
+        annotated to any gene, sorted by term id.
+        """
+
+        namespaces = set(GO_ASPECTS.get(a, a) for a in aspects)
+        id2namespace = self.closure.ontology.id2namespace
+
+        columns = []
+        for c in np.flatnonzero(np.diff(self.by_term().indptr)):
+            term = self.closure.objects[c]
+            if term is not None and id2namespace.get(term.id) in namespaces:
+                columns.append((term.id, c))
+
+        return sorted(columns)
+
+
+    def term_genes(self, aspects=("BP", "MF", "CC")):
+
+        """
+        Returns a dictionary with the (sorted) genes of each term of the
+        given GO aspects annotated to any gene.
+        """
+
+        csc = self.by_term()
+        genes = self.genes
+        mapping = {}
+        for term, c in self.term_columns(aspects):
+            rows = np.sort(csc.indices[csc.indptr[c]:csc.indptr[c + 1]])
+            mapping[term] = [genes[i] for i in rows]
+
+        return mapping
+
+
+    def write_annotations(self, pathout, aspects=("BP", "MF", "CC")):
+
+        """
+        Exports the genes of each annotated GO term (of the given aspects)
+        into a pseudo-json (.js w/ 'annotmap' var) file, as read by the
+        reports. The (minified) object is streamed term by term, in term
+        id order, straight from the term x gene view of the matrix.
+        """
+
+        csc = self.by_term()
+        # gene ids (rows are sorted by id) are quoted once
+        quoted = [json.dumps(g) for g in self.genes]
+
+        with open(pathout, "w") as fh:
+            fh.write("var annotmap = {")
+            for i, (term, c) in enumerate(self.term_columns(aspects)):
+                rows = np.sort(csc.indices[csc.indptr[c]:csc.indptr[c + 1]])
+                fh.write('%s"%s":[%s]' % ("," if i else "", term,
+                                          ",".join([quoted[r] for r in rows])))
+            fh.write("};\n")
+
+        return pathout
+
+
+# accessory helpers
+# ------------------------------------------------------------------------------
+
+def read_mappings(gomap):
+
+    """
+    Reads a gene to GO terms mapping file as topGO's 'readMappings'
+    (gene<TAB>comma separated GO ids) into a dictionary.
+    """
+
+    mappings = {}
+    with open(gomap) as fh:
+        for line in fh:
+            token = line.rstrip("\r\n").split("\t", 1)
+            if not token[0].strip():
+                continue
+            goes = token[1].split(",") if len(token) > 1 else []
+            mappings.setdefault(token[0].strip(), []).extend(
+                                        go.strip() for go in goes if go.strip())
+
+    return mappings
+
+
+def cache_key(gomap, closure, relations):
+
+    """
+    Hash of everything a cached matrix depends on: the mapping file
+    contents, the terms (positions) and relations of the closure (its
+    digest, kept in the ontology snapshots) and the matrix layout
+    version.
+    """
+
+    h = hashlib.sha1()
+    h.update("v%d\0" % MATRIX_VERSION)
+    h.update(misc.file_digest(gomap))
+    h.update("\0%s\0" % "+".join(sorted(relations or ["all"])))
+    h.update(closure.digest())
+
+    return h.hexdigest()
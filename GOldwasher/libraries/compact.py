@@ -0,0 +1,255 @@
+"""
+=====================================================
+Compact OBO Ontology (:mod:`compact`)
+=====================================================
+
+A memory lean variant of :class:`ontology.OBOOntology`. Terms are kept as
+``__slots__`` records (:class:`TermRecord`) addressed by integer indices,
+tag names are interned and the parent/child relations are stored as
+CSR-style adjacency arrays, instead of per-object dictionaries, lists and
+sets. The query API of :class:`ontology.OBOOntology` is preserved ::
+
+    >>> ont = CompactOntology("go-basic.obo")
+    >>> ont.parent_edges("GO:0015979")
+    [('is_a', TermRecord(id='GO:0006091', name=...))]
+
+"""
+
+import numpy as np
+
+from ontology import OBOOntology, OBOObject
+
+
+class TermRecord(object):
+    """
+    A compact, ``__slots__`` based replacement for :class:`OBOObject`.
+
+    The (tag, value, modifiers, comment) tuples are kept in a single
+    tuple and tag names are interned; the per-tag ``values`` mapping
+    of :class:`OBOObject` is only built on request.
+
+    """
+    __slots__ = ("index", "stanza_type", "id", "name", "tag_values")
+
+    def __init__(self, index, stanza_type, tag_values):
+        self.index = index
+        self.stanza_type = intern(stanza_type)
+        self.tag_values = tuple((intern(tag), value, modifiers, comment)
+                                for tag, value, modifiers, comment
+                                in tag_values)
+        self.id = self._first("id")
+        self.name = self._first("name")
+
+    @classmethod
+    def from_object(cls, index, obj):
+        """
+        Create a record from an :class:`OBOObject` (or another record).
+        """
+        return cls(index, obj.stanza_type, obj.tag_values)
+
+    def _first(self, tag):
+        for t, value, _, _ in self.tag_values:
+            if t == tag:
+                return value
+        return None
+
+    @property
+    def is_annonymous(self):
+        return bool(self.get_values("is_annonymous"))
+
+    @property
+    def values(self):
+        """
+        A tag -> list of values mapping (built on each access).
+        """
+        values = {}
+        for tag, value, _, _ in self.tag_values:
+            values.setdefault(tag, []).append(value)
+        return values
+
+    def get_values(self, tag):
+        return [value for t, value, _, _ in self.tag_values if t == tag]
+
+    def tag_count(self):
+        return len(self.tag_values)
+
+    def tags(self):
+        return list(self.tag_values)
+
+    # formatting is shared with OBOObject
+    _format_single_tag = OBOObject._format_single_tag.im_func
+    format_stanza = OBOObject.format_stanza.im_func
+    __str__ = OBOObject.__str__.im_func
+
+    def related_objects(self):
+        """
+        Return a list of (rel_type, id) tuples, as in
+        :func:`OBOObject.related_objects`.
+        """
+        result = [(tag, value) for tag, value, _, _ in self.tag_values
+                  if tag == "is_a"]
+        result += [tuple(value.split(None, 1))
+                   for tag, value, _, _ in self.tag_values
+                   if tag == "relationship"]
+        return result
+
+    def __repr__(self):
+        return ("{0.__name__}(id={1.id!r}, name={1.name}, ...)"
+                .format(type(self), self))
+
+    def __iter__(self):
+        return iter(self.related_objects())
+
+
+class CompactOntology(OBOOntology):
+    """
+    An :class:`OBOOntology` storing its terms as :class:`TermRecord`
+    instances and its relations as CSR adjacency arrays.
+
+    For a term with index ``i`` its parents are
+    ``parent_index[parent_ptr[i]:parent_ptr[i + 1]]`` with relation
+    types ``rel_types[parent_rel[...]]`` (and likewise for children).
+
+    """
+
+    def __init__(self, file=None):
+        self.rel_types = []
+        self._rel_type_index = {}
+        self._empty_csr()
+        OBOOntology.__init__(self, file)
+
+    @classmethod
+    def from_ontology(cls, ontology):
+        """
+        Convert an existing :class:`OBOOntology`.
+        """
+        compact = cls()
+        for obj in ontology.objects[len(cls.BUILTINS):]:
+            compact.add_object(obj)
+        compact.header_tags = list(ontology.header_tags)
+        return compact
+
+    def _empty_csr(self):
+        empty = np.zeros(1, dtype=np.int32)
+        self.parent_ptr = self.child_ptr = empty
+        self.parent_index = self.parent_rel = np.zeros(0, dtype=np.int32)
+        self.child_index = self.child_rel = np.zeros(0, dtype=np.int32)
+
+    def add_object(self, obj):
+        """
+        Add an :class:`OBOObject` (stored as a :class:`TermRecord`).
+        """
+        record = TermRecord.from_object(len(self.objects), obj)
+        OBOOntology.add_object(self, record)
+
+    def update(self, other):
+        """
+        Update this ontology with the terms from `other`.
+        """
+        for term in other:
+            if term.id in self and not term.is_annonymous:
+                old = self.term(term.id)
+                tag_values = old.tag_values + tuple(
+                    tv for tv in term.tag_values if tv[0] != "id")
+                record = TermRecord(old.index, old.stanza_type, tag_values)
+                self.objects[old.index] = record
+                self.id2term[record.id] = record
+                self._index_tags(record.id, tag_values[old.tag_count():])
+            elif term.id not in self:
+                self.add_object(term)
+        self._invalid_cache_flag = True
+
+    def remove_object(self, id):
+        """
+        Remove the object with `id` from this ontology.
+        """
+        OBOOntology.remove_object(self, id)
+        for i, record in enumerate(self.objects):
+            record.index = i
+
+    def _add_relations(self, obj):
+        # the CSR arrays are rebuilt rather than patched
+        self._invalid_cache_flag = True
+
+    def _remove_relations(self, obj):
+        self._invalid_cache_flag = True
+
+    def _rel_type_id(self, rel_type):
+        if rel_type not in self._rel_type_index:
+            self._rel_type_index[rel_type] = len(self.rel_types)
+            self.rel_types.append(intern(rel_type))
+        return self._rel_type_index[rel_type]
+
+    def _cache_relations(self):
+        """
+        (Re)build the CSR parent and child adjacency arrays.
+        """
+        n = len(self.objects)
+        src, dst, rel = [], [], []
+        for record in self.objects:
+            for rel_type, id in record.related_objects():
+                src.append(record.index)
+                dst.append(OBOOntology.term(self, id).index)
+                rel.append(self._rel_type_id(rel_type))
+
+        src = np.array(src, dtype=np.int32)
+        dst = np.array(dst, dtype=np.int32)
+        rel = np.array(rel, dtype=np.int32)
+
+        self.parent_ptr, self.parent_index, self.parent_rel = \
+            _csr(src, dst, rel, n)
+        self.child_ptr, self.child_index, self.child_rel = \
+            _csr(dst, src, rel, n)
+
+        self._closures = {}
+        self._invalid_cache_flag = False
+
+    def term(self, id):
+        """
+        Return the :class:`TermRecord` associated with this id.
+        """
+        if isinstance(id, TermRecord):
+            return id
+        return OBOOntology.term(self, id)
+
+    def _edges(self, ptr, index, rel, i):
+        start, end = ptr[i], ptr[i + 1]
+        objects, rel_types = self.objects, self.rel_types
+        return [(rel_types[r], objects[j]) for r, j in
+                zip(rel[start:end].tolist(), index[start:end].tolist())]
+
+    def related_terms(self, term):
+        """
+        Return a list of (`rel_type`, `term_id`) tuples.
+        """
+        self._cache_validate()
+        return [(rel_type, parent.id) for rel_type, parent
+                in self.parent_edges(term)]
+
+    def parent_edges(self, term):
+        """
+        Return a list of (rel_type, parent_term) tuples.
+        """
+        self._cache_validate()
+        return self._edges(self.parent_ptr, self.parent_index,
+                           self.parent_rel, self.term(term).index)
+
+    def child_edges(self, term):
+        """
+        Return a list of (rel_type, source_term) tuples.
+        """
+        self._cache_validate()
+        return self._edges(self.child_ptr, self.child_index,
+                           self.child_rel, self.term(term).index)
+
+
+def _csr(rows, cols, data, n):
+    """
+    Return (indptr, indices, data) arrays of a CSR layout with `n` rows,
+    keeping the original order of the entries within each row.
+    """
+    order = np.argsort(rows, kind="mergesort")
+    counts = np.bincount(rows, minlength=n)
+    indptr = np.zeros(n + 1, dtype=np.int32)
+    np.cumsum(counts, out=indptr[1:])
+    return indptr, cols[order], data[order]
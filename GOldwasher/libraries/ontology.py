@@ -82,12 +82,34 @@ See the definition of the `.obo file format <http://www.geneontology.org/GO.form
 
 
 import re
+import gzip
+import hashlib
+import json
 import urllib2
 import warnings
 import keyword
 from collections import defaultdict
 from StringIO import StringIO
 
+import numpy as np
+
+
+#: Version of the parsed (in-memory) ontology layout. Increase it whenever
+#: parsing or the attributes kept on :class:`OBOOntology` change, so that
+#: on-disk snapshots written by older versions are not reused.
+PARSER_VERSION = 6
+
+#: Leading bytes of a gzip stream.
+GZIP_MAGIC = "\x1f\x8b"
+
+#: The relations topGO builds its GO graph from.
+TOPGO_RELATIONS = frozenset(["is_a", "part_of"])
+
+#: Short names of the GO namespaces (aspects).
+GO_ASPECTS = {"BP": "biological_process",
+              "MF": "molecular_function",
+              "CC": "cellular_component"}
+
 
 #: These are builtin OBO objects present in any ontology by default.
 BUILTIN_OBO_OBJECTS = [
@@ -502,23 +524,29 @@ class OBOParser(object):
         """
         Parse the file and yield parse events.
 
+        The file is consumed one line at a time, so the raw text of the
+        ontology is never held in memory as a whole.
+
         .. todo List events and values
 
         """
-        data = self.file.read()
-        header = data[: data.index("\n[")]
-        body = data[data.index("\n[") + 1:]
-        for line in header.splitlines():
-            if line.strip():
-                yield "HEADER_TAG", line.split(": ", 1)
-
         current = None
+        header = True
         #  For speed make these functions local
         startswith = str.startswith
         endswith = str.endswith
         parse_tag_value_ = parse_tag_value
 
-        for line in body.splitlines():
+        for line in self.file:
+            line = line.rstrip("\r\n")
+            if header:
+                # the header ends with the first stanza
+                if not startswith(line, "["):
+                    if line.strip():
+                        yield "HEADER_TAG", line.split(": ", 1)
+                    continue
+                header = False
+
             if startswith(line, "[") and endswith(line, "]"):
                 yield "START_STANZA", line.strip("[]")
                 current = line
@@ -555,9 +583,14 @@ class OBOOntology(object):
         self.header_tags = []
         self.id2term = {}
         self.alt2id = {}
+        self.obsolete = {}
+        self.namespaces = {}
+        self.id2namespace = {}
         self._resolved_imports = []
         self._invalid_cache_flag = False
         self._related_to = {}
+        self._pending = {}
+        self._closures = {}
 
         # First load the built in OBO objects
         builtins = StringIO("\n" + "\n\n".join(self.BUILTINS) + "\n")
@@ -574,7 +607,57 @@ class OBOOntology(object):
                              "the ontology" % obj.id)
         self.objects.append(obj)
         self.id2term[obj.id] = obj
-        self._invalid_cache_flag = True
+        self._index_tags(obj.id, obj.tag_values)
+        if not self._invalid_cache_flag:
+            self._add_relations(obj)
+
+    def remove_object(self, id):
+        """
+        Remove the object with `id` from this ontology. Objects relating
+        to it keep their (then dangling) references.
+        """
+        obj = self.term(id)
+        if not self._invalid_cache_flag:
+            self._remove_relations(obj)
+        self.objects.remove(obj)
+        del self.id2term[obj.id]
+        self._unindex_tags(obj.id, obj.tag_values)
+
+    def _index_tags(self, id, tag_values):
+        """
+        Record the alt_id, obsolete/replaced_by and namespace tags of
+        the object `id` in the ontology's lookup tables (once, also when
+        indexed again by :func:`update`).
+        """
+        for tag, value, _, _ in tag_values:
+            if tag == "alt_id":
+                self.alt2id[value] = id
+            elif tag == "namespace":
+                previous = self.id2namespace.get(id)
+                if previous == value:
+                    continue
+                if previous is not None:
+                    self.namespaces[previous].remove(id)
+                self.namespaces.setdefault(value, []).append(id)
+                self.id2namespace[id] = value
+            elif tag == "is_obsolete" and value == "true":
+                self.obsolete.setdefault(id, [])
+            elif tag == "replaced_by":
+                replaced_by = self.obsolete.setdefault(id, [])
+                if value not in replaced_by:
+                    replaced_by.append(value)
+
+    def _unindex_tags(self, id, tag_values):
+        """
+        Reverse of :func:`_index_tags`.
+        """
+        for tag, value, _, _ in tag_values:
+            if tag == "alt_id" and self.alt2id.get(value) == id:
+                del self.alt2id[value]
+            elif tag == "namespace" and id in self.id2namespace:
+                self.namespaces[value].remove(id)
+                del self.id2namespace[id]
+        self.obsolete.pop(id, None)
 
     def add_header_tag(self, tag, value):
         """
@@ -592,8 +675,10 @@ class OBOOntology(object):
             An optional function callback to report on the progress.
 
         """
-        if isinstance(file, basestring):
-            file = open(file, "rb")
+        file = open_obo(file)
+
+        # relation caches are rebuilt (once) after a bulk load
+        self._invalid_cache_flag = True
 
         parser = OBOParser(file)
         current = None
@@ -627,6 +712,54 @@ class OBOOntology(object):
 #                ontology.update(imported)
 #                self._resolved_imports.append(uri)
 
+    def load_parallel(self, filename, processes=None, chunks_per_process=4):
+        """
+        Load terms from a (large) .obo file using a pool of processes.
+
+        The file is split at stanza boundaries into chunks which are
+        parsed in parallel and then added in file order, so `objects`
+        and `id2term` end up as with :func:`load`. Gzip compressed files
+        (which can not be split) are loaded serially.
+
+        :param str filename:
+            Path of the .obo file.
+        :param int processes:
+            Number of worker processes (defaults to the number of CPUs).
+
+        """
+        import multiprocessing
+
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+
+        with open(filename, "rb") as fh:
+            compressed = fh.read(2) == GZIP_MAGIC
+
+        if processes < 2 or compressed:
+            return self.load(filename)
+
+        self._invalid_cache_flag = True
+
+        bounds = _stanza_offsets(filename, processes * chunks_per_process)
+        chunks = [(filename, start, end) for start, end
+                  in zip(bounds[:-1], bounds[1:])]
+
+        pool = multiprocessing.Pool(processes)
+        try:
+            for header, stanzas in pool.imap(_parse_chunk, chunks):
+                for tag, value in header:
+                    self.add_header_tag(tag, value)
+                for stanza_type, tag_values in stanzas:
+                    obj = OBOObject(stanza_type)
+                    obj.add_tags(tag_values)
+                    self.add_object(obj)
+        finally:
+            pool.close()
+            pool.join()
+
+        if [value for tag, value in self.header_tags if tag == "import"]:
+            warnings.warn("Import header tags are not supported")
+
     def dump(self, file):
         # deprecated use write
         self.write(file)
@@ -658,12 +791,103 @@ class OBOOntology(object):
         for term in other:
             if term.id in self:
                 if not term.is_annonymous:
-                    self.term(term.id).update(term)
+                    obj = self.term(term.id)
+                    before = self.related_terms(obj)
+                    obj.update(term)
+                    self._index_tags(term.id, [tv for tv in term.tag_values
+                                               if tv[0] != "id"])
+                    if not self._invalid_cache_flag:
+                        added = self.related_terms(obj)
+                        for edge in before:
+                            added.remove(edge)
+                        for rel_type, id in added:
+                            self._add_relation(obj, rel_type, id)
                 else:  # Do nothing
                     pass
             else:
                 self.add_object(term)
-        self._invalid_cache_flag = True
+
+    def diff(self, other):
+        """
+        Return the :class:`OntologyDiff` leading from this ontology
+        (the older release) to `other` (the newer one).
+        """
+        builtins = set(obj.id for obj in self.objects[:len(self.BUILTINS)])
+
+        def stanzas(ontology):
+            return dict((id, (obj.stanza_type, tuple(obj.tag_values)))
+                        for id, obj in ontology.id2term.iteritems()
+                        if id not in builtins)
+
+        old, new = stanzas(self), stanzas(other)
+
+        diff = OntologyDiff(source=self.data_version(),
+                            target=other.data_version())
+        diff.header = list(other.header_tags)
+        diff.added = sorted(set(new) - set(old))
+        diff.removed = sorted(id for id in set(old) - set(new)
+                              if id not in other.alt2id)
+        diff.merged = dict((id, other.alt2id[id]) for id in old
+                           if id not in new and id in other.alt2id)
+        diff.obsoleted = sorted(set(other.obsolete) - set(self.obsolete))
+        diff.changed = sorted(id for id in set(old) & set(new)
+                              if old[id] != new[id])
+        diff.stanzas = dict((id, new[id]) for id in
+                            diff.added + diff.changed)
+
+        old_edges, new_edges = self._edge_set(), other._edge_set()
+        diff.added_edges = sorted(new_edges - old_edges)
+        diff.removed_edges = sorted(old_edges - new_edges)
+        return diff
+
+    def _edge_set(self):
+        """
+        Return the set of (child_id, rel_type, parent_id) edges with the
+        parents resolved to their primary ids.
+        """
+        edges = set()
+        for obj in self.objects:
+            for rel_type, id in obj.related_objects():
+                if id in self.alt2id:
+                    id = self.alt2id[id]
+                edges.add((obj.id, rel_type, id))
+        return edges
+
+    def apply_delta(self, delta):
+        """
+        Bring this ontology up to the release described by `delta` (an
+        :class:`OntologyDiff` or the path of a delta file written by
+        :func:`OntologyDiff.write`).
+
+        Removed, merged and changed terms are taken out and the changed
+        and added terms (re)inserted, keeping valid relation caches and
+        the closure up to date. Changed terms move to the end of
+        `objects`, otherwise the result matches parsing the new release.
+
+        """
+        if isinstance(delta, basestring):
+            delta = OntologyDiff.read(delta)
+
+        for id in delta.removed + sorted(delta.merged) + delta.changed:
+            if id in self.id2term:
+                self.remove_object(id)
+
+        for id in delta.changed + delta.added:
+            stanza_type, tag_values = delta.stanzas[id]
+            obj = OBOObject(stanza_type)
+            obj.add_tags(tag_values)
+            self.add_object(obj)
+
+        self.header_tags = list(delta.header)
+
+    def data_version(self):
+        """
+        Return the value of the 'data-version' header tag (or None).
+        """
+        for tag, value in self.header_tags:
+            if tag == "data-version":
+                return value
+        return None
 
     def _cache_validate(self, force=False):
         """
@@ -685,8 +909,68 @@ class OBOOntology(object):
                 related_to[term].append((rel_type, obj))
 
         self._related_to = related_to
+        self._pending = {}
+        self._closures = {}
         self._invalid_cache_flag = False
 
+    def _add_relations(self, obj):
+        """
+        Add the relations of a newly added `obj` (and those of objects
+        that referred to it before it was added) to the valid caches.
+        """
+        for closure in self._closures.values():
+            closure.add_term(obj)
+        for rel_type, id in self.related_terms(obj):
+            self._add_relation(obj, rel_type, id)
+        for id in [obj.id] + obj.get_values("alt_id"):
+            for rel_type, child in self._pending.pop(id, []):
+                self._add_relation(child, rel_type, id)
+
+    def _add_relation(self, child, rel_type, id):
+        if id not in self.id2term and id not in self.alt2id:
+            # wait for the object to be added
+            self._pending.setdefault(id, []).append((rel_type, child))
+            return
+        parent = self.term(id)
+        self._related_to.setdefault(parent, []).append((rel_type, child))
+        for closure in self._closures.values():
+            closure.add_edge(child, rel_type, parent)
+
+    def _remove_relations(self, obj):
+        """
+        Remove the relations of `obj` (about to be removed) from the
+        valid caches.
+        """
+        for rel_type, id in self.related_terms(obj):
+            if id in self._pending:
+                self._pending[id].remove((rel_type, obj))
+                if not self._pending[id]:
+                    del self._pending[id]
+                continue
+            parent = self.term(id)
+            self._related_to[parent].remove((rel_type, obj))
+            for closure in self._closures.values():
+                closure.remove_edge(obj, rel_type, parent)
+
+        # whatever still relates to `obj` is dangling from now on
+        for rel_type, child in self._related_to.pop(obj, []):
+            self._pending.setdefault(obj.id, []).append((rel_type, child))
+        for closure in self._closures.values():
+            closure.remove_term(obj)
+
+    def closure(self, relations=None):
+        """
+        Return the :class:`ClosureIndex` of this ontology following
+        `relations` (all relations by default, see :func:`relation_set`).
+        Each closure is built on first use and kept (and updated) until
+        the ontology is modified in bulk.
+        """
+        self._cache_validate()
+        relations = relation_set(relations)
+        if relations not in self._closures:
+            self._closures[relations] = ClosureIndex(self, relations)
+        return self._closures[relations]
+
     def term(self, id):
         """
         Return the :class:`OBOObject` associated with this id.
@@ -705,6 +989,29 @@ class OBOOntology(object):
         elif isinstance(id, OBOObject):
             return id
 
+    def resolve(self, id, replaced=False):
+        """
+        Return the primary id for `id` (which can be an alt_id). With
+        `replaced` an obsolete term with a single replacement is
+        resolved to its 'replaced_by' term.
+
+        """
+        if id not in self.id2term:
+            if id not in self.alt2id:
+                raise ValueError("Unknown term id: %r" % id)
+            id = self.alt2id[id]
+        if replaced and len(self.obsolete.get(id, [])) == 1:
+            id = self.obsolete[id][0]
+        return id
+
+    def namespace_terms(self, namespace):
+        """
+        Return the ids of the terms in `namespace` (either its full name
+        or a GO aspect such as 'BP').
+        """
+        namespace = GO_ASPECTS.get(namespace, namespace)
+        return self.namespaces.get(namespace, [])
+
     def terms(self):
         """
         Return all :class:`Term` instances in the ontology.
@@ -778,31 +1085,19 @@ class OBOOntology(object):
         term = self.term(term)
         return self._related_to.get(term, [])
 
-    def super_terms(self, term):
+    def super_terms(self, term, relations=None):
         """
         Return a set of all super terms of `term` up to the most general one.
         """
-        terms = self.parent_terms(term)
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update(self.parent_terms(term) - visited)
-        return visited
+        closure = self.closure(relations)
+        return set(closure.terms(closure.ancestors(term)))
 
-    def sub_terms(self, term):
+    def sub_terms(self, term, relations=None):
         """
         Return a set of all sub terms for `term`.
         """
-        terms = self.child_terms(term)
-        visited = set()
-        queue = set(terms)
-        while queue:
-            term = queue.pop()
-            visited.add(term)
-            queue.update(self.child_terms(term) - visited)
-        return visited
+        closure = self.closure(relations)
+        return set(closure.terms(closure.descendants(term)))
 
     def child_terms(self, term):
         """
@@ -908,9 +1203,10 @@ class OBOOntology(object):
         network.optimization = None
         return network
 
-    def to_networkx(self, terms=None):
+    def to_networkx(self, terms=None, relations=None):
         """
-        Return a NetworkX graph of this ontology.
+        Return a NetworkX graph of this ontology (following only
+        `relations`, if given).
         """
         import networkx
         graph = networkx.Graph()
@@ -919,26 +1215,26 @@ class OBOOntology(object):
 
         edge_colors = {"is_a": "red"}
 
+        closure = self.closure(relations)
         if terms is None:
             terms = self.terms()
         else:
             terms = [self.term(term) for term in terms]
-            super_terms = [self.super_terms(term) for term in terms]
-            terms = reduce(set.union, super_terms, set(terms))
+            super_terms = closure.terms(closure.ancestors_of(terms))
+            terms = set(terms).union(super_terms)
 
         for term in terms:
             graph.add_node(term.id, name=term.name)
 
         for term in terms:
-            for rel_type, rel_term in self.related_terms(term):
-                rel_term = self.term(rel_term)
+            for rel_type, rel_term in closure.parent_edges(term):
                 if rel_term in terms:
                     graph.add_edge(term.id, rel_term.id, label=rel_type,
                                    color=edge_colors.get(rel_type, "blue"))
 
         return graph
 
-    def to_graphviz(self, terms=None):
+    def to_graphviz(self, terms=None, relations=None):
         """
         Return an pygraphviz.AGraph representation of the ontology.
         If `terms` is not `None` it must be a list of terms in the ontology.
@@ -953,12 +1249,13 @@ class OBOOntology(object):
 
         edge_colors = {"is_a": "red"}
 
+        closure = self.closure(relations)
         if terms is None:
             terms = self.terms()
         else:
             terms = [self.term(term) for term in terms]
-            super_terms = [self.super_terms(term) for term in terms]
-            terms = reduce(set.union, super_terms, set(terms))
+            super_terms = closure.terms(closure.ancestors_of(terms))
+            terms = set(terms).union(super_terms)
 
         for term in terms:
             graph.add_node(term.id, label=term.name)
@@ -968,8 +1265,7 @@ class OBOOntology(object):
             node.attr["rank"] = "max"
 
         for term in terms:
-            for rel_type, rel_term in self.related_terms(term):
-                rel_term = self.term(rel_term)
+            for rel_type, rel_term in closure.parent_edges(term):
                 if rel_term in terms:
                     graph.add_edge(term.id, rel_term.id, label=rel_type,
                                    color=edge_colors.get(rel_type, "blue"))
@@ -977,6 +1273,565 @@ class OBOOntology(object):
         return graph
 
 
+class ClosureIndex(object):
+    """
+    A precomputed transitive closure of the relations of an
+    :class:`OBOOntology`.
+
+    Terms are addressed by their position in ``ontology.objects``. The
+    ancestors and descendants of every term are kept as sorted int32
+    arrays, so single and batch queries cost about the size of their
+    output instead of a graph traversal::
+
+        closure = ontology.closure()
+        closure.ids(closure.ancestors("GO:0019684"))
+
+    With a set of `relations` (e.g. ``is_a`` and ``part_of``) only the
+    relations of those types are followed. Such closures reuse the
+    parsed edges of the closure over all relations, and share its
+    positions.
+
+    """
+    def __init__(self, ontology, relations=None):
+        self.ontology = ontology
+        self.relations = relations
+        self._edges = None
+        self._digest = None
+
+        if relations is None:
+            self.objects = list(ontology.objects)
+            self.position = dict((obj.id, i) for i, obj
+                                 in enumerate(self.objects))
+
+            # direct (rel_type, parent position) edges of each term
+            self.parents = []
+            for obj in self.objects:
+                self.parents.append([(rel_type, self.index_of(id))
+                                     for rel_type, id
+                                     in ontology.related_terms(obj)])
+        else:
+            full = ontology.closure()
+            self.objects = list(full.objects)
+            self.position = dict(full.position)
+            self.parents = [[(rel_type, j) for rel_type, j in edges
+                             if rel_type in relations]
+                            for edges in full.parents]
+
+        self._ancestors = self._close()
+        self._descendant_lists = None
+
+    @property
+    def _descendants(self):
+        # the transpose of the ancestors, built on first use
+        if self._descendant_lists is None:
+            self._descendant_lists = self._transpose(self._ancestors)
+        return self._descendant_lists
+
+    def __getstate__(self):
+        """
+        Pickle the parents and ancestors as flat int32 arrays (the
+        positions are rebuilt from them on load, and the descendants on
+        first use), rather than as one object per term.
+        """
+        state = self._flat_parents()
+        state.update({"ontology": self.ontology,
+                      "relations": self.relations,
+                      "objects": self.objects,
+                      "digest": self.digest(state),
+                      "ancestor_sizes": np.array([len(a) for a
+                                                  in self._ancestors],
+                                                 dtype=np.int32),
+                      "ancestors": np.concatenate(self._ancestors or
+                                        [np.zeros(0, dtype=np.int32)])})
+        return state
+
+    def __setstate__(self, state):
+        self.ontology = state["ontology"]
+        self.relations = state["relations"]
+        self.objects = state["objects"]
+        self.position = dict((obj.id, i) for i, obj
+                             in enumerate(self.objects) if obj is not None)
+        self._edges = None
+        self._digest = state.get("digest")
+
+        types = state["rel_types"]
+        edges = zip([types[r] for r in state["parent_types"].tolist()],
+                    state["parent_positions"].tolist())
+        bounds = np.cumsum(state["parent_sizes"]).tolist()
+        self.parents = [edges[a:b] for a, b in zip([0] + bounds, bounds)]
+
+        sizes = state["ancestor_sizes"]
+        self._ancestors = []
+        if len(sizes):
+            self._ancestors = np.split(state["ancestors"],
+                                       np.cumsum(sizes)[:-1])
+        self._descendant_lists = None
+
+    def _flat_parents(self):
+        # the direct relations as flat arrays (see __getstate__)
+        types = sorted(set(r for edges in self.parents for r, _ in edges))
+        code = dict((r, i) for i, r in enumerate(types))
+        edges = [e for parents in self.parents for e in parents]
+        return {"rel_types": types,
+                "parent_sizes": np.array([len(p) for p in self.parents],
+                                         dtype=np.int32),
+                "parent_types": np.array([code[r] for r, _ in edges],
+                                         dtype=np.int8),
+                "parent_positions": np.array([j for _, j in edges],
+                                             dtype=np.int32)}
+
+    def digest(self, _flat=None):
+        """
+        Return a hash of the terms (by position) and relations of this
+        closure, e.g. to key data laid out by its positions. It is kept
+        (in pickles too) until the closure changes.
+        """
+        if self._digest is None:
+            flat = _flat or self._flat_parents()
+            h = hashlib.sha1()
+            h.update("\n".join(obj.id if obj is not None else ""
+                               for obj in self.objects))
+            h.update("\0%s\0" % " ".join(flat["rel_types"]))
+            for key in ("parent_sizes", "parent_types", "parent_positions"):
+                h.update(flat[key].tostring())
+            self._digest = h.hexdigest()
+        return self._digest
+
+    def _close(self):
+        """
+        Compute the ancestors of every term in topological order (roots
+        first), merging the already known ancestor sets of its parents.
+        """
+        n = len(self.objects)
+        empty = np.zeros(0, dtype=np.int32)
+
+        direct = [sorted(set(j for _, j in edges)) for edges in self.parents]
+        children = [[] for _ in xrange(n)]
+        pending = [len(parents) for parents in direct]
+        for i, parents in enumerate(direct):
+            for j in parents:
+                children[j].append(i)
+
+        ancestors = [None] * n
+        queue = [i for i in xrange(n) if not pending[i]]
+        while queue:
+            i = queue.pop()
+            if direct[i]:
+                arrays = [ancestors[j] for j in direct[i]]
+                arrays.append(np.array(direct[i], dtype=np.int32))
+                ancestors[i] = np.unique(np.concatenate(arrays))
+            else:
+                ancestors[i] = empty
+            for c in children[i]:
+                pending[c] -= 1
+                if not pending[c]:
+                    queue.append(c)
+
+        # terms within (or below) a cycle are walked explicitly
+        for i in xrange(n):
+            if ancestors[i] is None:
+                ancestors[i] = self._walk(i, direct)
+
+        return ancestors
+
+    def _walk(self, i, direct):
+        visited = set()
+        queue = list(direct[i])
+        while queue:
+            j = queue.pop()
+            if j not in visited:
+                visited.add(j)
+                queue.extend(direct[j])
+        return np.array(sorted(visited), dtype=np.int32)
+
+    def _transpose(self, ancestors):
+        n = len(ancestors)
+        if not n:
+            return []
+        sizes = [len(a) for a in ancestors]
+        rows = np.repeat(np.arange(n, dtype=np.int32), sizes)
+        cols = np.concatenate(ancestors).astype(np.int32)
+        order = np.argsort(cols, kind="mergesort")
+        bounds = np.cumsum(np.bincount(cols, minlength=n))
+        return np.split(rows[order], bounds[:-1])
+
+    def add_term(self, obj):
+        """
+        Append the (yet unrelated) object `obj` and return its position.
+        """
+        i = len(self.objects)
+        self.objects.append(obj)
+        self.position[obj.id] = i
+        self.parents.append([])
+        self._ancestors.append(np.zeros(0, dtype=np.int32))
+        self._descendants.append(np.zeros(0, dtype=np.int32))
+        self._digest = None
+        return i
+
+    def follows(self, rel_type):
+        """
+        Is the relation type `rel_type` part of this closure?
+        """
+        return self.relations is None or rel_type in self.relations
+
+    def add_edge(self, child, rel_type, parent):
+        """
+        Add a `child` -> `parent` relation, extending the ancestors of
+        `child` and its sub terms and the descendants of `parent` and
+        its super terms.
+        """
+        if not self.follows(rel_type):
+            return
+        c, p = self.index_of(child), self.index_of(parent)
+        self.parents[c].append((rel_type, p))
+        self._edges = None
+        self._digest = None
+
+        above = _merge(self._ancestors[p], [p])
+        below = _merge(self._descendants[c], [c])
+        for x in below:
+            self._ancestors[x] = _merge(self._ancestors[x], above)
+        for y in above:
+            self._descendants[y] = _merge(self._descendants[y], below)
+
+    def remove_edge(self, child, rel_type, parent):
+        """
+        Remove a `child` -> `parent` relation, recomputing the closure
+        of `child` and its sub terms.
+        """
+        if not self.follows(rel_type):
+            return
+        c, p = self.index_of(child), self.index_of(parent)
+        self.parents[c].remove((rel_type, p))
+        self._edges = None
+        self._digest = None
+        self._refresh(c)
+
+    def remove_term(self, obj):
+        """
+        Remove `obj` (and all relations to it) from the index. Its
+        position is left empty, so other positions remain valid.
+        """
+        i = self.index_of(obj)
+        children = [x for x in self._descendants[i].tolist()
+                    if any(j == i for _, j in self.parents[x])]
+        for x in children:
+            self.parents[x] = [(r, j) for r, j in self.parents[x] if j != i]
+        self._edges = None
+        self._digest = None
+        for x in children:
+            self._refresh(x)
+        for rel_type, j in list(self.parents[i]):
+            self.remove_edge(obj, rel_type, self.objects[j])
+
+        del self.position[self.objects[i].id]
+        self.objects[i] = None
+
+    def _refresh(self, c):
+        """
+        Recompute the ancestors of `c` and of its sub terms (after their
+        parents changed) and the descendants of every affected term.
+        """
+        below = [c] + self._descendants[c].tolist()
+        affected = set(below)
+        before = [self._ancestors[x] for x in below]
+
+        direct = dict((x, sorted(set(j for _, j in self.parents[x])))
+                      for x in below)
+        children = defaultdict(list)
+        pending = dict((x, 0) for x in below)
+        for x in below:
+            for j in direct[x]:
+                if j in affected:
+                    children[j].append(x)
+                    pending[x] += 1
+
+        done = set()
+        queue = [x for x in below if not pending[x]]
+        while queue:
+            x = queue.pop()
+            arrays = [self._ancestors[j] for j in direct[x]]
+            arrays.append(np.array(direct[x], dtype=np.int32))
+            self._ancestors[x] = _merge(*arrays)
+            done.add(x)
+            for y in children[x]:
+                pending[y] -= 1
+                if not pending[y]:
+                    queue.append(y)
+
+        if len(done) < len(below):
+            full = [sorted(set(j for _, j in edges)) for edges in self.parents]
+            for x in affected - done:
+                self._ancestors[x] = self._walk(x, full)
+
+        gained = defaultdict(list)
+        for x in below:
+            for y in self._ancestors[x].tolist():
+                gained[y].append(x)
+
+        below = np.array(sorted(affected), dtype=np.int32)
+        after = [self._ancestors[x] for x in affected]
+        for y in _merge(*(before + after)).tolist():
+            kept = np.setdiff1d(self._descendants[y], below,
+                                assume_unique=True)
+            self._descendants[y] = _merge(kept, gained.get(y, []))
+
+    def index_of(self, term):
+        """
+        Return the position of `term` (an id, alt_id or object).
+        """
+        if isinstance(term, basestring):
+            term = self.ontology.term(term)
+        return self.position[term.id]
+
+    def ancestors(self, term):
+        """
+        Return the (sorted) positions of all super terms of `term`.
+        """
+        return self._ancestors[self.index_of(term)]
+
+    def descendants(self, term):
+        """
+        Return the (sorted) positions of all sub terms of `term`.
+        """
+        return self._descendants[self.index_of(term)]
+
+    def _union(self, table, terms, include_self):
+        positions = [self.index_of(term) for term in terms]
+        arrays = [table[i] for i in positions]
+        if include_self:
+            arrays.append(np.array(positions, dtype=np.int32))
+        if not arrays:
+            return np.zeros(0, dtype=np.int32)
+        return np.unique(np.concatenate(arrays))
+
+    def ancestors_of(self, terms, include_self=False):
+        """
+        Return the (sorted) positions of the union of all super terms
+        of `terms` (and of `terms` themselves if `include_self`).
+        """
+        return self._union(self._ancestors, terms, include_self)
+
+    def descendants_of(self, terms, include_self=False):
+        """
+        Return the (sorted) positions of the union of all sub terms
+        of `terms` (and of `terms` themselves if `include_self`).
+        """
+        return self._union(self._descendants, terms, include_self)
+
+    def propagate(self, annotations):
+        """
+        Propagate a list of annotated term ids up the ontology, i.e.
+        return the ids of those terms and of all their super terms.
+        Unknown ids are ignored.
+        """
+        known = [id for id in annotations
+                 if id in self.position or id in self.ontology.alt2id]
+        return self.ids(self.ancestors_of(known, include_self=True))
+
+    def parent_edges(self, term):
+        """
+        Return a list of direct (rel_type, parent_term) tuples.
+        """
+        return [(rel_type, self.objects[j]) for rel_type, j
+                in self.parents[self.index_of(term)]]
+
+    def levels(self):
+        """
+        Return the level of every position, i.e. the length of the
+        longest path from it up to a root (level 0), as topGO's
+        'buildLevels'.
+        """
+        # a term has more ancestors than any of its ancestors, so this
+        # is a topological (roots first) order
+        sizes = np.array([len(a) for a in self._ancestors])
+        levels = np.zeros(len(self.objects), dtype=np.int32)
+        for i in np.argsort(sizes, kind="mergesort").tolist():
+            if self.parents[i]:
+                levels[i] = 1 + max(levels[j] for _, j in self.parents[i])
+        return levels
+
+    def edges(self, rel_type):
+        """
+        Return the (child positions, parent positions) int32 arrays of
+        the direct `rel_type` relations.
+        """
+        if self._edges is None:
+            pairs = defaultdict(list)
+            for c, edges in enumerate(self.parents):
+                for r, p in edges:
+                    pairs[r].append((c, p))
+            self._edges = dict(
+                (r, tuple(np.array(pairs[r], dtype=np.int32).T))
+                for r in pairs)
+        empty = np.zeros(0, dtype=np.int32)
+        return self._edges.get(rel_type, (empty, empty))
+
+    def edge_types(self):
+        """
+        Return the (sorted) relation types present in this closure.
+        """
+        self.edges(None)
+        return sorted(self._edges)
+
+    def terms(self, positions):
+        """
+        Return the term objects at `positions`.
+        """
+        objects = self.objects
+        return [objects[i] for i in positions]
+
+    def ids(self, positions):
+        """
+        Return the ids of the terms at `positions`.
+        """
+        objects = self.objects
+        return [objects[i].id for i in positions]
+
+
+class OntologyDiff(object):
+    """
+    The differences between two releases of an ontology, as returned by
+    :func:`OBOOntology.diff`.
+
+    `added`, `removed`, `obsoleted` and `changed` are sorted lists of
+    term ids, `merged` maps the ids of merged terms to the term they are
+    now an alt_id of and `added_edges`/`removed_edges` are lists of
+    (child_id, rel_type, parent_id) tuples. The new (stanza_type,
+    tag_values) of the added and changed terms are kept in `stanzas`,
+    so that a diff written to a (JSON) delta file can be applied to the
+    older release with :func:`OBOOntology.apply_delta`.
+
+    `source` and `target` identify the two releases (by default their
+    'data-version' header values).
+
+    """
+    FORMAT_VERSION = 1
+
+    def __init__(self, source=None, target=None):
+        self.source = source
+        self.target = target
+        self.header = []
+        self.added = []
+        self.removed = []
+        self.obsoleted = []
+        self.changed = []
+        self.merged = {}
+        self.added_edges = []
+        self.removed_edges = []
+        self.stanzas = {}
+
+    def __nonzero__(self):
+        return bool(self.added or self.removed or self.merged or
+                    self.changed)
+
+    def changed_edge_terms(self):
+        """
+        Return the (children, parents) ids of the added and removed edges.
+        """
+        edges = self.added_edges + self.removed_edges
+        return (sorted(set(child for child, _, _ in edges)),
+                sorted(set(parent for _, _, parent in edges)))
+
+    def affected_terms(self, ontology, annotations=True):
+        """
+        Return the set of term ids of the newer release `ontology` whose
+        data or ancestors (and, with `annotations`, whose propagated
+        annotations) differ from the older release, together with all
+        removed and merged ids.
+
+        Every descendant of a term with changed parents has a different
+        set of ancestors, and every ancestor of a term with changed
+        children has a different set of (propagated) annotations.
+
+        """
+        affected = set(self.added + self.removed + self.obsoleted +
+                       self.changed)
+        affected.update(self.merged)
+        affected.update(self.merged.values())
+
+        children, parents = self.changed_edge_terms()
+        affected.update(children)
+
+        closure = ontology.closure()
+        known = lambda ids: [id for id in ids if id in closure.position]
+        affected.update(closure.ids(
+            closure.descendants_of(known(children), include_self=True)))
+        if annotations:
+            affected.update(closure.ids(
+                closure.ancestors_of(known(parents), include_self=True)))
+        return affected
+
+    def summary(self):
+        """
+        Return a short, human readable summary (a list of lines).
+        """
+        return ["%s -> %s" % (self.source, self.target),
+                "  added terms:     %d" % len(self.added),
+                "  removed terms:   %d" % len(self.removed),
+                "  obsoleted terms: %d" % len(self.obsoleted),
+                "  merged terms:    %d" % len(self.merged),
+                "  changed terms:   %d" % len(self.changed),
+                "  added edges:     %d" % len(self.added_edges),
+                "  removed edges:   %d" % len(self.removed_edges)]
+
+    def write(self, file):
+        """
+        Write the diff as a (JSON) delta file.
+        """
+        data = dict(self.__dict__, format=self.FORMAT_VERSION)
+        if isinstance(file, basestring):
+            with open(file, "wb") as fh:
+                json.dump(data, fh, sort_keys=True, indent=1)
+        else:
+            json.dump(data, file, sort_keys=True, indent=1)
+
+    @classmethod
+    def read(cls, file):
+        """
+        Read a delta file written by :func:`write`.
+        """
+        if isinstance(file, basestring):
+            with open(file, "rb") as fh:
+                data = _utf8(json.load(fh))
+        else:
+            data = _utf8(json.load(file))
+        if data.pop("format", None) != cls.FORMAT_VERSION:
+            raise ValueError("Unsupported delta file format")
+
+        diff = cls(data["source"], data["target"])
+        diff.header = [tuple(tv) for tv in data["header"]]
+        for key in ["added", "removed", "obsoleted", "changed"]:
+            setattr(diff, key, data[key])
+        diff.merged = data["merged"]
+        diff.added_edges = [tuple(e) for e in data["added_edges"]]
+        diff.removed_edges = [tuple(e) for e in data["removed_edges"]]
+        diff.stanzas = dict(
+            (id, (stanza_type, tuple(tuple(tv) for tv in tag_values)))
+            for id, (stanza_type, tag_values) in data["stanzas"].items())
+        return diff
+
+
+def relation_set(relations):
+    """
+    Normalize a relation set given as None (all relations), as a '+'
+    separated string (e.g. ``"is_a+part_of"``, ``"all"`` for all
+    relations) or as an iterable of relation type ids to a frozenset
+    (or None).
+
+    >>> sorted(relation_set("is_a+part_of"))
+    ['is_a', 'part_of']
+
+    """
+    if relations is None:
+        return None
+    if isinstance(relations, basestring):
+        relations = [r.strip() for r in relations.split("+")]
+        if relations == ["all"]:
+            return None
+    return frozenset(r for r in relations if r)
+
+
 def name_mangle(tag):
     """
     Mangle tag name if it conflicts with python keyword.
@@ -1001,6 +1856,107 @@ def name_demangle(tag):
         return tag
 
 
+def open_obo(file):
+    """
+    Return a file-like object for `file` (a filename or an open file)
+    transparently decompressing gzip compressed .obo files.
+
+    """
+    if isinstance(file, basestring):
+        file = open(file, "rb")
+
+    if hasattr(file, "seek") and hasattr(file, "tell"):
+        start = file.tell()
+        magic = file.read(2)
+        file.seek(start)
+        if magic == GZIP_MAGIC:
+            file = gzip.GzipFile(fileobj=file, mode="rb")
+
+    return file
+
+
+def _utf8(data):
+    """
+    Recursively encode the unicode strings (as returned by json) in
+    `data` as utf-8 byte strings, like the ones read by the parser.
+    """
+    if isinstance(data, unicode):
+        return data.encode("utf-8")
+    elif isinstance(data, list):
+        return [_utf8(item) for item in data]
+    elif isinstance(data, dict):
+        return dict((_utf8(k), _utf8(v)) for k, v in data.iteritems())
+    return data
+
+
+def _merge(*arrays):
+    """
+    Return the sorted int32 union of (int) arrays.
+    """
+    arrays = [np.asarray(a, dtype=np.int32) for a in arrays]
+    if not arrays:
+        return np.zeros(0, dtype=np.int32)
+    return np.unique(np.concatenate(arrays)).astype(np.int32)
+
+
+def _stanza_offsets(filename, nchunks, blocksize=1 << 16):
+    """
+    Return the sorted byte offsets splitting `filename` in (at most)
+    `nchunks` chunks, each new chunk starting at a stanza ("\\n[").
+    """
+    import os
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, "rb") as fh:
+        for k in range(1, nchunks):
+            pos = max(size * k // nchunks, offsets[-1])
+            fh.seek(pos)
+            tail = ""
+            while True:
+                block = fh.read(blocksize)
+                if not block:
+                    pos = size
+                    break
+                data = tail + block
+                i = data.find("\n[")
+                if i != -1:
+                    pos += i - len(tail) + 1
+                    break
+                pos += len(block)
+                tail = data[-1:]
+            if pos > offsets[-1]:
+                offsets.append(pos)
+    if offsets[-1] < size:
+        offsets.append(size)
+    return offsets
+
+
+def _parse_chunk(chunk):
+    """
+    Parse the bytes [start, end) of an .obo file, returning its header
+    tags and a list of (stanza_type, tag_values) for its stanzas.
+    """
+    filename, start, end = chunk
+    with open(filename, "rb") as fh:
+        fh.seek(start)
+        data = fh.read(end - start)
+
+    header, stanzas = [], []
+    current = None
+    for event, value in OBOParser(StringIO(data)):
+        if event == "TAG_VALUE":
+            current[1].append(value)
+        elif event == "START_STANZA":
+            current = (value, [])
+        elif event == "CLOSE_STANZA":
+            if current is not None:
+                stanzas.append(current)
+            current = None
+        elif event == "HEADER_TAG":
+            header.append(tuple(value))
+    return header, stanzas
+
+
 def load(file):
     """
     Load an ontology from a .obo file.
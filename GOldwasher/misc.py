@@ -1,7 +1,7 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import os, re, json
+import os, re, json, hashlib
 import pandas as pd
 
 pd.set_option('display.max_colwidth', -1)
@@ -126,9 +126,7 @@ class Slicer(object):
 
         try:
             if ont != 'KEGG Pathways':
-                df = pd.read_csv(tsvpath, sep='\t',
-                    converters={'elimFisher': lambda x: parse_ev(x)})
-                df[['elimFisher']] = df[['elimFisher']].apply(pd.to_numeric)
+                df = parse_pvalue_columns(pd.read_csv(tsvpath, sep='\t'))
             else:
                 df = pd.read_csv(tsvpath, sep='\t', 
                                     converters={'KEGGID': lambda x: str(x)})
@@ -169,6 +167,81 @@ class Slicer(object):
 
 
 
+def cache_dir(kind, base=None):
+
+    '''
+    Returns (creating it, if necessary) the directory where on-disk
+    caches of a given kind are kept. Unless a base directory is given
+    it defaults to $GOLDWASHER_CACHE or ~/.cache/goldwasher.
+    '''
+
+    if base is None:
+        base = os.environ.get('GOLDWASHER_CACHE',
+                    os.path.join(os.path.expanduser('~'), '.cache', 'goldwasher'))
+
+    path = os.path.join(base, kind)
+    try:
+        os.makedirs(path)
+    except OSError:
+        if not os.path.isdir(path):
+            raise
+
+    return path
+
+
+def file_digest(path, blocksize=1 << 20):
+
+    '''
+    Returns the sha1 hex digest of a file's contents.
+    '''
+
+    h = hashlib.sha1()
+    with open(path, 'rb') as fh:
+        for block in iter(lambda: fh.read(blocksize), b''):
+            h.update(block)
+
+    return h.hexdigest()
+
+
+def score_column(df):
+
+    '''
+    Returns the name of the p-value column GO enrichment results are
+    filtered on: the first decorrelated one ('elimFisher',
+    'weight01Fisher', ...), or else 'classicFisher'.
+    '''
+
+    scores = [col for col in pvalue_columns(df) if col != 'classicFisher']
+    if scores:
+        return scores[0]
+    else:
+        return 'classicFisher'
+
+
+def parse_pvalue_columns(df):
+
+    '''
+    Converts the p-value ('*Fisher') columns of GO enrichment results
+    to numbers (see parse_ev).
+    '''
+
+    for col in pvalue_columns(df):
+        df[col] = pd.to_numeric(df[col].astype(str).map(parse_ev))
+
+    return df
+
+
+def pvalue_columns(df):
+
+    '''
+    Returns the names of the p-value columns ('classicFisher',
+    'elimFisher', ...) of GO enrichment results, in order.
+    '''
+
+    return [col for col in df.columns 
+            if col.endswith('Fisher') and ' ' not in col]
+
+
 def parse_ev(val):
 
     '''
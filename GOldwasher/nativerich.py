@@ -0,0 +1,1042 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import numpy as np
+import scipy.sparse as sp
+from scipy.special import gammaln
+
+from libraries.ontology import GO_ASPECTS, TOPGO_RELATIONS
+from incidence import GeneTermMatrix
+
+"""
+A native (NumPy/SciPy) replacement for the topGO based GO term
+enrichment of enricher.GOrich. The gene to GO term mappings are read
+and propagated up the ontology once and the Fisher's exact tests of all
+the terms of a gene list are computed in a single vectorized pass (one
+pass per DAG level for the 'elim' algorithm); many lists are tested
+together, as a sparse product of their selection matrix by the gene x
+term incidence. The results are written as the same GenTable-like tsv
+files.
+"""
+
+# number of set bits of every byte value
+POPCOUNT = np.array([bin(i).count("1") for i in xrange(256)], dtype=np.int32)
+
+# ==============================================================================
+
+class GeneAnnotations(object):
+
+    """
+    The propagated gene x GO term incidence of a mapping file (in the
+    topGO 'readMappings' format: gene<TAB>GO:x, GO:y, ...), as loaded by
+    incidence.GeneTermMatrix (from its on-disk cache in 'cachedir', if
+    given).
+
+    The annotations of gene i (the terms it is annotated to plus all
+    their ancestors, following 'relations') are the closure positions
+    indices[indptr[i]:indptr[i+1]]. Alternative ids are resolved and
+    unknown or obsolete terms are dropped.
+    """
+
+    def __init__(self, gomap, ontology, relations=TOPGO_RELATIONS,
+                 cachedir=None):
+
+        self.mappings = gomap
+        self.ontology = ontology
+
+        self.matrix = GeneTermMatrix.load(gomap, ontology, relations,
+                                          cachedir)
+        self.closure = self.matrix.closure
+        self.genes = self.matrix.genes
+        self.gene_index = self.matrix.gene_index
+        self.indptr = self.matrix.indptr
+        self.indices = self.matrix.indices
+
+        # gene (row) of each entry
+        self.rows = np.repeat(np.arange(len(self.genes), dtype=np.int32),
+                              np.diff(self.indptr))
+
+        self.nterms = len(self.closure.objects)
+        self.totals = np.bincount(self.indices, minlength=self.nterms)
+        self.levels = self.closure.levels()
+
+
+    def aspect_mask(self, aspect):
+
+        """
+        Boolean mask of the terms (closure positions) of a GO aspect.
+        """
+
+        namespace = GO_ASPECTS.get(aspect, aspect)
+        id2namespace = self.ontology.id2namespace
+
+        return np.array([obj is not None and
+                         id2namespace.get(obj.id) == namespace
+                         for obj in self.closure.objects], dtype=bool)
+
+
+    def feasible(self, mask):
+
+        """
+        Boolean mask of the genes annotated to any of the masked terms.
+        """
+
+        hits = np.bincount(self.rows[mask[self.indices]],
+                           minlength=len(self.genes))
+
+        return hits > 0
+
+
+    def gene_positions(self, genes):
+
+        """
+        Row indices of the (mapped) genes of a list.
+        """
+
+        index = self.gene_index
+        return np.array(sorted(set(index[g] for g in genes if g in index)),
+                        dtype=np.int64)
+
+
+    def counts(self, positions):
+
+        """
+        Number of genes (rows) at 'positions' annotated to each term.
+        """
+
+        if not len(positions):
+            return np.zeros(self.nterms, dtype=np.int64)
+
+        starts, ends = self.indptr[positions], self.indptr[positions + 1]
+        # indices of all entries of the selected rows, gathered at once
+        sizes = ends - starts
+        offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+        entries = offsets + np.arange(sizes.sum())
+
+        return np.bincount(self.indices[entries], minlength=self.nterms)
+
+
+# ==============================================================================
+
+class NativeGOrich(object):
+
+    """
+    Fisher's exact test GO term enrichment of gene lists for one GO
+    aspect, with topGO's 'classic', 'elim' and 'parentchild' algorithms
+    (as in its runTest(algorithm=..., statistic="fisher")).
+
+    The gene universe are the genes annotated to any term of the aspect
+    and the terms tested are those with at least one annotated gene.
+    Their annotated genes are kept as bitsets (one bit per gene of the
+    universe), which all the algorithms share with the DAG levels; the
+    data of a gene list is likewise prepared once for all algorithms.
+
+    The results tables rank the terms by the first of 'algorithms' (or
+    else by the classic p-values); 'alpha' is the elim cutoff (as the
+    runTest cutOff of GOrich).
+
+    NOTE: 'weight01' (see weight01_fisher) is left out of the ALGORITHMS
+    that can be asked for until its p-values are validated against R.
+    """
+
+    ALGORITHMS = ('elim', 'parentchild')
+
+    def __init__(self, annotations, ontology='BP', alpha=0.01, topnodes=30,
+                 algorithms=('elim',)):
+
+        check_algorithms(algorithms, self.ALGORITHMS)
+
+        self.annotations = annotations
+        self.ontology = ontology
+        self.alpha = alpha
+        self.topnodes = topnodes
+        self.algorithms = list(algorithms)
+
+        A = annotations
+
+        self.mask = A.aspect_mask(ontology)
+        self.universe = A.feasible(self.mask)
+        self.annotated = np.where(self.mask, A.totals, 0)
+        self.terms = np.flatnonzero(self.annotated)
+
+        # tested term (row) and universe gene (bit) indices
+        self.term_index = np.full(A.nterms, -1, dtype=np.int64)
+        self.term_index[self.terms] = np.arange(len(self.terms))
+        self.gene_bit = np.full(len(A.genes), -1, dtype=np.int64)
+        self.gene_bit[self.universe] = np.arange(self.universe.sum())
+        self.nbits = int(self.universe.sum())
+
+        keep = self.mask[A.indices] & self.universe[A.rows]
+        self.members = bitsets(self.term_index[A.indices[keep]],
+                               self.gene_bit[A.rows[keep]],
+                               len(self.terms), self.nbits)
+
+        # tested ancestors of each tested term (CSR) and DAG levels
+        closure = A.closure
+        ancestors = [self.term_index[closure.ancestors(closure.objects[t])]
+                     for t in self.terms]
+        ancestors = [a[a >= 0] for a in ancestors]
+        self.anc_ptr = np.zeros(len(self.terms) + 1, dtype=np.int64)
+        np.cumsum([len(a) for a in ancestors], out=self.anc_ptr[1:])
+        self.anc_index = np.concatenate(ancestors + [np.zeros(0, np.int64)])
+        self.levels = A.levels[self.terms]
+
+        # direct (child, parent) edges between tested terms
+        child, parent = [], []
+        for i, t in enumerate(self.terms):
+            for _, p in closure.parents[t]:
+                if self.term_index[p] >= 0:
+                    child.append(i)
+                    parent.append(self.term_index[p])
+        self.edge_child = np.array(child, dtype=np.int64)
+        self.edge_parent = np.array(parent, dtype=np.int64)
+
+        self._parent_union = None
+        self._incidence = None
+
+
+    def classic_fisher(self, genes):
+
+        """
+        Returns the (significant, expected, p-value) arrays for the
+        tested terms, given the list of genes of interest.
+        """
+
+        A = self.annotations
+
+        positions = A.gene_positions(genes)
+        positions = positions[self.universe[positions]]
+
+        N = int(self.universe.sum())
+        n = len(positions)
+        K = self.annotated[self.terms]
+        k = A.counts(positions)[self.terms]
+
+        expected = K * float(n) / N
+        pvalues = upper_tail(k, N, K, n)
+
+        return k, expected, pvalues
+
+
+    def significant_bits(self, genes):
+
+        """
+        Returns the bitset of the genes of interest in the universe.
+        """
+
+        positions = self.annotations.gene_positions(genes)
+        bits = self.gene_bit[positions]
+        bits = bits[bits >= 0]
+
+        return bitsets(np.zeros(len(bits), dtype=np.int64), bits,
+                       1, self.nbits)[0], len(bits)
+
+
+    def incidence(self):
+
+        """
+        Returns (built once) the universe genes x tested terms incidence
+        as a sparse matrix.
+        """
+
+        if self._incidence is None:
+            A = self.annotations
+            keep = self.mask[A.indices] & self.universe[A.rows]
+            self._incidence = sp.csr_matrix(
+                        (np.ones(keep.sum(), dtype=np.int32),
+                         (self.gene_bit[A.rows[keep]],
+                          self.term_index[A.indices[keep]])),
+                        shape=(self.nbits, len(self.terms)))
+
+        return self._incidence
+
+
+    def selection(self, gene_lists):
+
+        """
+        Returns the lists x universe genes selection matrix (sparse) of
+        several gene lists and their numbers of genes in the universe.
+        """
+
+        rows, cols = [], []
+        for i, genes in enumerate(gene_lists):
+            bits = self.gene_bit[self.annotations.gene_positions(genes)]
+            bits = bits[bits >= 0]
+            rows.append(np.full(len(bits), i, dtype=np.int64))
+            cols.append(bits)
+
+        rows = np.concatenate(rows + [np.zeros(0, np.int64)])
+        cols = np.concatenate(cols + [np.zeros(0, np.int64)])
+
+        selection = sp.csr_matrix((np.ones(len(rows), dtype=np.int32),
+                                   (rows, cols)),
+                                  shape=(len(gene_lists), self.nbits))
+
+        return selection, np.bincount(rows, minlength=len(gene_lists))
+
+
+    def classic_fisher_lists(self, gene_lists):
+
+        """
+        Returns the (significant, expected, p-value) arrays (lists x
+        tested terms) of several gene lists at once: the significant
+        counts of all the (list, term) pairs are a single product of
+        their selection matrix by the incidence, and all the p-values
+        are computed together.
+        """
+
+        selection, n = self.selection(gene_lists)
+
+        N = self.nbits
+        K = self.annotated[self.terms]
+        k = (selection * self.incidence()).toarray()
+
+        expected = np.outer(n, K) / float(N)
+        pvalues = upper_tail(k.ravel(), N, np.tile(K, len(n)),
+                             np.repeat(n, len(K))).reshape(k.shape)
+
+        return k, expected, pvalues
+
+
+    def prepare(self, genes, classic=None):
+
+        """
+        Returns the data of a gene list shared by all the algorithms:
+        the bitset and number of its genes in the universe and its
+        classic (significant, expected, p-value) arrays (computed,
+        unless given).
+        """
+
+        sig, n = self.significant_bits(genes)
+        if classic is None:
+            classic = self.classic_fisher(genes)
+        k, expected, classic = classic
+
+        return {"sig": sig, "n": n, "k": k, "expected": expected,
+                "classic": classic}
+
+
+    def run_tests(self, genes, algorithms=None, classic=None):
+
+        """
+        Returns the prepared list data (see prepare) and a dictionary
+        with the p-values of each of the 'algorithms' (by default those
+        of this instance), all computed from the same setup.
+        """
+
+        if algorithms is None:
+            algorithms = self.algorithms
+        check_algorithms(algorithms, self.ALGORITHMS)
+
+        data = self.prepare(genes, classic)
+        results = {}
+        for algorithm in algorithms:
+            results[algorithm] = getattr(self, "_"+algorithm)(data)
+
+        return data, results
+
+
+    def elim_fisher(self, genes, cutoff=None):
+
+        """
+        Returns the p-values of topGO's 'elim' algorithm for the tested
+        terms (see _elim).
+        """
+
+        return self._elim(self.prepare(genes), cutoff)
+
+
+    def weight01_fisher(self, genes):
+
+        """
+        Returns the p-values of topGO's 'weight01' algorithm for the
+        tested terms (see _weight01), which is not one of the ALGORITHMS
+        of the results tables until validated against R.
+        """
+
+        return self._weight01(self.prepare(genes))
+
+
+    def parentchild_fisher(self, genes):
+
+        """
+        Returns the p-values of topGO's 'parentchild' algorithm for the
+        tested terms (see _parentchild).
+        """
+
+        return self._parentchild(self.prepare(genes))
+
+
+    def _elim(self, data, cutoff=None):
+
+        """
+        The DAG is processed bottom-up, one level at a time: the genes
+        of a term are tested once those of its significant (p < cutoff,
+        by default alpha) sub terms have been removed, and if it
+        is significant itself its remaining genes are removed from all
+        its ancestors. Terms without removed genes keep their classic
+        p-values.
+        """
+
+        if cutoff is None:
+            cutoff = self.alpha
+
+        removed = np.zeros_like(self.members)
+        touched = np.zeros(len(self.terms), dtype=bool)
+        pvalues = np.array(data["classic"], dtype=float)
+
+        for level in np.unique(self.levels)[::-1]:
+            nodes = np.flatnonzero(self.levels == level)
+
+            # only the terms that lost genes need to be tested again
+            retest = nodes[touched[nodes]]
+            pvalues[retest] = self._retest(data, removed, retest)
+
+            hits = nodes[pvalues[nodes] < cutoff]
+            current = self.members[hits] & ~removed[hits]
+            self._remove_above(removed, touched, hits, current)
+
+        return pvalues
+
+
+    def _weight01(self, data):
+
+        """
+        The mixture of the 'elim' and 'weight' algorithms (with 0/1
+        weights). The DAG is processed bottom-up, one level at a time:
+        the genes of the sub terms more significant than a term are
+        removed from it (and from all its ancestors), and the term is
+        then tested again with its remaining genes.
+
+        NOTE: this is a reading of topGO's weight01 (whose weights come
+        from the sigRatio of the child and parent scores); its parity
+        with topGO's own results has not been validated against R. The
+        tests only check it against an independent rewrite of the same
+        reading (see benchmarks/validate_topgo.py to compare with R).
+        """
+
+        removed = np.zeros_like(self.members)
+        touched = np.zeros(len(self.terms), dtype=bool)
+        pvalues = np.array(data["classic"], dtype=float)
+
+        edge_level = self.levels[self.edge_parent]
+
+        for level in np.unique(self.levels)[::-1]:
+            nodes = np.flatnonzero(self.levels == level)
+
+            retest = nodes[touched[nodes]]
+            pvalues[retest] = self._retest(data, removed, retest)
+
+            edges = np.flatnonzero(edge_level == level)
+            child, parent = self.edge_child[edges], self.edge_parent[edges]
+            better = pvalues[child] < pvalues[parent]
+            if not better.any():
+                continue
+
+            # the genes of the more significant children of each term
+            parents, genes = group_or(parent[better], 
+                            self.members[child[better]] &
+                            ~removed[child[better]])
+
+            removed[parents] |= genes
+            touched[parents] = True
+            pvalues[parents] = self._retest(data, removed, parents)
+            self._remove_above(removed, touched, parents, genes)
+
+        return pvalues
+
+
+    def _parentchild(self, data):
+
+        """
+        Tests each term against the genes of its parents (the union of
+        the genes annotated to its direct super terms, as topGO's
+        default 'union' joining) instead of against the whole universe.
+        Root terms are tested against the universe.
+        """
+
+        union, N = self.parent_union()
+        n = popcount_rows(union & data["sig"])
+        K = self.annotated[self.terms]
+
+        return upper_tail(data["k"], N, K, n)
+
+
+    def parent_union(self):
+
+        """
+        Returns (built once) the bitsets of the genes annotated to the
+        parents of each tested term and their sizes.
+        """
+
+        if self._parent_union is None:
+            union = np.zeros_like(self.members)
+            children, genes = group_or(self.edge_child,
+                                       self.members[self.edge_parent])
+            union[children] = genes
+
+            roots = np.ones(len(self.terms), dtype=bool)
+            roots[children] = False
+            universe = bitsets(np.zeros(self.nbits, dtype=np.int64),
+                               np.arange(self.nbits), 1, self.nbits)[0]
+            union[roots] = universe
+
+            self._parent_union = (union, popcount_rows(union))
+
+        return self._parent_union
+
+
+    def _retest(self, data, removed, nodes):
+
+        """
+        Returns the p-values of 'nodes' tested without their removed
+        genes.
+        """
+
+        current = self.members[nodes] & ~removed[nodes]
+        K = popcount_rows(current)
+        k = popcount_rows(current & data["sig"])
+
+        return upper_tail(k, self.nbits, K, data["n"])
+
+
+    def _remove_above(self, removed, touched, nodes, genes):
+
+        """
+        Removes the gene bitsets 'genes' of 'nodes' from all their
+        ancestors.
+        """
+
+        starts = self.anc_ptr[nodes]
+        sizes = self.anc_ptr[nodes + 1] - starts
+        offsets = np.repeat(starts - np.cumsum(sizes) + sizes, sizes)
+        above = self.anc_index[offsets + np.arange(sizes.sum())]
+        if not len(above):
+            return
+
+        source = np.repeat(np.arange(len(nodes)), sizes)
+        above, genes = group_or(above, genes[source])
+        removed[above] |= genes
+        touched[above] = True
+
+
+    def gen_tables(self, gene_lists, chunk=256):
+
+        """
+        Yields the tables (see gen_table) of several gene lists, their
+        classic tests computed together (see classic_fisher_lists) for
+        'chunk' lists at a time.
+        """
+
+        for start in xrange(0, len(gene_lists), chunk):
+            lists = gene_lists[start:start + chunk]
+            k, expected, pvalues = self.classic_fisher_lists(lists)
+            for i, genes in enumerate(lists):
+                yield self.gen_table(genes, (k[i], expected[i], pvalues[i]))
+
+
+    def gen_table(self, genes, classic=None):
+
+        """
+        Returns the GenTable-like rows (header first) of the top ranked
+        terms, ordered by the first algorithm and ranking 'classicFisher'.
+        """
+
+        data, results = self.run_tests(genes, classic=classic)
+        k, expected, classic = data["k"], data["expected"], data["classic"]
+
+        ranks = np.empty(len(classic), dtype=np.int64)
+        ranks[np.argsort(classic, kind='mergesort')] = np.arange(1,
+                                                        len(classic) + 1)
+        if self.algorithms:
+            orderby = results[self.algorithms[0]]
+        else:
+            orderby = classic
+        order = np.lexsort((ranks, orderby))[:self.topnodes]
+
+        objects = self.annotations.closure.objects
+
+        table = [["GO.ID", "Term", "Annotated", "Significant", "Expected",
+                  "Rank in classicFisher", "classicFisher"] +
+                 [a+"Fisher" for a in self.algorithms]]
+
+        for i in order:
+            term = objects[self.terms[i]]
+            table.append([term.id, truncate_term(term.name),
+                          str(self.annotated[self.terms[i]]), str(k[i]),
+                          format_number(expected[i]), str(ranks[i]),
+                          format_pvalue(classic[i])] +
+                         [format_pvalue(results[a][i]) 
+                          for a in self.algorithms])
+
+        return table
+
+
+    def perform_go_enrichment(self, targetspath):
+
+        """
+        Calculates the GO term enrichment of a list of genes/transcripts
+        of interest, saving the results to file (next to the list, in
+        'goenrich/<aspect>').
+        """
+
+        return self.perform_go_enrichment_lists([targetspath])[0]
+
+
+    def perform_go_enrichment_lists(self, targetspaths):
+
+        """
+        Calculates the GO term enrichment of several lists of
+        genes/transcripts of interest at once (see gen_tables), saving
+        the results of each to file as perform_go_enrichment. Returns
+        the results paths (None for the lists without any GO term
+        mapped).
+        """
+
+        outnames = [None] * len(targetspaths)
+        mapped, gene_lists = [], []
+
+        for i, targetspath in enumerate(targetspaths):
+            genes = read_target_group_of_interest(targetspath)
+            if self.universe[self.annotations.gene_positions(genes)].any():
+                mapped.append(i)
+                gene_lists.append(genes)
+            else:
+                basename = os.path.splitext(os.path.basename(targetspath))[0]
+                print basename, "failed to have any GO", self.ontology, \
+                      "terms mapped to its members!"
+
+        for i, table in zip(mapped, self.gen_tables(gene_lists)):
+            outname = result_path(targetspaths[i], "goenrich/"+self.ontology)
+            with open(outname, 'w') as fh:
+                for row in table:
+                    fh.write("\t".join(row)+"\n")
+            outnames[i] = outname
+
+        return outnames
+
+
+# ==============================================================================
+
+class NativeKEGGer(object):
+
+    """
+    KEGG pathway enrichment of gene lists, as enricher.KEGGer (GOstats'
+    hyperGTest, over-representation), without R. The pathway map (in
+    the KEGGer format: pathway id<TAB>gene id) is loaded once into a
+    genes x pathways incidence and the hypergeometric tests of all the
+    pathways (and lists) are computed at once.
+
+    The gene universe are the genes of the map. The results tables have
+    the columns of GOstats' summary (KEGGID, Pvalue, OddsRatio, ExpCount,
+    Count, Size, Term), with the pathways with p-values below 'alpha'
+    sorted by p-value; the pathway names are read from the optional
+    'names' file (pathway id<TAB>name).
+    """
+
+    def __init__(self, keggmap, alpha=0.01, names=None):
+
+        self.mappings = keggmap
+        self.alpha = alpha
+
+        pairs = read_kegg_mappings(keggmap)
+        self.pathways = sorted(set(p for p, _ in pairs))
+        self.genes = sorted(set(g for _, g in pairs))
+        self.gene_index = dict((g, i) for i, g in enumerate(self.genes))
+        pathway_index = dict((p, i) for i, p in enumerate(self.pathways))
+
+        self.incidence = sp.csr_matrix(
+                    (np.ones(len(pairs), dtype=np.int32),
+                     ([self.gene_index[g] for _, g in pairs],
+                      [pathway_index[p] for p, _ in pairs])),
+                    shape=(len(self.genes), len(self.pathways)))
+        self.sizes = np.diff(self.incidence.tocsc().indptr)
+
+        if names is not None:
+            self.names = read_pathway_names(names)
+        else:
+            self.names = {}
+
+
+    def selection(self, gene_lists):
+
+        """
+        Returns the lists x genes selection matrix (sparse) of several
+        gene lists and their numbers of genes in the universe.
+        """
+
+        rows, cols = [], []
+        for i, genes in enumerate(gene_lists):
+            positions = sorted(set(self.gene_index[g] for g in genes
+                                   if g in self.gene_index))
+            rows.extend([i] * len(positions))
+            cols.extend(positions)
+
+        selection = sp.csr_matrix((np.ones(len(rows), dtype=np.int32),
+                                   (rows, cols)),
+                                  shape=(len(gene_lists), len(self.genes)))
+
+        return selection, np.bincount(rows, minlength=len(gene_lists))
+
+
+    def hypergeometric_lists(self, gene_lists):
+
+        """
+        Returns the (count, expected, p-value) arrays (lists x pathways)
+        of several gene lists and their numbers of genes in the universe.
+        """
+
+        selection, n = self.selection(gene_lists)
+
+        N = len(self.genes)
+        K = self.sizes
+        k = (selection * self.incidence).toarray()
+
+        expected = np.outer(n, K) / float(N)
+        pvalues = upper_tail(k.ravel(), N, np.tile(K, len(n)),
+                             np.repeat(n, len(K))).reshape(k.shape)
+
+        return k, expected, pvalues, n
+
+
+    def gen_tables(self, gene_lists, chunk=256):
+
+        """
+        Yields the (GOstats summary-like, header first) results tables
+        of several gene lists.
+        """
+
+        N = len(self.genes)
+        K = self.sizes
+
+        header = ["KEGGID", "Pvalue", "OddsRatio", "ExpCount", "Count",
+                  "Size", "Term"]
+
+        for start in xrange(0, len(gene_lists), chunk):
+            lists = gene_lists[start:start + chunk]
+            k, expected, pvalues, n = self.hypergeometric_lists(lists)
+
+            for i in xrange(len(lists)):
+                hits = np.flatnonzero(pvalues[i] < self.alpha)
+                hits = hits[np.argsort(pvalues[i][hits], kind='mergesort')]
+                odds = odds_ratio(k[i][hits], N, K[hits], n[i])
+
+                table = [header]
+                for j, o in zip(hits, odds):
+                    pathway = self.pathways[j]
+                    table.append([pathway, format_r(pvalues[i][j]), 
+                                  format_r(o), format_r(expected[i][j]),
+                                  str(k[i][j]), str(K[j]), 
+                                  self.names.get(pathway, pathway)])
+                yield table
+
+
+    def perform_kegg_enrichment(self, targetspath):
+
+        """
+        Calculates the KEGG pathway enrichment of a list of
+        genes/transcripts of interest, saving the results to file (next
+        to the list, in 'keggenrich').
+        """
+
+        return self.perform_kegg_enrichment_lists([targetspath])[0]
+
+
+    def perform_kegg_enrichment_lists(self, targetspaths):
+
+        """
+        Calculates the KEGG pathway enrichment of several lists of
+        genes/transcripts of interest at once, saving the results of
+        each to file as perform_kegg_enrichment. Returns the results
+        paths (None for the lists without any gene in the map).
+        """
+
+        outnames = [None] * len(targetspaths)
+        mapped, gene_lists = [], []
+
+        for i, targetspath in enumerate(targetspaths):
+            genes = read_target_group_of_interest(targetspath)
+            if any(g in self.gene_index for g in genes):
+                mapped.append(i)
+                gene_lists.append(genes)
+            else:
+                basename = os.path.splitext(os.path.basename(targetspath))[0]
+                print basename, \
+                      "failed to have any KEGG pathways mapped to its members!"
+
+        for i, table in zip(mapped, self.gen_tables(gene_lists)):
+            outname = result_path(targetspaths[i], "keggenrich")
+            with open(outname, 'w') as fh:
+                for row in table:
+                    fh.write("\t".join(row)+"\n")
+            outnames[i] = outname
+
+        return outnames
+
+
+# accessory helpers
+# ------------------------------------------------------------------------------
+
+def read_kegg_mappings(keggmap):
+
+    """
+    Reads the (pathway id, gene id) pairs of a two column KEGG map, as
+    KEGGer (without duplicates).
+    """
+
+    pairs = set()
+    with open(keggmap) as fh:
+        for line in fh:
+            token = [t.strip() for t in line.rstrip("\r\n").split("\t")]
+            if len(token) > 1 and token[0] and token[1]:
+                pairs.add((token[0], token[1]))
+
+    return sorted(pairs)
+
+
+def read_pathway_names(namespath):
+
+    """
+    Reads a pathway id<TAB>name file into a dictionary.
+    """
+
+    names = {}
+    with open(namespath) as fh:
+        for line in fh:
+            token = line.rstrip("\r\n").split("\t", 1)
+            if len(token) > 1:
+                names[token[0].strip()] = token[1].strip()
+
+    return names
+
+
+def read_target_group_of_interest(targetspath):
+
+    """
+    Reads a tsv file, extracting its first column (while assuming they
+    are transcript/gene identifiers).
+    """
+
+    genes = []
+    with open(targetspath) as fh:
+        for line in fh:
+            token = line.split("\t")
+            genes.append(token[0].strip())
+
+    return genes
+
+
+def result_path(targetspath, enrich):
+
+    """
+    Creates (if necessary) output folder to save enrichment results
+    and returns full path to the results file being saved.
+    """
+
+    basename = os.path.splitext(os.path.basename(targetspath))[0]
+    savepath = os.path.join(os.path.dirname(targetspath), enrich)
+
+    try:
+        os.makedirs(savepath)
+    except OSError:
+        if not os.path.isdir(savepath):
+            raise
+
+    return os.path.join(savepath, basename+"_enrichment.tsv")
+
+
+def check_algorithms(algorithms, known):
+
+    """
+    Raises ValueError for the first of 'algorithms' not in 'known'.
+    """
+
+    for algorithm in algorithms:
+        if algorithm not in known:
+            raise ValueError("Unknown enrichment algorithm: %s" % algorithm)
+
+
+def upper_tail(k, N, K, n):
+
+    """
+    Returns P(X >= k) for hypergeometric X (K of N genes annotated, n
+    drawn), i.e. the one-sided Fisher's exact test p-values, for arrays
+    'k' and 'K' (and scalars or arrays 'N' and 'n'). Each distinct
+    (k, N, K, n) is computed once and the probabilities of the tails are
+    summed in log space for all of them at once, skipping the terms
+    below e^-40 of the largest one (relative error about 1e-10).
+    """
+
+    k = np.asarray(k, dtype=np.int64)
+    K = np.asarray(K, dtype=np.int64)
+    N = np.broadcast_to(np.asarray(N, dtype=np.int64), k.shape)
+    n = np.broadcast_to(np.asarray(n, dtype=np.int64), k.shape)
+
+    # support of X
+    lo = np.maximum(0, n + K - N)
+    hi = np.minimum(K, n)
+
+    pvalues = np.where(k > hi, 0., 1.)
+    todo = np.flatnonzero((k > lo) & (k <= hi))
+    if not len(todo):
+        return pvalues
+
+    cases, inverse = np.unique(np.c_[k[todo], N[todo], K[todo], n[todo]],
+                               axis=0, return_inverse=True)
+    k, N, K, n = cases.T
+    hi = np.minimum(K, n)
+
+    # the largest term of the tail and the window of terms within e^-40
+    # of it (the pmf is unimodal)
+    mode = (n + 1) * (K + 1) // (N + 2)
+    peak = np.clip(mode, k, hi)
+    top = log_pmf(peak, N, K, n)
+    cutoff = top - 40
+
+    left, right = k.copy(), peak.copy()
+    while (left < right).any():
+        mid = (left + right) // 2
+        inside = log_pmf(mid, N, K, n) >= cutoff
+        right = np.where(inside, mid, right)
+        left = np.where(inside, left, mid + 1)
+    start = left
+
+    left, right = peak.copy(), hi.copy()
+    while (left < right).any():
+        mid = (left + right + 1) // 2
+        inside = log_pmf(mid, N, K, n) >= cutoff
+        left = np.where(inside, mid, left)
+        right = np.where(inside, right, mid - 1)
+    end = left
+
+    sizes = end - start + 1
+    first = np.cumsum(sizes) - sizes
+    x = np.repeat(start - first, sizes) + np.arange(sizes.sum())
+    logpmf = log_pmf(x, np.repeat(N, sizes), np.repeat(K, sizes),
+                     np.repeat(n, sizes))
+
+    tail = np.add.reduceat(np.exp(logpmf - np.repeat(top, sizes)), first)
+    pvalues[todo] = np.minimum(np.exp(top) * tail, 1.)[inverse]
+
+    return pvalues
+
+
+def log_pmf(x, N, K, n):
+
+    """
+    Returns log P(X = x) for hypergeometric X (K of N genes annotated, n
+    drawn).
+    """
+
+    return (gammaln(K + 1) - gammaln(x + 1) - gammaln(K - x + 1) +
+            gammaln(N - K + 1) - gammaln(n - x + 1) -
+            gammaln(N - K - n + x + 1) -
+            (gammaln(N + 1) - gammaln(n + 1) - gammaln(N - n + 1)))
+
+
+def bitsets(rows, bits, nrows, nbits):
+
+    """
+    Returns a (nrows x nbits/8) uint8 array with the given (row, bit)
+    pairs set (numpy.packbits layout).
+    """
+
+    sets = np.zeros((nrows, (nbits + 7) // 8), dtype=np.uint8)
+    if len(rows):
+        np.bitwise_or.at(sets, (rows, bits >> 3),
+                         (128 >> (bits & 7)).astype(np.uint8))
+
+    return sets
+
+
+def group_or(rows, sets):
+
+    """
+    ORs together the bitsets 'sets' of equal 'rows', returning the
+    unique rows and their combined bitsets.
+    """
+
+    if not len(rows):
+        return rows, sets
+
+    order = np.argsort(rows, kind='mergesort')
+    rows, sets = rows[order], sets[order]
+    first = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+
+    return rows[first], np.bitwise_or.reduceat(sets, first, axis=0)
+
+
+def popcount_rows(sets, chunk=1024):
+
+    """
+    Returns the number of bits set in each row of a bitsets array
+    (counted in chunks of rows, to bound the temporary memory).
+    """
+
+    sets = np.atleast_2d(sets)
+    counts = np.zeros(len(sets), dtype=np.int64)
+    for start in xrange(0, len(sets), chunk):
+        counts[start:start + chunk] = POPCOUNT[sets[start:start + chunk]
+                                               ].sum(axis=1)
+
+    return counts
+
+
+def odds_ratio(k, N, K, n):
+
+    """
+    Returns the sample odds ratios of the 2x2 tables of 'k' of the 'n'
+    genes of interest in gene sets of sizes 'K' (of N genes), as
+    GOstats (inf when undefined).
+    """
+
+    k, K = np.asarray(k, dtype=float), np.asarray(K, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return (k * (N - K - n + k)) / ((n - k) * (K - k))
+
+
+def truncate_term(name, numchar=40):
+
+    """
+    Shortens a term name as GenTable does.
+    """
+
+    if len(name) > numchar:
+        return name[:numchar]+"..."
+    return name
+
+
+def format_number(x):
+
+    """
+    Formats an 'Expected' value (rounded to 2 decimal places).
+    """
+
+    return ("%.2f" % x).rstrip("0").rstrip(".")
+
+
+def format_r(x):
+
+    """
+    Formats a number as R's write.table (15 significant digits).
+    """
+
+    if np.isinf(x):
+        return "Inf" if x > 0 else "-Inf"
+    if np.isnan(x):
+        return "NaN"
+
+    return "%.15g" % x
+
+
+def format_pvalue(p, eps=1e-30):
+
+    """
+    Formats a p-value with 2 significant digits, as R's format.pval
+    (values below 'eps' become '< 1e-30').
+    """
+
+    if p < eps:
+        return "< %g" % eps
+    return "%.2g" % p
@@ -1,15 +1,23 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import networkx as nx
+import numpy as np
 import pandas as pd
-import os, math, subprocess, tempfile, misc
+import os, sys, glob, math, subprocess, tempfile, threading, misc
+import cPickle as pickle
 
-from libraries.ontology import OBOOntology
+from libraries.ontology import OBOOntology, OntologyDiff, PARSER_VERSION, \
+                               relation_set
+from libraries.compact import CompactOntology
 
 pd.set_option('display.max_colwidth', -1)
 pd.options.mode.chained_assignment = None  # default='warn'
 
+# output extension and Graphviz 'dot' option of each export filetype
+EXPORT_FORMATS = {"svg": (".svg", "-Tsvg"),
+                  "png": (".png", "-Tpng"),
+                  "map": (".map", "-Tcmapx")}
+
 class OBOe(object):
 
     """
@@ -26,108 +34,242 @@ class OBOe(object):
 
     - dot, svg (and optionally other graphic filetypes)
 
+    The GO graphs follow the given 'relations' (e.g. "is_a+part_of").
+    By default their nodes follow all relations and their edges 'is_a'.
+
     """
 
 
-    def __init__(self, obopath):
+    def __init__(self, obopath, cachedir=None, snapshot=True, refresh=False,
+                 compact=False, processes=1, delta=None, relations=None):
 
         self.obofile = obopath
-        self.ontology = self.read_obo()
-        self.ontology.alt2id = self.add_alt2id()
+        self.relations = relation_set(relations)
+        self.snapfile = None
+        self.compact = compact
+        self.processes = processes
+        # truncated graph labels of the term names (see process_term_name),
+        # kept across the graphs of this ontology
+        self._term_labels = {}
+
+        if snapshot:
+            if cachedir is None:
+                cachedir = misc.cache_dir('snapshots')
+            self.cachedir = cachedir
+            self.ontology = self.load_snapshot(refresh, delta)
+        else:
+            self.cachedir = None
+            self.ontology = self.read_obo()
 
 
     def read_obo(self):
 
-        ont = OBOOntology(self.obofile)
+        ont = CompactOntology() if self.compact else OBOOntology()
+
+        if self.processes > 1:
+            ont.load_parallel(self.obofile, self.processes)
+        else:
+            ont.load(self.obofile)
+
+        # built once here, so that it is also kept in the snapshot
+        ont.closure()
+        ont.closure(self.relations)
+
         return ont
 
-    def add_alt2id(self):
 
-        "Needed to handle deprecated go ids"
+    def snapshot_path(self):
 
-        alt2id = {}
-        for term in self.ontology.id2term:   
-            for i in range(0, len(self.ontology.id2term[term].tags())-1 ):
-                tag = self.ontology.id2term[term]._format_single_tag(i)
-                token = tag.split(': ')
-                if token[0] == 'alt_id':
-                    alt2id.setdefault(token[1].strip(), None)
-                    alt2id[token[1].strip()] = term
-        return alt2id
+        """
+        Path of the snapshot matching the current contents of the
+        OBO file (and the version of the ontology parser).
+        """
 
+        digest = misc.file_digest(self.obofile)
+        name = os.path.basename(self.obofile)
 
-    def create_ntx_graph(self, termlist):
+        return os.path.join(self.cachedir, "%s-%s-%s-v%d.pickle" % 
+                            (name, self.snapshot_kind(), digest, PARSER_VERSION))
 
-        gx = self.ontology.to_networkx(termlist)
-        return gx
 
-    def ntx_nodes(self, ntxgraph):
+    def snapshot_kind(self):
 
-        return ntxgraph.nodes();
+        return "compact" if self.compact else "full"
 
 
-    def get_directed_edges(self, termlist):
+    def load_snapshot(self, refresh=False, delta=None):
 
         """
-        Takes full list of terms comprising a GO
-        sub-graph and return its directed 'is_a'
-        edges and the root term (the only sink).
+        Loads the parsed ontology from its on-disk snapshot. If there
+        is none (e.g. the OBO file changed), it falls back to applying
+        a delta file (see diff()) to the snapshot of the previous
+        release or else to parsing the OBO file, and (re)writes the
+        snapshot.
         """
 
-        root = ""
-        edgelist = []
+        snapfile = self.snapshot_path()
+        self.snapfile = snapfile
 
-        clonelist = [x for x in termlist]
-        terms = []
+        if os.path.isfile(snapfile) and not refresh:
+            try:
+                with open(snapfile, "rb") as fh:
+                    return pickle.load(fh)
+            except (pickle.UnpicklingError, EOFError, 
+                    AttributeError, ImportError):
+                print "Discarding unreadable ontology snapshot", snapfile
 
-        for term in clonelist:
-            par_edges = self.ontology.parent_edges(term)
-            # if term has any parent...
-            if len(par_edges) > 0:
-                for pe in par_edges:
-                    if pe[0] == "is_a":
-                        edgelist.append( ( term, pe[1].id) )
-            else:
-                root = term
+        ont = None
+        if delta is not None:
+            ont = self.apply_delta(delta)
+        if ont is None:
+            ont = self.read_obo()
+        self.write_snapshot(ont, snapfile)
 
-        return edgelist, root
+        return ont
+
+
+    def write_snapshot(self, ont, snapfile):
+
+        """
+        Atomically writes a parsed ontology to the snapshot path and
+        drops any stale snapshots of the same OBO file.
+        """
+
+        fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                pickle.dump(ont, fh, pickle.HIGHEST_PROTOCOL)
+            os.rename(temp, snapfile)
+        except:
+            os.remove(temp)
+            raise
+
+        stale = os.path.join(self.cachedir, "%s-%s-*.pickle" % 
+                        (os.path.basename(self.obofile), self.snapshot_kind()))
+        for old in glob.glob(stale):
+            if old != snapfile:
+                os.remove(old)
+
+        return snapfile
+
+
+    def apply_delta(self, deltapath):
 
+        """
+        Rebuilds the ontology of the current OBO file from the cached
+        snapshot of an older release and a delta file leading from that
+        release to the OBO file. Returns None if the delta does not
+        match the OBO file or there is no snapshot to apply it to.
+        """
+
+        delta = OntologyDiff.read(deltapath)
 
-    def create_basic_dag(self, edgelist):
+        if delta.target != misc.file_digest(self.obofile):
+            print "Delta file", deltapath, "does not lead to", self.obofile
+            return None
 
-        dag = nx.DiGraph()
-        dag.add_edges_from(edgelist)
+        pattern = os.path.join(self.cachedir, "*-%s-%s-v%d.pickle" % 
+                        (self.snapshot_kind(), delta.source, PARSER_VERSION))
+        bases = glob.glob(pattern)
+        if not bases:
+            print "No snapshot to apply the delta file", deltapath, "to"
+            return None
 
-        return dag
+        with open(bases[0], "rb") as fh:
+            ont = pickle.load(fh)
+        ont.apply_delta(delta)
+
+        return ont
 
 
-    def generate_basic_dot(self, dag):
+    def diff(self, previous):
 
         """
-        Converts networkx graph into a dot
-        file contents output (as a list).
+        Returns the differences (OntologyDiff) between a previous
+        release (another OBOe instance) and this one. The releases are
+        identified by the digests of their OBO files, so that the diff
+        can be written as a delta file for apply_delta().
         """
 
-        P = nx.nx_pydot.to_pydot(dag)
-        A = nx.nx_agraph.to_agraph(dag)
+        delta = previous.ontology.diff(self.ontology)
+        delta.source = misc.file_digest(previous.obofile)
+        delta.target = misc.file_digest(self.obofile)
+
+        return delta
+
+
+    def affected_results(self, delta, inputdir, alpha):
+
+        """
+        Lists the enrichment results (goenrich/<aspect>/*.tsv) and the
+        DAG dot files made from them that are outdated by the changes
+        in 'delta'. A result is outdated if it reports a term whose
+        data, ancestors or annotation counts changed; a DAG if its
+        result is, or if the terms or structure of its graph changed.
+        """
+
+        affected = delta.affected_terms(self.ontology)
+        structural = delta.affected_terms(self.ontology, annotations=False)
+        closure = self.ontology.closure()
+
+        enrichments, dags = [], []
+
+        for a in ["BP", "MF", "CC"]:
+            targetdir = os.path.join(inputdir, "goenrich", a)
+            if not os.path.isdir(targetdir):
+                continue
+
+            for t in sorted(os.listdir(targetdir)):
+                if not t.endswith(".tsv"):
+                    continue
+                target = os.path.join(targetdir, t)
+                df = self.read_enrichment_tsv(target)
+
+                goes = self.extract_go_terms(df, alpha) or []
+                known = [go for go in goes if go in closure.position]
+                nodes = closure.ids(closure.ancestors_of(known, True))
+
+                if affected.intersection(df["GO.ID"]):
+                    enrichments.append(target)
+                elif not structural.intersection(goes + nodes):
+                    continue
+                dags.append(os.path.splitext(target)[0]+"_"+a+".dot")
 
-        temp = tempfile.NamedTemporaryFile()
-        A.write(temp.name)
+        return enrichments, dags
 
-        dot = []
-        for line in temp:
-            dot.append(line.strip())
 
-        return dot
+    def get_directed_edges(self, termlist):
+
+        """
+        Takes full list of terms comprising a GO
+        sub-graph and return its directed 'is_a'
+        (or followed relations) edges and the 
+        root term (the only sink).
+        """
+
+        root = ""
+        edgelist = []
+
+        closure = self.ontology.closure(self.relations)
+        follow = self.relations or ["is_a"]
+
+        for term in termlist:
+            par_edges = closure.parent_edges(term)
+            # if term has any parent...
+            if len(par_edges) > 0:
+                for pe in par_edges:
+                    if pe[0] in follow:
+                        edgelist.append( ( term, pe[1].id) )
+            else:
+                root = term
+
+        return edgelist, root
 
 
     def read_enrichment_tsv(self, filepath):
 
-        df = pd.read_csv(filepath, sep="\t",
-                        converters={'elimFisher': 
-                            lambda x: misc.parse_ev(x)})
-        df[['elimFisher']] = df[['elimFisher']].apply(pd.to_numeric)
-        return df
+        df = pd.read_csv(filepath, sep="\t")
+        return misc.parse_pvalue_columns(df)
 
 
     def extract_go_terms(self, df, alpha):
@@ -138,7 +280,8 @@ class OBOe(object):
         """
 
         try:
-            fatia = df["GO.ID"].loc[df['elimFisher'] < float(alpha)]
+            score = misc.score_column(df)
+            fatia = df["GO.ID"].loc[df[score] < float(alpha)]
             subset = [x for x in fatia]
             return subset
         except:
@@ -147,143 +290,138 @@ class OBOe(object):
     # -------------------------------------------------------------------------
 
 
-    def enhance_dot(self, outname, nodes, listdotedges, df, alpha, root):
-
-        #temp = tempfile.NamedTemporaryFile(delete=False)
-
-        outfile = outname+".dot"
-        temp = open(outfile, "w")
+    def build_dot(self, outname, terms, df, alpha):
 
-        sig = self.extract_go_terms(df, alpha)
+        """
+        Writes the dot file ('outname'.dot) of the GO sub-graph of the
+        enriched 'terms' (and all their ancestors) straight from the
+        ontology closure and the enrichment results. Returns its path.
+        """
 
-        # dot file header
-        temp.write('strict digraph  {\n graph[rankdir="BT"];\n')
+        closure = self.ontology.closure(self.relations)
+        known = [go for go in terms if go in closure.position]
+        nodes = closure.ids(closure.ancestors_of(known, True))
 
-        added = [] # stores list of nodes that are customized in the dot
+        edges, root = self.get_directed_edges(nodes)
+        statements = ['"%s" -> "%s";' % edge for edge in edges]
 
-        for index, row in df.iterrows():
-            if row["elimFisher"] < alpha:
-                # set root term as sink
-                if row["GO.ID"] == root:
-                    # get term name here    
-                    temp.write('"'+row["GO.ID"]+'" '+'[rank="sink"];\n')
-                    added.append(row["GO.ID"])
-                else:
-                    try:
-                        term_name = self.ontology[row["GO.ID"]].name
-                    except KeyError:
-                        term_name = self.ontology[self.ontology.alt2id[row["GO.ID"]]].name
+        return self.write_dot(outname, nodes, statements, df, alpha, root)
 
-                    truncterm = self.process_term_name(term_name)
-                    trunctermplus = row["GO.ID"]+"\n"+truncterm+"\n"+ \
-                                    str(row["elimFisher"])+"\n"+"("+ \
-                                    str(row["Significant"])+"/"+ \
-                                    str(row["Annotated"])+")"
 
-                    color_hsv = self.get_enrichment_color(row["elimFisher"])
+    def write_dot(self, outname, nodes, statements, df, alpha, root):
 
-                    tooltip = term_name
-                    temp.write('"'+row["GO.ID"]+'" [ id="'+row["GO.ID"]+
-                               '" shape="note" style="filled" color="'+
-                               str(color_hsv[0])+' '+str(color_hsv[1])+' '+
-                               str(color_hsv[2])+'" label="'+trunctermplus+
-                                                '" tooltip="'+tooltip+'"];\n')
+        """
+        Writes a GO sub-graph dot file ('outname'.dot): the significant
+        terms of 'df' as colour-coded notes (by term id, whatever their
+        rank, so that the same graph is written and laid out the same
+        way), the other 'nodes' as plain ones and then the edge
+        'statements', in a single write.
+        """
 
-                    added.append(row["GO.ID"])
+        score = misc.score_column(df)
 
+        # dot file header
+        dot = ['strict digraph  {\n graph[rankdir="BT"];\n']
+
+        # node attributes of the significant terms, column-wise
+        sig = df.loc[df[score] < alpha].sort_values("GO.ID")
+        ids = sig["GO.ID"].astype(str)
+        names = [self.ontology.term(go).name for go in ids]
+        hues = self.get_enrichment_colors(sig[score].values).tolist()
+        labels = (ids+"\n"+[self.process_term_name(n) for n in names]+"\n"+
+                  sig[score].map(str)+"\n("+sig["Significant"].map(str)+"/"+
+                  sig["Annotated"].map(str)+")")
+
+        for go, name, hue, label in zip(ids, names, hues, labels):
+            # set root term as sink
+            if go == root:
+                dot.append('"'+go+'" '+'[rank="sink"];\n')
+            else:
+                dot.append('"'+go+'" [ id="'+go+'" shape="note" style='
+                           '"filled" color="'+str(hue)+' 1 1" label="'+
+                           label+'" tooltip="'+name+'"];\n')
 
         # Handle statistically non-significant nodes
+        added = set(ids)
         for go in nodes:
             if go not in added:
+                term_name = self.ontology.term(go).name
                 if go == root:
-                    # get term name here
-                    term_name = self.ontology[go].name
-                    temp.write('"'+go+'" '+'[rank="sink" style="filled" label="'
+                    dot.append('"'+go+'" '+'[rank="sink" style="filled" label="'
                                                     +go+'\\n'+term_name+'"];\n')
                 else:
-                    try:
-                        term_name = self.ontology[go].name
-                    except KeyError:
-                        term_name = self.ontology[self.ontology.alt2id[go]].name
-                    temp.write('"'+go+'" '+'[style="filled" label="'+go+
+                    dot.append('"'+go+'" '+'[style="filled" label="'+go+
                                            '" tooltip="'+term_name+'"];\n')
 
-        for edge in listdotedges[1:]:
-            temp.write(edge+"\n")
-        temp.close()
+        for statement in statements:
+            dot.append(statement+"\n")
+        dot.append("}\n")
 
-        return temp.name
+        outfile = outname+".dot"
+        with open(outfile, "w") as fh:
+            fh.write("".join(dot))
+
+        return outfile
 
 
-    def export_dag_as(self, dotfile, filetype):
+    def export_dag_as(self, dotfile, filetype, cache=None):
 
         """
-        Exports a dag (dot) file as either an SVG or PNG/MAP
+        Exports a dag (dot) file as either an SVG or PNG/MAP. Returns
+        an error message if Graphviz failed (None otherwise). With a
+        'cache' (dagcache.RenderCache), dot files rendered before are
+        taken from it instead.
         """
 
-        outdef = ()
-
-        if filetype == "svg":
-            outdef = (".svg", "-Tsvg")
-        elif filetype == "png":
-            outdef = (".png", "-Tpng")
-        elif filetype == "map":
-            outdef = (".map", "-Tcmapx")
-        else:
+        if filetype not in EXPORT_FORMATS:
             print "Filetype ", filetype, " not recognised!"
             sys.exit()
 
-        outfile = os.path.splitext(dotfile)[0]+outdef[0]
-        with open(outfile,'w') as s_out:
-            subprocess.call(['dot', outdef[1], dotfile], stdout=s_out)
+        return render_dot(dotfile, filetype, cache=cache)
 
 
-    def process_term_name(self, name):
+    def export_dags_as(self, dotfiles, filetype, processes=1, timeout=None,
+                       cache=None):
 
         """
-        Processes a 'term name' in order to obtain a 
-        truncated version to better fit a graphviz node.
+        Exports many dag (dot) files, running up to 'processes' Graphviz
+        layouts at a time, each one killed after 'timeout' seconds (if
+        given). Returns the (dot file, error message) of the graphs that
+        failed, in the order of 'dotfiles'. With a 'cache', as
+        export_dag_as.
         """
 
-        if len(name) > 20:
+        if filetype not in EXPORT_FORMATS:
+            print "Filetype ", filetype, " not recognised!"
+            sys.exit()
 
-            trunc_name = ''
-            token = name.split(' ')
+        # the layouts run in the 'dot' processes: threads just wait on them
+        from multiprocessing.pool import ThreadPool
 
-            # if 1st word has MORE than 20 characters
-            if len(token[0]) > 20:
-                # RETURN the first 18 characters plus '...'
-                return token[0][0:17] + '...'
+        pool = ThreadPool(max(1, min(processes, len(dotfiles))))
+        try:
+            errors = pool.map(lambda d: render_dot(d, filetype, timeout,
+                                                   cache), dotfiles, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
 
-            else:
-                last = ""
-                for e in token:
-                    # if ANY subsequent SINGLE word(s) has 
-                    # MORE than 20 characters...
-                    if len(e) > 20:
-                        diff = 20 - (len(last) + len(e))
-                        return trunc_name + last + e[0:diff] + '...'
+        return [(d, e) for d, e in zip(dotfiles, errors) if e is not None]
 
-                    else:
-                        # if ANY subsequent SINGLE LINE has
-                        # MORE than 20 characters...
-                        if (len(last) + len(e)) < 20:
 
-                            last = last + " " + e
-                            if e == token[-1]:
-                                return trunc_name + last
-
-                        else:
-                            trunc_name += last + '\\n'
-                            last = e
-                            if e == token[-1]:
-                                return trunc_name + last
+    def process_term_name(self, name):
 
-                return trunc_name
+        """
+        Processes a 'term name' in order to obtain a 
+        truncated version to better fit a graphviz node.
+        (Memoized across graphs in _term_labels.)
+        """
 
-        # OTHERWISE just return it... 
-        else:
-            return name
+        try:
+            return self._term_labels[name]
+        except KeyError:
+            label = self._term_labels[name] = truncate_term_name(name)
+            return label
 
 
     def get_enrichment_color(self, pvalue):
@@ -293,6 +431,16 @@ class OBOe(object):
         within a chosen HSV color range.
         """
 
+        return (self.get_enrichment_colors([pvalue]).tolist()[0], 1, 1)
+
+
+    def get_enrichment_colors(self, pvalues):
+
+        """
+        Creates the hues (an array) for an array of p-values
+        within a chosen HSV color range.
+        """
+
         # hard-coded range
         # TODO: improve this, possibly make it customizable
         #       or make a few sensible presets available
@@ -300,9 +448,124 @@ class OBOe(object):
         max_colour = 240
         min_colour = 170
 
-        if pvalue == 0:
-            hue = max_colour/float(360)
+        pvalues = np.asarray(pvalues, dtype=float)
+        with np.errstate(divide="ignore"):
+            hues = (min_colour + np.abs(np.log(pvalues))) / float(360)
+        hues[pvalues == 0] = max_colour/float(360)
+
+        return hues
+
+
+
+# accessory helpers
+# ------------------------------------------------------------------------------
+
+def truncate_term_name(name):
+
+    """
+    Truncates a term name (over 20 characters) into lines of up to 20
+    characters, to better fit a graphviz node.
+    """
+
+    if len(name) > 20:
+
+        trunc_name = ''
+        token = name.split(' ')
+
+        # if 1st word has MORE than 20 characters
+        if len(token[0]) > 20:
+            # RETURN the first 18 characters plus '...'
+            return token[0][0:17] + '...'
+
         else:
-            hue = ( min_colour + abs(math.log(pvalue)) ) / float(360)
+            last = ""
+            for e in token:
+                # if ANY subsequent SINGLE word(s) has 
+                # MORE than 20 characters...
+                if len(e) > 20:
+                    diff = 20 - (len(last) + len(e))
+                    return trunc_name + last + e[0:diff] + '...'
+
+                else:
+                    # if ANY subsequent SINGLE LINE has
+                    # MORE than 20 characters...
+                    if (len(last) + len(e)) < 20:
+
+                        last = last + " " + e
+                        if e == token[-1]:
+                            return trunc_name + last
+
+                    else:
+                        trunc_name += last + '\\n'
+                        last = e
+                        if e == token[-1]:
+                            return trunc_name + last
+
+            return trunc_name
+
+    # OTHERWISE just return it... 
+    else:
+        return name
+
+
+def render_dot(dotfile, filetype, timeout=None, cache=None):
+
+    """
+    Runs Graphviz 'dot' on a dot file, writing the output (of an
+    EXPORT_FORMATS filetype) next to it. The process is killed after
+    'timeout' seconds (if given). Returns an error message if it failed
+    (and then no partial output is left), None otherwise.
+
+    With a 'cache' (dagcache.RenderCache) the output is taken from it if
+    the same dot file was rendered before, and cached otherwise.
+    """
 
-        return (hue, 1, 1)
\ No newline at end of file
+    if cache is not None and cache.fetch(dotfile, filetype):
+        return None
+
+    extension, option = EXPORT_FORMATS[filetype]
+    outfile = os.path.splitext(dotfile)[0]+extension
+
+    # replaced, not written through: it may be a hard link to a cached
+    # render (see dagcache.RenderCache)
+    if os.path.lexists(outfile):
+        os.remove(outfile)
+
+    try:
+        with open(outfile, "w") as out:
+            proc = subprocess.Popen(["dot", option, dotfile], stdout=out,
+                                    stderr=subprocess.PIPE)
+    except OSError as e:
+        os.remove(outfile)
+        return "could not run dot (%s)" % e
+
+    timer, expired = None, []
+    if timeout:
+        def kill():
+            expired.append(True)
+            try:
+                proc.kill()
+            except OSError:
+                pass
+        timer = threading.Timer(timeout, kill)
+        timer.start()
+
+    try:
+        stderr = proc.communicate()[1]
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if expired:
+        error = "timed out after %g s" % timeout
+    elif proc.returncode != 0:
+        error = "dot exited with status %d" % proc.returncode
+        if stderr.strip():
+            error += ": "+stderr.strip().splitlines()[-1]
+    else:
+        if cache is not None:
+            cache.add(dotfile, filetype)
+        return None
+
+    os.remove(outfile)
+    return error
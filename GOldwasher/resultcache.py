@@ -0,0 +1,220 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os, glob, shutil, hashlib, tempfile
+
+"""
+A content-addressed on-disk cache of enrichment results tables.
+
+Results are keyed by a hash of everything they depend on: the (sorted)
+gene set, the content of the mapping file, the ontology/annotation
+database version, the aspect and the parameters of the test. The size
+of the cache is bounded, the least recently used results being evicted
+first.
+"""
+
+# default size bound of the cache (bytes)
+MAXSIZE = 256 << 20
+
+# permissions of the cached files (as of files created with open; they
+# may be hard-linked in place of the outputs)
+_umask = os.umask(0)
+os.umask(_umask)
+MODE = 0666 & ~_umask
+
+
+class ResultCache(object):
+
+    """
+    Keeps the enrichment results tables (one '<key>.tsv' file each) in
+    a directory. Lists without any result are cached as empty files, so
+    that they are not recomputed either. Fetching a result refreshes its
+    modification time, which orders the least recently used eviction.
+
+    The size of the cache is only scanned (see entries) on the first
+    store and when its running total, kept by the stores of this
+    instance, goes over the bound: stores of other processes are seen
+    at the next scan.
+
+    Other kinds of files (e.g. the GO graph layouts of dagcache) can be
+    kept the same way, with their own 'suffix'.
+    """
+
+    def __init__(self, cachedir, maxsize=MAXSIZE, suffix=".tsv"):
+
+        self.cachedir = cachedir
+        self.maxsize = maxsize
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._size = None
+
+        try:
+            os.makedirs(cachedir)
+        except OSError:
+            if not os.path.isdir(cachedir):
+                raise
+
+
+    def key(self, genes, *parts):
+
+        """
+        Returns the key of the results of a gene set, given the other
+        things they depend on (mapping digest, database version, aspect,
+        parameters...).
+        """
+
+        h = hashlib.sha1()
+        for part in parts:
+            h.update(repr(part))
+            h.update("\0")
+        for gene in sorted(set(genes)):
+            h.update(gene)
+            h.update("\n")
+
+        return h.hexdigest()
+
+
+    def path(self, key):
+
+        return os.path.join(self.cachedir, key + self.suffix)
+
+
+    def fetch(self, key, outname, link=False):
+
+        """
+        Copies (or, with 'link', hard-links if possible) the cached
+        results of 'key' to 'outname'. Returns True if they were copied,
+        False if the list is cached as without results and None if it is
+        not cached.
+        """
+
+        cached = self.path(key)
+        try:
+            os.utime(cached, None)
+            empty = os.path.getsize(cached) == 0
+            if not empty:
+                # replaced, not written through: it may be a hard link
+                if os.path.lexists(outname):
+                    os.remove(outname)
+                if link:
+                    try:
+                        os.link(cached, outname)
+                    except OSError:
+                        shutil.copyfile(cached, outname)
+                else:
+                    shutil.copyfile(cached, outname)
+        except (OSError, IOError):
+            # missing (or just evicted by another process)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return not empty
+
+
+    def store(self, key, outname):
+
+        """
+        Adds the results file 'outname' (or, if None, the lack of
+        results) to the cache, evicting old results as needed.
+        """
+
+        path = self.path(key)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = 0
+
+        fd, temp = tempfile.mkstemp(dir=self.cachedir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as fh:
+                if outname is not None:
+                    with open(outname, "rb") as src:
+                        shutil.copyfileobj(src, fh)
+            os.chmod(temp, MODE)
+            added = os.path.getsize(temp)
+            os.rename(temp, path)
+        except:
+            os.remove(temp)
+            raise
+
+        if self._size is None:
+            self._size = self.size()
+        else:
+            self._size += added - replaced
+
+        if self._size > self.maxsize:
+            self.prune()
+
+
+    def entries(self):
+
+        """
+        Returns the (key, size, last use time) of the cached results,
+        least recently used first.
+        """
+
+        entries = []
+        for path in glob.glob(os.path.join(self.cachedir, "*" + self.suffix)):
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            key = os.path.splitext(os.path.basename(path))[0]
+            entries.append((key, st.st_size, st.st_mtime))
+
+        return sorted(entries, key=lambda e: e[2])
+
+
+    def size(self):
+
+        return sum(size for _, size, _ in self.entries())
+
+
+    def prune(self, maxsize=None):
+
+        """
+        Evicts the least recently used results until the cache fits in
+        'maxsize' bytes (by default its own bound). Returns the number of
+        results evicted.
+        """
+
+        if maxsize is None:
+            maxsize = self.maxsize
+
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+
+        evicted = 0
+        for key, size, _ in entries:
+            if total <= maxsize:
+                break
+            try:
+                os.remove(self.path(key))
+                evicted += 1
+            except OSError:
+                pass
+            total -= size
+
+        self._size = total
+        return evicted
+
+
+    def clear(self):
+
+        """
+        Removes all the cached results (including the lists cached as
+        without results), returning their number.
+        """
+
+        removed = 0
+        for key, _, _ in self.entries():
+            try:
+                os.remove(self.path(key))
+                removed += 1
+            except OSError:
+                pass
+
+        self._size = 0
+        return removed
@@ -25,11 +25,10 @@ setup(name='makimono',
           'networkx',
           'jinja2',
           'numpy',
+          'scipy',
           'pandas',
           'matplotlib',
-          'rpy2',
-          'pydot',
-          'graphviz-python'
+          'rpy2'
       ],
       scripts=['bin/makisu'],
       test_suite='nose.collector',
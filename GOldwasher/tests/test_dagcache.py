@@ -0,0 +1,194 @@
+from unittest import TestCase
+
+import pkg_resources, os, shutil, tempfile, threading
+from .. import dagcache, oboe
+from .test_oboe import FAKE_DOT
+
+
+def dot_text(hue, pvalue, counts, name='photosynthesis'):
+    return ('strict digraph  {\n graph[rankdir="BT"];\n'
+            '"GO:0015979" [ id="GO:0015979" shape="note" style="filled" '
+            'color="%s 1 1" label="GO:0015979\n%s\n%s\n%s" '
+            'tooltip="photosynthesis"];\n'
+            '"GO:0008150" [rank="sink" style="filled" '
+            'label="GO:0008150\\nbiological_process"];\n'
+            '"GO:0015979" -> "GO:0008150";\n}\n' % (hue, name, pvalue, counts))
+
+
+# as laid out by Graphviz (abridged)
+SVG = '''<svg width="170pt" height="130pt">
+<g id="graph0" class="graph">
+<title>%3</title>
+<!-- GO:0015979 -->
+<g id="GO:0015979" class="node">
+<title>GO:0015979</title>
+<g id="a_GO:0015979"><a xlink:title="photosynthesis">
+<polygon fill="#00ffff" stroke="#00ffff" points="0,0 1,1"/>
+<polyline fill="none" stroke="#00ffff" points="0,0 1,1"/>
+<text text-anchor="middle" x="1" y="1">GO:0015979</text>
+<text text-anchor="middle" x="1" y="2">photosynthesis</text>
+<text text-anchor="middle" x="1" y="3">0.05</text>
+<text text-anchor="middle" x="1" y="4">(3/3)</text>
+</a>
+</g>
+</g>
+<!-- GO:0008150 -->
+<g id="node2" class="node">
+<title>GO:0008150</title>
+<polygon fill="lightgrey" stroke="#000000" points="0,0 1,1"/>
+<text text-anchor="middle" x="1" y="5">GO:0008150</text>
+<text text-anchor="middle" x="1" y="6">biological_process</text>
+</g>
+</g>
+</svg>
+'''
+
+
+class Test_LayoutCache(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.obj = dagcache.LayoutCache(os.path.join(self.tempdir, 'c'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, name, text, svg=None):
+        path = os.path.join(self.tempdir, name)
+        with open(path+'.dot', 'w') as fh:
+            fh.write(text)
+        if svg is not None:
+            with open(path+'.svg', 'w') as fh:
+                fh.write(svg)
+        return path+'.dot'
+
+    def test_key(self):
+        key, styles = dagcache.layout_key(dot_text(0.5, '0.05', '(3/3)'))
+        self.assertEqual(styles, {'GO:0015979': ('#00ffff', '0.05', '(3/3)')})
+        self.assertEqual(key, dagcache.layout_key(dot_text(0.6, '0.07',
+                                                      '(2/7)'))[0])
+        # longer (wider) lines are laid out again
+        self.assertNotEqual(key, dagcache.layout_key(dot_text(0.6, '1e-05',
+                                                         '(2/7)'))[0])
+        self.assertNotEqual(key, dagcache.layout_key(dot_text(0.5, '0.05',
+                                                         '(3/13)'))[0])
+        self.assertNotEqual(key, dagcache.layout_key(dot_text(0.5, '0.05', '(3/3)',
+                                                         'other'))[0])
+
+    def test_recolour(self):
+        svg = dagcache.recolour(SVG, {'GO:0015979': ('#0000ff', '1e-05',
+                                                     '(2/7)')})
+        self.assertTrue('<polygon fill="#0000ff" stroke="#0000ff"' in svg)
+        self.assertTrue('<polyline fill="none" stroke="#0000ff"' in svg)
+        self.assertTrue('y="3">1e-05</text>' in svg and
+                        'y="4">(2/7)</text>' in svg)
+        # the other nodes are untouched
+        self.assertEqual(svg.split('<!-- GO:0008150')[1],
+                         SVG.split('<!-- GO:0008150')[1])
+        self.assertRaises(ValueError, dagcache.recolour, SVG,
+                          {'GO:0009765': ('#0000ff', '1', '(1/1)')})
+
+    def test_reused(self):
+        first = self.write('a_BP', dot_text(0.5, '0.05', '(3/3)'), SVG)
+        self.assertFalse(self.obj.fetch(first))
+        self.obj.add(first)
+        second = self.write('b_BP', dot_text(2 / 3., '0.01', '(2/7)'))
+        self.assertTrue(self.obj.fetch(second))
+        with open(os.path.join(self.tempdir, 'b_BP.svg')) as fh:
+            svg = fh.read()
+        self.assertTrue('fill="#0000ff"' in svg and '>0.01<' in svg)
+        # a different graph is laid out
+        third = self.write('c_BP', dot_text(0.5, '0.05', '(3/3)', 'other'))
+        self.assertFalse(self.obj.fetch(third))
+        self.assertEqual((self.obj.hits, self.obj.misses), (1, 2))
+        self.assertAlmostEqual(self.obj.hit_rate(), 1 / 3.)
+
+
+    def test_ranking(self):
+        import pandas as pd
+        X = oboe.OBOe(pkg_resources.resource_filename('GOldwasher',
+                            'tests/input/mini.obo'), self.tempdir)
+        keys = []
+        for pvalues in [(0.001, 0.002), (0.002, 0.001)]:
+            df = pd.DataFrame({'GO.ID': ['GO:0015979', 'GO:0019684'],
+                               'Annotated': [3, 2], 'Significant': [3, 2],
+                               'elimFisher': list(pvalues)})
+            # as ranked in the results
+            df = df.sort_values('elimFisher')
+            dotfile = X.build_dot(os.path.join(self.tempdir, 'r'),
+                                  list(df['GO.ID']), df, 0.01)
+            with open(dotfile) as fh:
+                keys.append(dagcache.layout_key(fh.read())[0])
+        self.assertEqual(keys[0], keys[1])
+
+
+class Test_RenderCache(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        dot = os.path.join(self.tempdir, 'dot')
+        with open(dot, 'w') as fh:
+            fh.write(FAKE_DOT)
+        os.chmod(dot, 0755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.tempdir+os.pathsep+self.path
+
+        self.obj = dagcache.RenderCache(os.path.join(self.tempdir, 'c'))
+        self.X = oboe.OBOe(pkg_resources.resource_filename('GOldwasher',
+                                'tests/input/mini.obo'), self.tempdir)
+        self.dotfile = os.path.join(self.tempdir, 'a.dot')
+        with open(self.dotfile, 'w') as fh:
+            fh.write(dot_text(0.5, '0.05', '(3/3)'))
+        self.svg = os.path.join(self.tempdir, 'a.svg')
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.tempdir)
+
+    def test_reused(self):
+        self.assertEqual(self.X.export_dag_as(self.dotfile, 'svg', self.obj),
+                         None)
+        self.assertEqual((self.obj.hits, self.obj.misses), (0, 1))
+        os.remove(self.svg)
+        self.assertEqual(self.X.export_dags_as([self.dotfile], 'svg',
+                                               cache=self.obj), [])
+        self.assertEqual((self.obj.hits, self.obj.misses), (1, 1))
+        cached = self.obj.store.path(self.obj.key(self.dotfile, 'svg'))
+        self.assertTrue(os.path.samefile(self.svg, cached))
+
+    def test_changed(self):
+        self.X.export_dag_as(self.dotfile, 'svg', self.obj)
+        cached = self.obj.store.path(self.obj.key(self.dotfile, 'svg'))
+        self.obj.fetch(self.dotfile, 'svg')
+        with open(self.dotfile, 'w') as fh:
+            fh.write(dot_text(0.6, '1e-05', '(2/7)'))
+        self.assertFalse(self.obj.fetch(self.dotfile, 'svg'))
+        # rendering over the linked output replaces it, leaving the cached
+        # one alone
+        self.assertTrue(os.path.samefile(self.svg, cached))
+        self.assertEqual(oboe.render_dot(self.dotfile, 'svg'), None)
+        self.assertFalse(os.path.samefile(self.svg, cached))
+        self.assertEqual(len(self.obj.store.entries()), 1)
+
+    def test_threads(self):
+        dotfiles = []
+        for i in range(20):
+            dotfile = os.path.join(self.tempdir, 't%d.dot' % i)
+            with open(dotfile, 'w') as fh:
+                fh.write(dot_text(0.5, '0.05', '(%d/30)' % i))
+            with open(dotfile[:-4]+'.svg', 'w') as fh:
+                fh.write('<svg>%s</svg>' % ('x' * 100))
+            dotfiles.append(dotfile)
+        self.obj.store.maxsize = 1000
+
+        threads = [threading.Thread(target=self.obj.add, args=(d, 'svg'))
+                   for d in dotfiles]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        # the running size of the store matches its files
+        self.assertEqual(self.obj.store._size, self.obj.store.size())
+        self.assertTrue(self.obj.store.size() <= 1000)
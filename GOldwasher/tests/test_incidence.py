@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+import pkg_resources, os, shutil, tempfile
+import numpy as np
+from .. import incidence, hoarder
+from ..libraries import ontology
+
+
+def fixture(name):
+    return pkg_resources.resource_filename('GOldwasher', 'tests/input/'+name)
+
+
+class Test_GeneTermMatrix(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.ont = ontology.OBOOntology(fixture('mini.obo'))
+        self.obj = incidence.GeneTermMatrix.build(fixture('mini.map'),
+                                                  self.ont)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_matrix(self):
+        m = self.obj.matrix
+        self.assertEqual(m.shape, (8, len(self.obj.closure.objects)))
+        row = self.obj.gene_index['g3']
+        col = self.obj.closure.index_of('GO:0015979')
+        self.assertEqual(m[row, col], 1)
+        # obsolete only
+        self.assertEqual(m[self.obj.gene_index['g8']].nnz, 0)
+
+    def test_cached(self):
+        first = incidence.GeneTermMatrix.load(fixture('mini.map'), self.ont,
+                                              cachedir=self.tempdir)
+        self.assertEqual(len(os.listdir(self.tempdir)), 1)
+        second = incidence.GeneTermMatrix.load(fixture('mini.map'), self.ont,
+                                               cachedir=self.tempdir)
+        self.assertTrue(isinstance(second.indices, np.memmap))
+        self.assertEqual(second.genes, first.genes)
+        self.assertEqual((second.matrix != self.obj.matrix).nnz, 0)
+
+    def test_changed_mapping(self):
+        gomap = os.path.join(self.tempdir, 'mini.map')
+        shutil.copy(fixture('mini.map'), gomap)
+        cachedir = os.path.join(self.tempdir, 'cache')
+        os.mkdir(cachedir)
+        incidence.GeneTermMatrix.load(gomap, self.ont, cachedir=cachedir)
+        with open(gomap, 'a') as fh:
+            fh.write('g9\tGO:0015979\n')
+        m = incidence.GeneTermMatrix.load(gomap, self.ont, cachedir=cachedir)
+        self.assertTrue('g9' in m.gene_index)
+        # the stale cache was dropped
+        self.assertEqual(len(os.listdir(cachedir)), 1)
+
+    def test_genes_of(self):
+        genes = self.obj.genes_of(['GO:0015979', 'GO:9999999'])
+        self.assertEqual(genes, set(['g1', 'g2', 'g3']))
+
+    def test_annotations(self):
+        pathout = os.path.join(self.tempdir, 'annotations.js')
+        self.obj.write_annotations(pathout)
+        report = hoarder.Templater('list', {'g1': ['x'], 'g4': ['y']},
+                                   'phaeodactylum', pathout)
+        self.assertEqual(report.go2ids['GO:0015979'], ['g1', 'g2', 'g3'])
+        self.assertEqual(report.go2ids, self.obj.term_genes())
+        self.assertEqual(sorted(report.get_unique_genes(['GO:0015979'])),
+                         ['g1'])
+        with open(pathout) as fh:
+            # minified, in one line
+            self.assertEqual(len(fh.readlines()), 1)
+        report = hoarder.Templater('list', {'g1': ['x'], 'g4': ['y']},
+                                   'phaeodactylum', None, incidence=self.obj)
+        self.assertEqual(sorted(report.get_unique_genes(['GO:0015979'])),
+                         ['g1'])
+
+    def test_pretty_annotations(self):
+        # as exported by GOrich.extract_full_annot_mapping (jsonlite)
+        pathout = os.path.join(self.tempdir, 'annotations.js')
+        with open(pathout, 'w') as fh:
+            fh.write('var annotmap =  {\n  "GO:0015979": ["g1", "g2"],\n'
+                     '  "GO:0008150": ["g1"]\n}\n')
+        report = hoarder.Templater('list', {}, 'phaeodactylum', pathout)
+        self.assertEqual(report.go2ids, {'GO:0015979': ['g1', 'g2'],
+                                         'GO:0008150': ['g1']})
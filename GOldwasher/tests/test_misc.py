@@ -67,6 +67,13 @@ class Test_read_enrichment_tsv(TestCase):
         self.assertTrue(len(self.obj.read_enrichment_tsv(
                             self.imp2 ,'KEGG Pathways').columns) == 7)
 
+    def test_score_column(self):
+        df = self.obj.read_enrichment_tsv(self.imp ,'GO')
+        self.assertEqual(misc.score_column(df), 'elimFisher')
+        self.assertEqual(df['elimFisher'].dtype.kind, 'f')
+        self.assertEqual(misc.score_column(df[['GO.ID', 'classicFisher']]),
+                         'classicFisher')
+
 
 class Test_process_enrichment_values(TestCase):
 
@@ -0,0 +1,462 @@
+from unittest import TestCase
+
+import pkg_resources, os, shutil, tempfile
+from StringIO import StringIO
+from .. import nativerich, misc
+from ..libraries import ontology
+
+
+def fixture(name):
+    return pkg_resources.resource_filename('GOldwasher', 'tests/input/'+name)
+
+
+class Test_GeneAnnotations(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.ont = ontology.OBOOntology(fixture('mini.obo'))
+        self.obj = nativerich.GeneAnnotations(fixture('mini.map'), self.ont)
+
+    def annotations(self, gene):
+        A = self.obj
+        i = A.gene_index[gene]
+        return sorted(A.closure.ids(A.indices[A.indptr[i]:A.indptr[i+1]]))
+
+    def test_propagated(self):
+        # is_a and part_of are followed
+        self.assertTrue('GO:0015979' in self.annotations('g3'))
+        self.assertTrue('GO:0009523' in self.annotations('g3'))
+        self.assertTrue('GO:0009579' in self.annotations('g3'))
+
+    def test_alt_and_obsolete(self):
+        self.assertTrue('GO:0044237' in self.annotations('g6'))
+        self.assertEqual(self.annotations('g8'), [])
+
+    def test_universe(self):
+        mask = self.obj.aspect_mask('BP')
+        feasible = self.obj.feasible(mask)
+        self.assertEqual(sorted(self.obj.genes[i] for i in
+                                feasible.nonzero()[0]),
+                         ['g1', 'g2', 'g3', 'g4', 'g5', 'g6'])
+
+    def test_counts(self):
+        counts = self.obj.counts(self.obj.gene_positions(['g1', 'g3', 'x']))
+        position = self.obj.closure.index_of
+        self.assertEqual(counts[position('GO:0015979')], 2)
+        self.assertEqual(counts[position('GO:0003674')], 1)
+        self.assertEqual(counts[position('GO:0050789')], 0)
+
+
+class Test_NativeGOrich(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.targets = os.path.join(self.tempdir, 'list.txt')
+        with open(self.targets, 'w') as fh:
+            fh.write('g1\tsome\ng2\tdescription\ng3\n\nunmapped\n')
+
+        ont = ontology.OBOOntology(fixture('mini.obo'))
+        annots = nativerich.GeneAnnotations(fixture('mini.map'), ont)
+        self.obj = nativerich.NativeGOrich(annots, 'BP')
+        self.genes = nativerich.read_target_group_of_interest(self.targets)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_classic_fisher(self):
+        k, expected, p = self.obj.classic_fisher(self.genes)
+        terms = self.obj.annotations.closure.ids(self.obj.terms)
+        row = terms.index('GO:0015979')
+        # 3 of 3 annotated genes among 3 of the 6 genes in the universe
+        self.assertEqual(k[row], 3)
+        self.assertAlmostEqual(expected[row], 1.5)
+        self.assertAlmostEqual(p[row], 1 / 20.)
+        self.assertAlmostEqual(p[terms.index('GO:0008150')], 1.)
+
+    def test_table(self):
+        table = self.obj.gen_table(self.genes)
+        self.assertEqual(table[0][-1], 'elimFisher')
+        # GO:0006091 has the same genes (and p-value) as GO:0015979
+        self.assertEqual(sorted(r[0] for r in table[1:3]),
+                         ['GO:0006091', 'GO:0015979'])
+        self.assertEqual(table[2][1:], ['photosynthesis', '3', '3', '1.5',
+                                        '2', '0.05', '0.05'])
+        self.assertEqual(sorted(r[0] for r in table[1:]),
+                         sorted(self.obj.annotations.closure.ids(
+                                                        self.obj.terms)))
+
+    def test_written(self):
+        outname = self.obj.perform_go_enrichment(self.targets)
+        self.assertEqual(outname, os.path.join(self.tempdir, 'goenrich',
+                                               'BP', 'list_enrichment.tsv'))
+        df = misc.Slicer(fixture('id2desc.txt')).read_enrichment_tsv(
+                                        outname, 'GO Biological Process')
+        self.assertEqual(df['elimFisher'][0], 0.05)
+        self.assertEqual(list(df.columns), 
+                         ['GO.ID', 'Term', 'Annotated', 'Significant',
+                          'Expected', 'Rank in classicFisher', 
+                          'classicFisher', 'elimFisher'])
+
+    def test_nothing_mapped(self):
+        with open(self.targets, 'w') as fh:
+            fh.write('g7\ng8\n')
+        self.assertEqual(self.obj.perform_go_enrichment(self.targets), None)
+
+    def test_lists(self):
+        lists = [self.genes, [], ['g4', 'g5', 'g6'], ['g2', 'g7']]
+        k, expected, p = self.obj.classic_fisher_lists(lists)
+        for i, genes in enumerate(lists):
+            for got, single in zip((k[i], expected[i], p[i]),
+                                   self.obj.classic_fisher(genes)):
+                self.assertTrue((abs(got - single) < 1e-12).all())
+        self.assertEqual(list(self.obj.gen_tables(lists, chunk=3)),
+                         [self.obj.gen_table(genes) for genes in lists])
+
+    def test_written_lists(self):
+        other = os.path.join(self.tempdir, 'other.txt')
+        with open(other, 'w') as fh:
+            fh.write('g7\n')
+        outnames = self.obj.perform_go_enrichment_lists([other, self.targets])
+        self.assertEqual(outnames, [None, os.path.join(self.tempdir, 
+                         'goenrich', 'BP', 'list_enrichment.tsv')])
+        with open(outnames[1]) as fh:
+            self.assertEqual([l.rstrip('\n').split('\t') for l in fh],
+                             self.obj.gen_table(self.genes))
+
+
+class Test_NativeKEGGer(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.targets = os.path.join(self.tempdir, 'list.txt')
+        with open(self.targets, 'w') as fh:
+            fh.write('g1\tsome\ng2\ng3\nunmapped\n')
+        names = os.path.join(self.tempdir, 'names.txt')
+        with open(names, 'w') as fh:
+            fh.write('00860\tPorphyrin and chlorophyll metabolism\n')
+
+        self.obj = nativerich.NativeKEGGer(fixture('mini.kegg'), alpha=1,
+                                           names=names)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_hypergeometric(self):
+        from scipy.stats import hypergeom
+        k, expected, p, n = self.obj.hypergeometric_lists([['g1', 'g2', 'g3'],
+                                                           ['g4', 'x']])
+        self.assertEqual(list(n), [3, 1])
+        self.assertEqual(self.obj.pathways, ['00630', '00860', '01100'])
+        self.assertEqual(k.tolist(), [[1, 3, 3], [1, 0, 1]])
+        self.assertAlmostEqual(expected[0, 1], 1.5)
+        for i, j in [(0, 0), (0, 1), (1, 0), (1, 2)]:
+            self.assertAlmostEqual(p[i, j], hypergeom.sf(k[i, j] - 1, 6,
+                                   self.obj.sizes[j], n[i]))
+
+    def test_written(self):
+        outname = self.obj.perform_kegg_enrichment(self.targets)
+        self.assertEqual(outname, os.path.join(self.tempdir, 'keggenrich',
+                                               'list_enrichment.tsv'))
+        df = misc.Slicer(fixture('id2desc.txt')).read_enrichment_tsv(
+                                        outname, 'KEGG Pathways')
+        self.assertEqual(list(df.columns), list(misc.Slicer(fixture(
+                         'id2desc.txt')).read_enrichment_tsv(fixture(
+                         'keggenr.txt'), 'KEGG Pathways').columns))
+        # the pathway with all the genes is never enriched
+        self.assertEqual(list(df['KEGGID']), ['00860', '00630'])
+        self.assertEqual(list(df['Term']), 
+                         ['Porphyrin and chlorophyll metabolism', '00630'])
+        self.assertAlmostEqual(df['Pvalue'][0], 0.05)
+        self.assertEqual(df['OddsRatio'][0], float('inf'))
+        self.assertEqual(df['OddsRatio'][1], 1.)
+
+    def test_nothing_mapped(self):
+        with open(self.targets, 'w') as fh:
+            fh.write('g7\n')
+        self.assertEqual(self.obj.perform_kegg_enrichment(self.targets), None)
+
+
+class Test_upper_tail(TestCase):
+
+    def test_scipy(self):
+        from scipy.stats import hypergeom
+        import numpy as np
+        rnd = np.random.RandomState(1)
+        for N, n in [(6, 3), (500, 40), (20000, 300)]:
+            K = rnd.randint(1, N + 1, 200)
+            k = np.minimum(rnd.randint(0, n + 1, 200), K)
+            got = nativerich.upper_tail(k, N, K, n)
+            expected = hypergeom.sf(k - 1, N, K, n)
+            self.assertTrue(np.allclose(got, expected, rtol=1e-9, atol=0))
+
+    def test_tiny(self):
+        from scipy.stats import hypergeom
+        p = nativerich.upper_tail([100], 20000, [400], 100)[0]
+        self.assertTrue(0 < p < 1e-100)
+        self.assertAlmostEqual(p / hypergeom.sf(99, 20000, 400, 100), 1.)
+
+
+class Test_formatting(TestCase):
+
+    def test_pvalue(self):
+        self.assertEqual(nativerich.format_pvalue(0.0073123), '0.0073')
+        self.assertEqual(nativerich.format_pvalue(1e-40), '< 1e-30')
+
+    def test_term(self):
+        name = 'cell wall macromolecule catabolic process'
+        self.assertEqual(nativerich.truncate_term(name),
+                         'cell wall macromolecule catabolic proces...')
+
+
+def reference_sets(engine, genes):
+    # the universe, genes of interest and members of the tested terms
+    A = engine.annotations
+    universe = set(A.genes[i] for i in engine.universe.nonzero()[0])
+    sig = set(genes) & universe
+    members = dict((t, set()) for t in engine.terms)
+    for i, gene in enumerate(A.genes):
+        if gene in universe:
+            for t in A.indices[A.indptr[i]:A.indptr[i+1]]:
+                if t in members:
+                    members[t].add(gene)
+    return universe, sig, members
+
+
+def reference_levels(closure, members):
+    def level(t):
+        parents = closure.parents[t]
+        return 1 + max(level(p) for _, p in parents) if parents else 0
+    return sorted(members, key=level, reverse=True)
+
+
+def fisher(universe, sig, current):
+    from scipy.stats import hypergeom
+    return min(hypergeom.sf(len(current & sig) - 1, len(universe),
+                            len(current), len(sig)), 1)
+
+
+def reference_elim(engine, genes, cutoff):
+    # topGO's elim algorithm, on plain sets of genes
+    closure = engine.annotations.closure
+    universe, sig, members = reference_sets(engine, genes)
+
+    removed = dict((t, set()) for t in members)
+    pvalues = {}
+    for t in reference_levels(closure, members):
+        current = members[t] - removed[t]
+        pvalues[t] = fisher(universe, sig, current)
+        if pvalues[t] < cutoff:
+            for a in closure.ancestors(closure.objects[t]):
+                if a in removed:
+                    removed[a] |= current
+    return [pvalues[t] for t in engine.terms]
+
+
+def reference_weight01(engine, genes):
+    # the genes of more significant children are removed from a term
+    # and its ancestors, one level at a time (the reading of topGO's
+    # weight01 that _weight01 implements, not values from topGO)
+    closure = engine.annotations.closure
+    universe, sig, members = reference_sets(engine, genes)
+    order = reference_levels(closure, members)
+
+    removed = dict((t, set()) for t in members)
+    pvalues = dict((t, fisher(universe, sig, members[t])) for t in members)
+    done = set()
+    for t in order:
+        pvalues[t] = fisher(universe, sig, members[t] - removed[t])
+        children = [c for c in done if any(p == t for _, p in
+                                           closure.parents[c])]
+        better = set()
+        for c in children:
+            if pvalues[c] < pvalues[t]:
+                better |= members[c] - removed[c]
+        if better:
+            for a in [t] + list(closure.ancestors(closure.objects[t])):
+                if a in removed:
+                    removed[a] |= better
+            pvalues[t] = fisher(universe, sig, members[t] - removed[t])
+        done.add(t)
+    return [pvalues[t] for t in engine.terms]
+
+
+def reference_parentchild(engine, genes):
+    # each term against the union of the genes of its parents
+    from scipy.stats import hypergeom
+    closure = engine.annotations.closure
+    universe, sig, members = reference_sets(engine, genes)
+
+    pvalues = []
+    for t in engine.terms:
+        parents = [p for _, p in closure.parents[t] if p in members]
+        population = universe
+        if parents:
+            population = set.union(*[members[p] for p in parents])
+        pvalues.append(min(hypergeom.sf(len(members[t] & sig) - 1,
+                                        len(population), len(members[t]),
+                                        len(population & sig)), 1))
+    return pvalues
+
+
+def random_engines(tempdir, runs=3, seed=7):
+    # engines (and gene lists) on random DAGs
+    import random
+    rnd = random.Random(seed)
+    for run in range(runs):
+        lines = ['[Term]\nid: T:0\nnamespace: biological_process\n']
+        for i in range(1, 120):
+            parents = set(rnd.randrange(i) for _ in range(3))
+            lines.append('[Term]\nid: T:%d\nnamespace: '
+                         'biological_process\n' % i + ''.join(
+                         ('is_a: T:%d\n' if rnd.random() < .7 else
+                          'relationship: part_of T:%d\n') % p
+                         for p in parents))
+        ont = ontology.OBOOntology(StringIO('\n'.join(lines)))
+        gomap = os.path.join(tempdir, 'map.txt')
+        with open(gomap, 'w') as fh:
+            for g in range(300):
+                fh.write('g%d\t%s\n' % (g, ', '.join('T:%d' % 
+                         rnd.randrange(120) for _ in range(3))))
+        annots = nativerich.GeneAnnotations(gomap, ont)
+        genes = ['g%d' % g for g in rnd.sample(range(300), 60)]
+        yield nativerich.NativeGOrich(annots, 'BP'), genes
+
+
+class Test_elim(TestCase):
+
+    @classmethod
+    def setUp(self):
+        ont = ontology.OBOOntology(fixture('mini.obo'))
+        self.annots = nativerich.GeneAnnotations(fixture('mini.map'), ont)
+        self.genes = ['g1', 'g2', 'g3']
+
+    def pvalues(self, engine, p):
+        ids = self.annots.closure.ids(engine.terms)
+        return dict(zip(ids, p))
+
+    def test_levels(self):
+        closure = self.annots.closure
+        levels = dict(zip(closure.ids(range(len(closure.objects))),
+                          self.annots.levels))
+        self.assertEqual(levels['GO:0008150'], 0)
+        self.assertEqual(levels['GO:0044237'], 2)
+        # via part_of GO:0019684
+        self.assertEqual(levels['GO:0009765'], 6)
+
+    def test_eliminated(self):
+        engine = nativerich.NativeGOrich(self.annots, 'BP')
+        elim = self.pvalues(engine, engine.elim_fisher(self.genes, 0.06))
+        classic = self.pvalues(engine, engine.classic_fisher(self.genes)[2])
+        self.assertAlmostEqual(elim['GO:0015979'], 0.05)
+        # all its genes were taken by GO:0015979
+        self.assertAlmostEqual(classic['GO:0006091'], 0.05)
+        self.assertAlmostEqual(elim['GO:0006091'], 1.)
+        # alpha is the default cutoff
+        engine = nativerich.NativeGOrich(self.annots, 'BP', alpha=0.06)
+        self.assertEqual(list(engine.elim_fisher(self.genes)),
+                         list(engine.elim_fisher(self.genes, 0.06)))
+
+    def test_not_eliminated(self):
+        engine = nativerich.NativeGOrich(self.annots, 'BP', alpha=0.01)
+        elim = engine.elim_fisher(self.genes)
+        classic = engine.classic_fisher(self.genes)[2]
+        self.assertTrue((abs(elim - classic) < 1e-12).all())
+
+    def test_scores(self):
+        # hand-derived p-values (see the fixture header), not those of
+        # reference_elim
+        scores = {}
+        with open(fixture('elim.scores.tsv')) as fh:
+            lines = [l.rstrip('\n').split('\t') for l in fh
+                     if not l.startswith('#')]
+        for row in lines[1:]:
+            scores[row[0]] = dict(zip(lines[0][1:], map(float, row[1:])))
+
+        annots = nativerich.GeneAnnotations(fixture('elim.map'),
+                                            self.annots.ontology)
+        engine = nativerich.NativeGOrich(annots, 'BP', alpha=0.01)
+        genes = nativerich.read_target_group_of_interest(
+                                                    fixture('elim.list'))
+        data, results = engine.run_tests(genes)
+        ids = annots.closure.ids(engine.terms)
+        self.assertEqual(sorted(ids), sorted(scores))
+        for go, classic, elim in zip(ids, data['classic'], results['elim']):
+            self.assertAlmostEqual(classic, scores[go]['classic'], places=12)
+            self.assertAlmostEqual(elim, scores[go]['elim'], places=12)
+
+    def test_random_dags(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            for engine, genes in random_engines(tempdir):
+                expected = reference_elim(engine, genes, 0.2)
+                got = engine.elim_fisher(genes, 0.2)
+                for e, g in zip(expected, got):
+                    self.assertAlmostEqual(e, g, places=12)
+                self.assertTrue((got > engine.classic_fisher(genes)[2]
+                                 + 1e-12).any())
+        finally:
+            shutil.rmtree(tempdir)
+
+
+class Test_algorithms(TestCase):
+
+    @classmethod
+    def setUp(self):
+        ont = ontology.OBOOntology(fixture('mini.obo'))
+        self.annots = nativerich.GeneAnnotations(fixture('mini.map'), ont)
+        self.genes = ['g1', 'g2', 'g3']
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, nativerich.NativeGOrich, self.annots,
+                          'BP', algorithms=['weight'])
+
+    def test_weight01_unvalidated(self):
+        # not one of the ALGORITHMS until validated against R
+        self.assertRaises(ValueError, nativerich.NativeGOrich, self.annots,
+                          'BP', algorithms=['elim', 'weight01'])
+        engine = nativerich.NativeGOrich(self.annots, 'BP')
+        self.assertRaises(ValueError, engine.run_tests, self.genes,
+                          ['weight01'])
+
+    def test_weight01(self):
+        engine = nativerich.NativeGOrich(self.annots, 'BP')
+        p = dict(zip(self.annots.closure.ids(engine.terms),
+                     engine.weight01_fisher(self.genes)))
+        self.assertAlmostEqual(p['GO:0015979'], 0.05)
+        # as significant as its child GO:0015979, so it keeps its genes
+        self.assertAlmostEqual(p['GO:0006091'], 0.05)
+
+    def test_parentchild(self):
+        engine = nativerich.NativeGOrich(self.annots, 'BP')
+        p = dict(zip(self.annots.closure.ids(engine.terms),
+                     engine.parentchild_fisher(self.genes)))
+        # all the genes of its parent GO:0006091
+        self.assertAlmostEqual(p['GO:0015979'], 1.)
+        self.assertAlmostEqual(p['GO:0008150'], 1.)
+
+    def test_run_tests(self):
+        engine = nativerich.NativeGOrich(self.annots, 'BP', 
+                        algorithms=['parentchild', 'elim'])
+        data, results = engine.run_tests(self.genes)
+        self.assertEqual(sorted(results), ['elim', 'parentchild'])
+        self.assertTrue((data['classic'] == 
+                         engine.classic_fisher(self.genes)[2]).all())
+        table = engine.gen_table(self.genes)
+        self.assertEqual(table[0][-3:], ['classicFisher', 'parentchildFisher',
+                                         'elimFisher'])
+
+    def test_random_dags(self):
+        tempdir = tempfile.mkdtemp()
+        try:
+            for engine, genes in random_engines(tempdir, seed=11):
+                for reference, got in [
+                        (reference_weight01(engine, genes), 
+                         engine.weight01_fisher(genes)),
+                        (reference_parentchild(engine, genes),
+                         engine.parentchild_fisher(genes))]:
+                    for e, g in zip(reference, got):
+                        self.assertAlmostEqual(e, g, places=12)
+        finally:
+            shutil.rmtree(tempdir)
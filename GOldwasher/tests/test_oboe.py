@@ -0,0 +1,202 @@
+from unittest import TestCase
+
+import pkg_resources, os, shutil, tempfile
+from .. import oboe
+from .test_ontology import next_release
+
+
+class Test_snapshot(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.obo = os.path.join(self.cachedir, 'mini.obo')
+        shutil.copy(pkg_resources.resource_filename('GOldwasher',
+                                        'tests/input/mini.obo'), self.obo)
+        self.obj = oboe.OBOe(self.obo, self.cachedir)
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def test_snapshot_written(self):
+        self.assertTrue(os.path.isfile(self.obj.snapfile))
+
+    def test_snapshot_loaded(self):
+        again = oboe.OBOe(self.obo, self.cachedir)
+        self.assertEqual(again.snapfile, self.obj.snapfile)
+        self.assertEqual(sorted(again.ontology.id2term),
+                         sorted(self.obj.ontology.id2term))
+        self.assertEqual(again.ontology.alt2id, self.obj.ontology.alt2id)
+
+    def test_directed_edges(self):
+        terms = ['GO:0009765', 'GO:0019684', 'GO:0009987', 'GO:0008150']
+        edges, root = self.obj.get_directed_edges(terms)
+        self.assertFalse(('GO:0009765', 'GO:0019684') in edges)
+        X = oboe.OBOe(self.obo, self.cachedir, relations='is_a+part_of')
+        edges, root = X.get_directed_edges(terms)
+        self.assertTrue(('GO:0009765', 'GO:0019684') in edges)
+        self.assertTrue(('GO:0009765', 'GO:0009987') in edges)
+        self.assertEqual(root, 'GO:0008150')
+
+    def test_build_dot(self):
+        import pandas as pd
+        df = pd.DataFrame({'GO.ID': ['GO:0009765', 'GO:0009987'],
+                           'Annotated': [3, 5], 'Significant': [3, 3],
+                           'elimFisher': [0.001, 0.5]})
+        outname = os.path.join(self.cachedir, 'list_BP')
+        dotname = self.obj.build_dot(outname, ['GO:0009765'], df, 0.01)
+        self.assertEqual(dotname, outname+'.dot')
+        with open(dotname) as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(lines[:2], ['strict digraph  {', 
+                                     ' graph[rankdir="BT"];'])
+        self.assertEqual(lines[-1], '}')
+        self.assertTrue(lines[2].startswith('"GO:0009765" [ id="GO:0009765" '
+                                            'shape="note"'))
+        # same nodes (and their edges) as the networkx graph of the terms
+        nodes = self.obj.ontology.to_networkx(['GO:0009765']).nodes()
+        edges, root = self.obj.get_directed_edges(nodes)
+        self.assertEqual(sorted(l.split('"')[1] for l in lines
+                                if '->' not in l and l.startswith('"')),
+                         sorted(nodes))
+        self.assertEqual(sorted(l for l in lines if '->' in l),
+                         sorted('"%s" -> "%s";' % e for e in edges))
+        self.assertTrue('"%s" [rank="sink"' % root in '\n'.join(lines))
+
+    def test_node_styling(self):
+        pvalues = [0, 1e-30, 0.0073, 1]
+        hues = self.obj.get_enrichment_colors(pvalues)
+        for p, hue in zip(pvalues, hues):
+            self.assertEqual(self.obj.get_enrichment_color(p), (hue, 1, 1))
+        self.assertEqual(hues[0], 240 / 360.)
+        name = 'cell wall macromolecule catabolic process'
+        label = self.obj.process_term_name(name)
+        self.assertEqual(label, ' cell wall\\nmacromolecule\\ncatabolic process')
+        self.assertEqual(self.obj._term_labels[name], label)
+        # not shared with other ontologies
+        self.assertEqual(oboe.OBOe(self.obo, self.cachedir)._term_labels, {})
+
+    def test_snapshot_not_leaked(self):
+        import glob
+        snapfile = os.path.join(self.cachedir, 'other.pickle')
+        self.assertRaises(oboe.pickle.PicklingError, self.obj.write_snapshot,
+                          lambda: None, snapfile)
+        self.assertFalse(os.path.exists(snapfile))
+        self.assertEqual(glob.glob(os.path.join(self.cachedir, '*.tmp')), [])
+
+    def test_snapshot_refreshed(self):
+        with open(self.obo, 'a') as fh:
+            fh.write('\n[Term]\nid: GO:0000001\nname: extra\n')
+        again = oboe.OBOe(self.obo, self.cachedir)
+        self.assertNotEqual(again.snapfile, self.obj.snapfile)
+        self.assertFalse(os.path.isfile(self.obj.snapfile))
+        self.assertTrue('GO:0000001' in again.ontology)
+
+
+class Test_delta(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.cachedir = tempfile.mkdtemp()
+        self.old = os.path.join(self.cachedir, 'old.obo')
+        self.new = os.path.join(self.cachedir, 'new.obo')
+        shutil.copy(pkg_resources.resource_filename('GOldwasher',
+                                        'tests/input/mini.obo'), self.old)
+        with open(self.new, 'w') as fh:
+            fh.write(next_release())
+
+        self.prev = oboe.OBOe(self.old, self.cachedir)
+        self.delta = oboe.OBOe(self.new, snapshot=False).diff(self.prev)
+        self.deltafile = os.path.join(self.cachedir, 'delta.json')
+        self.delta.write(self.deltafile)
+
+    def tearDown(self):
+        shutil.rmtree(self.cachedir)
+
+    def write_tsv(self, aspect, name, rows):
+        path = os.path.join(self.cachedir, 'goenrich', aspect)
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        with open(os.path.join(path, name), 'w') as fh:
+            fh.write('GO.ID\tAnnotated\tSignificant\telimFisher\n')
+            for go, p in rows:
+                fh.write('%s\t10\t5\t%s\n' % (go, p))
+        return os.path.join(path, name)
+
+    def test_snapshot_from_delta(self):
+        X = oboe.OBOe(self.new, self.cachedir, delta=self.deltafile)
+        self.assertTrue(os.path.isfile(X.snapfile))
+        self.assertTrue('GO:0009768' in X.ontology)
+        self.assertEqual(X.ontology.resolve('GO:0044464'), 'GO:0005575')
+
+    def test_mismatching_delta(self):
+        with open(self.new, 'a') as fh:
+            fh.write('\n[Term]\nid: GO:0000001\nname: extra\n')
+        X = oboe.OBOe(self.new, self.cachedir, delta=self.deltafile)
+        self.assertTrue('GO:0000001' in X.ontology)
+
+    def test_affected_results(self):
+        moved = self.write_tsv('BP', 'a_enrichment.tsv',
+                               [('GO:0009765', '0.001')])
+        below = self.write_tsv('BP', 'b_enrichment.tsv',
+                               [('GO:0010109', '0.001'), ('GO:0044237', '0.5')])
+        kept = self.write_tsv('MF', 'c_enrichment.tsv',
+                              [('GO:0003824', '0.001')])
+        X = oboe.OBOe(self.new, self.cachedir)
+        enrichments, dags = X.affected_results(self.delta, self.cachedir, 0.05)
+        self.assertEqual(enrichments, [moved, below])
+        # the graphs of GO:0003824 and GO:0010109 did not change, but
+        # the latter's result did (annotations of GO:0044237)
+        self.assertEqual(dags, [os.path.splitext(moved)[0]+'_BP.dot',
+                                os.path.splitext(below)[0]+'_BP.dot'])
+        self.assertFalse(os.path.splitext(kept)[0]+'_MF.dot' in dags)
+
+
+# stands in for Graphviz: fails on 'fail' graphs, hangs on 'slow' ones
+FAKE_DOT = '''#!/bin/sh
+case "$2" in
+    *fail*) echo "Error: syntax error in line 1" >&2; exit 1;;
+    *slow*) exec sleep 30;;
+esac
+echo "<svg/>"
+'''
+
+
+class Test_export(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        dot = os.path.join(self.tempdir, 'dot')
+        with open(dot, 'w') as fh:
+            fh.write(FAKE_DOT)
+        os.chmod(dot, 0755)
+        self.path = os.environ['PATH']
+        os.environ['PATH'] = self.tempdir+os.pathsep+self.path
+
+        self.dots = []
+        for name in ['a', 'fail', 'slow', 'b']:
+            self.dots.append(os.path.join(self.tempdir, name+'.dot'))
+            open(self.dots[-1], 'w').close()
+
+    def tearDown(self):
+        os.environ['PATH'] = self.path
+        shutil.rmtree(self.tempdir)
+
+    def test_render(self):
+        self.assertEqual(oboe.render_dot(self.dots[0], 'svg'), None)
+        with open(os.path.join(self.tempdir, 'a.svg')) as fh:
+            self.assertEqual(fh.read(), '<svg/>\n')
+        self.assertEqual(oboe.render_dot(self.dots[1], 'svg'), 
+               'dot exited with status 1: Error: syntax error in line 1')
+        self.assertFalse(os.path.exists(os.path.join(self.tempdir,
+                                                     'fail.svg')))
+
+    def test_pool(self):
+        X = oboe.OBOe(pkg_resources.resource_filename('GOldwasher',
+                                'tests/input/mini.obo'), self.tempdir)
+        failed = X.export_dags_as(self.dots, 'svg', processes=2, timeout=0.5)
+        self.assertEqual([d for d, _ in failed], self.dots[1:3])
+        self.assertEqual(failed[1][1], 'timed out after 0.5 s')
+        self.assertEqual(sorted(f for f in os.listdir(self.tempdir)
+                                if f.endswith('.svg')), ['a.svg', 'b.svg'])
@@ -0,0 +1,485 @@
+from unittest import TestCase
+
+import pkg_resources, os, gzip, shutil, tempfile
+from StringIO import StringIO
+from ..libraries import ontology, compact
+
+
+def mini_obo():
+    return pkg_resources.resource_filename('GOldwasher',
+                                           'tests/input/mini.obo')
+
+
+class Test_OBOParser(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.text = ('format-version: 1.2\n\n'
+                     '[Term]\r\nid: FOO:001 ! comment\nname: foo\n\n'
+                     '[Term]\nid: FOO:002\nis_a: FOO:001\n')
+        self.events = list(ontology.OBOParser(StringIO(self.text)))
+
+    def test_header(self):
+        self.assertEqual(self.events[0], ('HEADER_TAG', 
+                                          ['format-version', '1.2']))
+
+    def test_events(self):
+        kinds = [e for e, v in self.events]
+        self.assertEqual(kinds, ['HEADER_TAG', 'START_STANZA', 'TAG_VALUE',
+                                 'TAG_VALUE', 'CLOSE_STANZA', 'START_STANZA',
+                                 'TAG_VALUE', 'TAG_VALUE', 'CLOSE_STANZA'])
+
+    def test_tag_value(self):
+        self.assertEqual(self.events[2][1], ('id', 'FOO:001', None, 
+                                             'comment'))
+
+
+class Test_load_gzip(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.gz = os.path.join(self.tmpdir, 'mini.obo.gz')
+        with open(mini_obo(), 'rb') as src:
+            fh = gzip.open(self.gz, 'wb')
+            shutil.copyfileobj(src, fh)
+            fh.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_same_terms(self):
+        plain = ontology.OBOOntology(mini_obo())
+        packed = ontology.OBOOntology(self.gz)
+        self.assertEqual([o.id for o in plain], [o.id for o in packed])
+        self.assertEqual(plain.header_tags, packed.header_tags)
+
+
+class Test_parse_indexes(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.ont = ontology.OBOOntology(mini_obo())
+
+    def test_alt2id(self):
+        self.assertEqual(self.ont.alt2id, {'GO:0000004': 'GO:0008150',
+                                           'GO:0007582': 'GO:0008150',
+                                           'GO:0044236': 'GO:0044237',
+                                           'GO:0005554': 'GO:0003674',
+                                           'GO:0008372': 'GO:0005575'})
+
+    def test_obsolete(self):
+        self.assertEqual(self.ont.obsolete, {'GO:0006118': ['GO:0006091']})
+
+    def test_namespaces(self):
+        self.assertEqual(self.ont.namespace_terms('CC'),
+                         ['GO:0005575', 'GO:0044464', 'GO:0009579',
+                          'GO:0009523'])
+        self.assertEqual(self.ont.id2namespace['GO:0016168'],
+                         'molecular_function')
+
+    def test_resolve(self):
+        self.assertEqual(self.ont.resolve('GO:0007582'), 'GO:0008150')
+        self.assertEqual(self.ont.resolve('GO:0006118'), 'GO:0006118')
+        self.assertEqual(self.ont.resolve('GO:0006118', replaced=True),
+                         'GO:0006091')
+        self.assertRaises(ValueError, self.ont.resolve, 'GO:9999999')
+
+    def test_update(self):
+        other = ontology.OBOOntology()
+        other.add_object(ontology.Term(id='GO:0009579', 
+                                       alt_id='GO:0000002'))
+        self.ont.update(other)
+        self.assertEqual(self.ont.resolve('GO:0000002'), 'GO:0009579')
+
+    def test_update_namespace(self):
+        namespace = self.ont.id2namespace['GO:0009579']
+        ids = list(self.ont.namespaces[namespace])
+        other = ontology.OBOOntology()
+        other.add_object(ontology.Term(id='GO:0009579', namespace=namespace,
+                                       replaced_by='GO:0009521'))
+        self.ont.update(other)
+        self.ont.update(other)
+        # indexed once, not again with each update
+        self.assertEqual(self.ont.namespaces[namespace], ids)
+        self.assertEqual(self.ont.obsolete['GO:0009579'], ['GO:0009521'])
+
+
+class Test_CompactOntology(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.full = ontology.OBOOntology(mini_obo())
+        self.compact = compact.CompactOntology(mini_obo())
+        self.terms = [t.id for t in self.full.terms()]
+
+    def ids(self, terms):
+        return sorted(t.id for t in terms)
+
+    def test_getitem(self):
+        for t in self.terms:
+            self.assertEqual(self.compact[t].name, self.full[t].name)
+
+    def test_parent_edges(self):
+        for t in self.terms:
+            self.assertEqual(
+                [(r, p.id) for r, p in self.compact.parent_edges(t)],
+                [(r, p.id) for r, p in self.full.parent_edges(t)])
+
+    def test_child_terms(self):
+        for t in self.terms:
+            self.assertEqual(self.ids(self.compact.child_terms(t)),
+                             self.ids(self.full.child_terms(t)))
+
+    def test_super_terms(self):
+        for t in self.terms:
+            self.assertEqual(self.ids(self.compact.super_terms(t)),
+                             self.ids(self.full.super_terms(t)))
+
+    def test_stanza(self):
+        self.assertEqual(str(self.compact['GO:0019684']),
+                         str(self.full['GO:0019684']))
+
+    def test_indexes(self):
+        self.assertEqual(self.compact.alt2id, self.full.alt2id)
+        self.assertEqual(self.compact.obsolete, self.full.obsolete)
+        self.assertEqual(self.compact.namespaces, self.full.namespaces)
+
+    def test_from_ontology(self):
+        converted = compact.CompactOntology.from_ontology(self.full)
+        self.assertEqual([o.id for o in converted], 
+                         [o.id for o in self.compact])
+
+
+def walk(ont, term, step):
+    visited = set()
+    queue = list(step(term))
+    while queue:
+        t = queue.pop()
+        if t not in visited:
+            visited.add(t)
+            queue.extend(step(t))
+    return sorted(t.id for t in visited)
+
+
+class Test_ClosureIndex(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.ont = ontology.OBOOntology(mini_obo())
+        self.closure = self.ont.closure()
+        self.terms = [t.id for t in self.ont.terms()]
+
+    def test_ancestors(self):
+        for t in self.terms:
+            self.assertEqual(
+                sorted(self.closure.ids(self.closure.ancestors(t))),
+                walk(self.ont, t, self.ont.parent_terms))
+
+    def test_descendants(self):
+        for t in self.terms:
+            self.assertEqual(
+                sorted(self.closure.ids(self.closure.descendants(t))),
+                walk(self.ont, t, self.ont.child_terms))
+
+    def test_batch(self):
+        batch = ['GO:0009765', 'GO:0016168']
+        expected = set(walk(self.ont, batch[0], self.ont.parent_terms) +
+                       walk(self.ont, batch[1], self.ont.parent_terms))
+        self.assertEqual(set(self.closure.ids(
+                            self.closure.ancestors_of(batch))), expected)
+
+    def test_propagate(self):
+        propagated = self.closure.propagate(['GO:0016168', 'GO:9999999'])
+        self.assertEqual(sorted(propagated), 
+                         ['GO:0003674', 'GO:0005488', 'GO:0016168'])
+
+    def test_alt_id(self):
+        self.assertEqual(list(self.closure.ancestors('GO:0044236')),
+                         list(self.closure.ancestors('GO:0044237')))
+
+    def test_updated_on_change(self):
+        self.ont.add_object(ontology.Term(id='GO:0000001', name='new',
+                                          is_a='GO:0009765'))
+        closure = self.ont.closure()
+        self.assertTrue(closure is self.closure)
+        self.assertTrue('GO:0019684' in closure.ids(
+                                    closure.ancestors('GO:0000001')))
+
+    def test_digest(self):
+        digest = self.closure.digest()
+        self.assertEqual(ontology.OBOOntology(mini_obo()).closure().digest(),
+                         digest)
+        self.assertNotEqual(self.ont.closure('is_a').digest(), digest)
+        self.ont.add_object(ontology.Term(id='GO:0000001', name='new',
+                                          is_a='GO:0009765'))
+        self.assertNotEqual(self.ont.closure().digest(), digest)
+
+    def test_pickled(self):
+        import cPickle as pickle
+        closure = self.ont.closure(ontology.TOPGO_RELATIONS)
+        # with an emptied position
+        self.ont.remove_object('GO:0015979')
+        again = pickle.loads(pickle.dumps(closure, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(again.parents, closure.parents)
+        self.assertEqual(again.position, closure.position)
+        self.assertEqual(again.relations, closure.relations)
+        self.assertTrue(None in again.objects)
+        self.assertEqual(again.digest(), closure.digest())
+        for t in again.position:
+            self.assertEqual(list(again.ancestors(t)),
+                             list(closure.ancestors(t)))
+            self.assertEqual(list(again.descendants(t)),
+                             list(closure.descendants(t)))
+
+
+class Test_load_parallel(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.serial = ontology.OBOOntology(mini_obo())
+        self.parallel = ontology.OBOOntology()
+        self.parallel.load_parallel(mini_obo(), processes=2)
+
+    def test_offsets(self):
+        offsets = ontology._stanza_offsets(mini_obo(), 5)
+        self.assertEqual(offsets[0], 0)
+        self.assertEqual(offsets[-1], os.path.getsize(mini_obo()))
+        self.assertTrue(len(offsets) > 2)
+        with open(mini_obo(), 'rb') as fh:
+            data = fh.read()
+        for offset in offsets[1:-1]:
+            self.assertEqual(data[offset - 1:offset + 1], '\n[')
+
+    def test_same_objects(self):
+        self.assertEqual([(o.id, o.tags()) for o in self.parallel],
+                         [(o.id, o.tags()) for o in self.serial])
+        self.assertEqual(sorted(self.parallel.id2term),
+                         sorted(self.serial.id2term))
+        self.assertEqual(self.parallel.header_tags, self.serial.header_tags)
+        self.assertEqual(self.parallel.alt2id, self.serial.alt2id)
+
+
+class Test_incremental_caches(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.ont = ontology.OBOOntology(mini_obo())
+        self.ont.closure()  # caches are valid from here on
+
+    def rebuilt(self):
+        fresh = ontology.OBOOntology()
+        for obj in self.ont.objects[len(fresh.BUILTINS):]:
+            fresh.add_object(obj)
+        fresh.closure()
+        return fresh
+
+    def assertMatchesRebuild(self):
+        fresh = self.rebuilt()
+        self.assertFalse(self.ont._invalid_cache_flag)
+        for obj in self.ont.terms():
+            self.assertEqual(
+                sorted((r, c.id) for r, c in self.ont.child_edges(obj.id)),
+                sorted((r, c.id) for r, c in fresh.child_edges(obj.id)))
+            self.assertEqual(
+                sorted(t.id for t in self.ont.super_terms(obj.id)),
+                sorted(t.id for t in fresh.super_terms(obj.id)))
+            self.assertEqual(
+                sorted(t.id for t in self.ont.sub_terms(obj.id)),
+                sorted(t.id for t in fresh.sub_terms(obj.id)))
+        self.assertEqual(self.ont.alt2id, fresh.alt2id)
+
+    def test_add_leaf(self):
+        closure = self.ont.closure()
+        self.ont.add_object(ontology.Term(id='GO:0000001', name='leaf',
+                                          alt_id='GO:0000002',
+                                          is_a='GO:0009765'))
+        self.assertTrue(self.ont.closure() is closure)
+        self.assertMatchesRebuild()
+
+    def test_add_child_before_parent(self):
+        self.ont.add_object(ontology.Term(id='GO:0000001', name='child',
+                                          is_a='GO:0000003'))
+        self.ont.add_object(ontology.Term(id='GO:0000003', name='parent',
+                                          is_a='GO:0015979'))
+        self.assertMatchesRebuild()
+        self.assertTrue('GO:0006091' in [t.id for t in 
+                                    self.ont.super_terms('GO:0000001')])
+
+    def test_update_adds_edge(self):
+        other = ontology.OBOOntology()
+        other.add_object(ontology.Term(id='GO:0009579', 
+                                       relationship='part_of GO:0009523'))
+        self.ont.update(other)
+        self.assertMatchesRebuild()
+
+    def test_remove(self):
+        self.ont.remove_object('GO:0009765')
+        self.ont.remove_object('GO:0010109')
+        self.assertFalse('GO:0009765' in self.ont)
+        self.assertMatchesRebuild()
+
+    def test_remove_inner_and_readd(self):
+        obj = self.ont.term('GO:0019684')
+        self.ont.remove_object('GO:0019684')
+        self.assertFalse('GO:0019684' in [t.id for t in 
+                                    self.ont.super_terms('GO:0009765')])
+        self.ont.add_object(obj)
+        self.assertMatchesRebuild()
+
+
+def next_release():
+    # mini.obo one release later: a term added, one merged, one made
+    # obsolete and one moved to another parent
+    with open(mini_obo()) as fh:
+        text = fh.read()
+    text = text.replace('releases/2017-01-01', 'releases/2017-02-01')
+    text = text.replace('[Term]\nid: GO:0044464\nname: cell part\n'
+                        'namespace: cellular_component\n'
+                        'is_a: GO:0005575 ! cellular_component\n\n', '')
+    text = text.replace('alt_id: GO:0008372\n',
+                        'alt_id: GO:0008372\nalt_id: GO:0044464\n')
+    text = text.replace('name: chlorophyll binding\n'
+                        'namespace: molecular_function\n'
+                        'is_a: GO:0005488 ! binding\n',
+                        'name: chlorophyll binding\n'
+                        'namespace: molecular_function\nis_obsolete: true\n')
+    text = text.replace('name: photosynthesis, light harvesting\n'
+                        'namespace: biological_process\n'
+                        'is_a: GO:0009987 ! cellular process\n',
+                        'name: photosynthesis, light harvesting\n'
+                        'namespace: biological_process\n'
+                        'is_a: GO:0006091 ! generation of precursor '
+                        'metabolites and energy\n')
+    text = text.replace('[Typedef]\nid: part_of',
+                        '[Term]\nid: GO:0009768\nname: photosynthesis, light '
+                        'harvesting in photosystem I\n'
+                        'namespace: biological_process\n'
+                        'is_a: GO:0009765 ! photosynthesis, light harvesting'
+                        '\n\n[Typedef]\nid: part_of')
+    return text
+
+
+class Test_diff(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.old = ontology.OBOOntology(mini_obo())
+        self.new = ontology.OBOOntology(StringIO(next_release()))
+        self.diff = self.old.diff(self.new)
+
+    def test_terms(self):
+        self.assertEqual(self.diff.source, 'releases/2017-01-01')
+        self.assertEqual(self.diff.target, 'releases/2017-02-01')
+        self.assertEqual(self.diff.added, ['GO:0009768'])
+        self.assertEqual(self.diff.removed, [])
+        self.assertEqual(self.diff.merged, {'GO:0044464': 'GO:0005575'})
+        self.assertEqual(self.diff.obsoleted, ['GO:0016168'])
+        self.assertEqual(self.diff.changed,
+                         ['GO:0005575', 'GO:0009765', 'GO:0016168'])
+
+    def test_edges(self):
+        self.assertTrue(('GO:0009765', 'is_a', 'GO:0006091')
+                        in self.diff.added_edges)
+        self.assertTrue(('GO:0009765', 'is_a', 'GO:0009987')
+                        in self.diff.removed_edges)
+        self.assertTrue(('GO:0009579', 'is_a', 'GO:0005575')
+                        in self.diff.added_edges)
+        self.assertTrue(('GO:0016168', 'is_a', 'GO:0005488')
+                        in self.diff.removed_edges)
+
+    def test_affected(self):
+        affected = self.diff.affected_terms(self.new)
+        # below the moved term / above its old and new parents
+        self.assertTrue('GO:0009768' in affected)
+        self.assertTrue('GO:0044237' in affected)
+        self.assertTrue('GO:0008150' in affected)
+        # untouched
+        self.assertFalse('GO:0010109' in affected)
+        self.assertFalse('GO:0003824' in affected)
+
+    def test_no_changes(self):
+        self.assertFalse(self.old.diff(ontology.OBOOntology(mini_obo())))
+
+    def check_applied(self, ont):
+        self.assertEqual(sorted(ont.id2term), sorted(self.new.id2term))
+        for id in self.new.id2term:
+            self.assertEqual(tuple(ont.term(id).tag_values),
+                             tuple(self.new.term(id).tag_values))
+        self.assertEqual(ont.alt2id, self.new.alt2id)
+        self.assertEqual(sorted(ont.obsolete), sorted(self.new.obsolete))
+        self.assertEqual(ont.data_version(), 'releases/2017-02-01')
+        for id in ['GO:0009768', 'GO:0009579', 'GO:0016168']:
+            self.assertEqual(sorted(t.id for t in ont.super_terms(id)),
+                             sorted(t.id for t in self.new.super_terms(id)))
+
+    def test_apply(self):
+        self.old.closure()
+        self.old.apply_delta(self.diff)
+        self.check_applied(self.old)
+
+    def test_delta_file(self):
+        buf = StringIO()
+        self.diff.write(buf)
+        buf.seek(0)
+        delta = ontology.OntologyDiff.read(buf)
+        self.assertEqual(delta.merged, self.diff.merged)
+        self.assertEqual(delta.added_edges, self.diff.added_edges)
+        ont = compact.CompactOntology(mini_obo())
+        ont.apply_delta(delta)
+        self.check_applied(ont)
+
+
+class Test_relation_closure(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.ont = ontology.OBOOntology(mini_obo())
+
+    def ancestors(self, id, relations):
+        closure = self.ont.closure(relations)
+        return sorted(closure.ids(closure.ancestors(id)))
+
+    def test_relation_set(self):
+        self.assertEqual(ontology.relation_set('is_a+part_of'),
+                         ontology.TOPGO_RELATIONS)
+        self.assertEqual(ontology.relation_set('all'), None)
+        self.assertTrue(self.ont.closure('part_of+is_a') is
+                        self.ont.closure(['is_a', 'part_of']))
+
+    def test_is_a(self):
+        self.assertEqual(self.ancestors('GO:0009765', 'is_a'),
+                         ['GO:0008150', 'GO:0009987'])
+
+    def test_is_a_part_of(self):
+        self.assertEqual(self.ancestors('GO:0009765', 'is_a+part_of'),
+                         ['GO:0006091', 'GO:0008150', 'GO:0008152',
+                          'GO:0009987', 'GO:0015979', 'GO:0019684',
+                          'GO:0044237'])
+        # regulates is not followed
+        self.assertEqual(self.ancestors('GO:0010109', 'is_a+part_of'),
+                         ['GO:0008150', 'GO:0050789'])
+        self.assertTrue('GO:0015979' in self.ancestors('GO:0010109', None))
+
+    def test_edges(self):
+        closure = self.ont.closure()
+        children, parents = closure.edges('part_of')
+        self.assertEqual(sorted(zip(closure.ids(children),
+                                    closure.ids(parents))),
+                         [('GO:0009523', 'GO:0009579'),
+                          ('GO:0009765', 'GO:0019684'),
+                          ('GO:0019684', 'GO:0015979')])
+        self.assertEqual(closure.edge_types(),
+                         ['is_a', 'part_of', 'regulates'])
+        self.assertEqual(self.ont.closure('is_a').edge_types(), ['is_a'])
+
+    def test_updated_on_change(self):
+        self.ont.closure('is_a')
+        self.ont.closure('is_a+part_of')
+        term = ontology.OBOObject('Term', id='GO:0009768',
+                                  name='light harvesting in photosystem I')
+        term.add_tag('relationship', 'part_of GO:0009765')
+        self.ont.add_object(term)
+        self.assertEqual(self.ancestors('GO:0009768', 'is_a'), [])
+        self.assertTrue('GO:0015979' in
+                        self.ancestors('GO:0009768', 'is_a+part_of'))
@@ -0,0 +1,86 @@
+from unittest import TestCase
+
+import os, time, shutil, tempfile
+from .. import resultcache
+
+
+class Test_ResultCache(TestCase):
+
+    @classmethod
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.obj = resultcache.ResultCache(os.path.join(self.tempdir, 'c'),
+                                           maxsize=100)
+        self.result = os.path.join(self.tempdir, 'result.tsv')
+        with open(self.result, 'w') as fh:
+            fh.write('x' * 40)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_key(self):
+        key = self.obj.key(['g2', 'g1', 'g1'], 'map', 'BP', ['elim'])
+        self.assertEqual(key, self.obj.key(['g1', 'g2'], 'map', 'BP',
+                                           ['elim']))
+        self.assertNotEqual(key, self.obj.key(['g1', 'g2'], 'map', 'MF',
+                                              ['elim']))
+        self.assertNotEqual(key, self.obj.key(['g1'], 'map', 'BP', ['elim']))
+
+    def test_fetch(self):
+        out = os.path.join(self.tempdir, 'out.tsv')
+        self.assertEqual(self.obj.fetch('a', out), None)
+        self.obj.store('a', self.result)
+        self.obj.store('b', None)
+        self.assertEqual(self.obj.fetch('a', out), True)
+        self.assertEqual(open(out).read(), 'x' * 40)
+        self.assertEqual(self.obj.fetch('b', out), False)
+        self.assertEqual((self.obj.hits, self.obj.misses), (2, 1))
+
+    def test_lru(self):
+        out = os.path.join(self.tempdir, 'out.tsv')
+        self.obj.store('a', self.result)
+        self.obj.store('b', self.result)
+        past = time.time() - 10
+        os.utime(self.obj.path('a'), (past, past))
+        os.utime(self.obj.path('b'), (past + 1, past + 1))
+        # 'a' was used last, so 'b' goes
+        self.obj.fetch('a', out)
+        self.obj.store('c', self.result)
+        self.assertEqual(sorted(e[0] for e in self.obj.entries()), ['a', 'c'])
+        self.assertEqual(self.obj.size(), 80)
+
+    def test_prune(self):
+        self.obj.store('a', self.result)
+        self.obj.store('b', None)
+        past = time.time() - 10
+        os.utime(self.obj.path('a'), (past, past))
+        # the (empty) newer entry already fits
+        self.assertEqual(self.obj.prune(0), 1)
+        self.assertEqual(self.obj.clear(), 1)
+        self.assertEqual(self.obj.entries(), [])
+
+    def test_link(self):
+        out = os.path.join(self.tempdir, 'out.tsv')
+        self.obj.store('a', self.result)
+        self.assertEqual(self.obj.fetch('a', out, link=True), True)
+        self.assertTrue(os.path.samefile(out, self.obj.path('a')))
+        # readable as any other output
+        self.assertEqual(os.stat(out).st_mode & 0777, resultcache.MODE)
+        # replaced, not written through, by a copy
+        self.obj.fetch('a', out)
+        self.assertFalse(os.path.samefile(out, self.obj.path('a')))
+
+    def test_running_size(self):
+        scans = []
+        entries = self.obj.entries
+        self.obj.entries = lambda: scans.append(1) or entries()
+        self.obj.store('a', self.result)
+        self.obj.store('a', self.result)
+        self.obj.store('b', None)
+        # scanned on the first store only
+        self.assertEqual(len(scans), 1)
+        self.obj.store('c', self.result)
+        self.obj.store('d', self.result)
+        # over the bound (120 bytes): pruned down to 80
+        self.assertEqual(len(scans), 2)
+        self.assertEqual(self.obj.size(), 80)
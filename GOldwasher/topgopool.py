@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import sys, multiprocessing, resultcache
+
+"""
+A pool of worker processes for the topGO (enricher.GOrich) enrichment
+of many gene lists, each worker with its own R session.
+
+The embedded R of rpy2 is not fork-safe, so the workers are forked
+before R is started: this module does not import enricher (nor rpy2),
+the workers do, and the pool refuses to start in a process already
+running R.
+"""
+
+# ==============================================================================
+
+def perform_go_enrichment_pool(gomap, targetspaths, ontologies=("BP", "MF",
+                               "CC"), alpha=0.01, algorithms=('elim',),
+                               processes=2, cache=None):
+
+    """
+    Calculates the GO term enrichment of several lists of
+    genes/transcripts of interest with a pool of worker processes, each
+    with its own R session (with topGO and the mapping loaded once).
+    The (list, ontology) jobs are scheduled across the workers (which
+    share the results 'cache', if any) and a failing job only loses its
+    own results.
+
+    Returns a dictionary with the list of results paths of each
+    ontology (None for the lists without results) and the list of
+    (targetspath, ontology, error) failures.
+    """
+
+    if "rpy2.robjects" in sys.modules:
+        raise RuntimeError("R is already running in this process: the "
+                           "enrichment pool has to be started before it")
+
+    jobs = [(t, ontology) for t in targetspaths for ontology in ontologies]
+    results = dict((ontology, dict()) for ontology in ontologies)
+    failures = []
+
+    if cache is not None:
+        cache = (cache.cachedir, cache.maxsize)
+
+    pool = multiprocessing.Pool(processes, _init_worker,
+                                (gomap, alpha, list(algorithms), cache))
+    try:
+        for targetspath, ontology, outname, error in pool.imap_unordered(
+                                                    _enrichment_job, jobs):
+            results[ontology][targetspath] = outname
+            if error is not None:
+                print "%s (%s) failed: %s" % (targetspath, ontology, error)
+                failures.append((targetspath, ontology, error))
+    finally:
+        pool.close()
+        pool.join()
+
+    return dict((ontology, [results[ontology].get(t) for t in targetspaths])
+                for ontology in ontologies), failures
+
+
+# accessory helpers
+# ------------------------------------------------------------------------------
+
+# enricher module, GOrich instances (by ontology) and settings of a pool
+# worker process
+_worker = {}
+
+
+def _init_worker(gomap, alpha, algorithms, cache):
+
+    # R is started here, in the (forked) worker
+    import enricher
+
+    if cache is not None:
+        cache = resultcache.ResultCache(*cache)
+
+    _worker.clear()
+    _worker["enricher"] = enricher
+    _worker["settings"] = (gomap, alpha, algorithms, cache)
+
+
+def _enrichment_job(job):
+
+    targetspath, ontology = job
+    enricher = _worker["enricher"]
+
+    try:
+        if ontology not in _worker:
+            gomap, alpha, algorithms, cache = _worker["settings"]
+            _worker[ontology] = enricher.GOrich(gomap, ontology, alpha,
+                                                algorithms, cache)
+        outname = _worker[ontology].perform_go_enrichment(targetspath)
+        error = None
+    except Exception as e:
+        outname, error = None, "%s: %s" % (type(e).__name__, e)
+    finally:
+        # nothing a job leaves in the global environment reaches the next
+        enricher.robjects.r('rm(list = ls(globalenv(), all.names = TRUE), '
+                            'envir = globalenv())')
+
+    return targetspath, ontology, outname, error
@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares testing gene lists one by one with testing them together (one
+sparse product of the lists x genes selection matrix by the gene x term
+incidence) in the native GO enrichment engine.
+
+    python benchmarks/bench_multi_list.py [--lists 1,100,1000]
+
+A synthetic GO-sized ontology and gene-to-GO map are generated. The
+classic tests alone are timed, and then the full tables (with elim).
+"""
+
+import os, sys, argparse, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+import numpy as np
+
+from GOldwasher.libraries.ontology import OBOOntology
+from GOldwasher import nativerich
+import synthetic
+
+
+def timed(function, *args):
+
+    start = time.time()
+    result = function(*args)
+    return result, time.time() - start
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--terms", type=int, default=45000)
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--lists", default="1,100,1000")
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--aspect", default="BP")
+    args = parser.parse_args()
+
+    obo = synthetic.write_obo(tempfile.mktemp(suffix=".obo"), args.terms)
+    gomap = tempfile.mktemp(suffix=".map")
+    ont = OBOOntology(obo)
+    genes = synthetic.write_gene_map(gomap, ont, args.genes)
+
+    annots = nativerich.GeneAnnotations(gomap, ont)
+    engine = nativerich.NativeGOrich(annots, args.aspect)
+    engine.incidence()
+
+    print "%6s %22s %22s %22s" % ("lists", "classic one by one",
+                                  "classic together", "tables together")
+    for count in [int(c) for c in args.lists.split(",")]:
+        lists = synthetic.gene_lists(genes, count, args.size)
+
+        single, one_by_one = timed(lambda: [engine.classic_fisher(g)[2]
+                                            for g in lists])
+        together, matrix = timed(engine.classic_fisher_lists, lists)
+        assert np.allclose(np.array(single), together[2], rtol=1e-9)
+        tables = timed(lambda: list(engine.gen_tables(lists)))[1]
+
+        print "%6d %13.2f s %5.1f ms %13.2f s %5.1f ms %13.2f s %5.1f ms" % (
+                count, one_by_one, 1000 * one_by_one / count,
+                matrix, 1000 * matrix / count, tables, 1000 * tables / count)
+
+    os.remove(obo)
+    os.remove(gomap)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the native GO enrichment engine: building the propagated gene x
+term incidence of a mapping (once) and testing gene lists against it,
+with each enrichment algorithm and with all of them on one setup.
+
+    python benchmarks/bench_native_enrich.py [--lists 100] [--genes 20000]
+
+A synthetic GO-sized ontology and gene-to-GO map are generated.
+"""
+
+import os, sys, argparse, shutil, tempfile, time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from GOldwasher.libraries.ontology import OBOOntology
+from GOldwasher import nativerich
+import synthetic
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--terms", type=int, default=45000)
+    parser.add_argument("--genes", type=int, default=20000)
+    parser.add_argument("--lists", type=int, default=100)
+    parser.add_argument("--size", type=int, default=200)
+    parser.add_argument("--algorithms", default="elim,parentchild")
+    args = parser.parse_args()
+
+    obo = synthetic.write_obo(tempfile.mktemp(suffix=".obo"), args.terms)
+    gomap = tempfile.mktemp(suffix=".map")
+    ont = OBOOntology(obo)
+    genes = synthetic.write_gene_map(gomap, ont, args.genes)
+    lists = synthetic.gene_lists(genes, args.lists, args.size)
+
+    # built and cached, then read back (memory-mapped) from the cache
+    cachedir = tempfile.mkdtemp()
+    for label in ["built", "cached"]:
+        start = time.time()
+        annots = nativerich.GeneAnnotations(gomap, ont, cachedir=cachedir)
+        print "incidence %s (%d genes, %d entries): %8.2f s" % (label,
+                len(annots.genes), len(annots.indices), time.time() - start)
+
+    for aspect in ["BP", "MF", "CC"]:
+        start = time.time()
+        engine = nativerich.NativeGOrich(annots, aspect)
+        setup = time.time() - start
+
+        print "%s: setup %6.3f s (%d terms)" % (aspect, setup, 
+                                               len(engine.terms))
+
+        # one algorithm at a time, then all of them on one setup
+        for algorithms in [[a] for a in args.algorithms.split(",")] + \
+                          [args.algorithms.split(",")]:
+            start = time.time()
+            for genelist in lists:
+                engine.run_tests(genelist, algorithms)
+            elapsed = time.time() - start
+            print "    %-28s %7.2f ms/list" % ("+".join(algorithms),
+                                              1000 * elapsed / len(lists))
+
+    os.remove(obo)
+    os.remove(gomap)
+    shutil.rmtree(cachedir)
+
+
+if __name__ == "__main__":
+    main()
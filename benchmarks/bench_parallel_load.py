@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Measures the speed-up of OBOOntology.load_parallel over the serial
+OBOOntology.load for an increasing number of worker processes.
+
+    python benchmarks/bench_parallel_load.py [--obo big.obo] [--max-jobs 8]
+
+Without --obo a synthetic ontology (several times the size of GO) is
+generated.
+"""
+
+import os, sys, argparse, tempfile, time, multiprocessing
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from GOldwasher.libraries.ontology import OBOOntology
+import synthetic
+
+
+def timed_load(obo, processes):
+
+    ont = OBOOntology()
+    start = time.time()
+    if processes:
+        ont.load_parallel(obo, processes)
+    else:
+        ont.load(obo)
+    return time.time() - start, ont
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--obo", help="OBO file (default: synthetic)")
+    parser.add_argument("--terms", type=int, default=200000,
+                        help="size of the synthetic ontology")
+    parser.add_argument("--max-jobs", type=int,
+                        default=multiprocessing.cpu_count())
+    args = parser.parse_args()
+
+    obo = args.obo
+    if obo is None:
+        obo = synthetic.write_obo(tempfile.mktemp(suffix=".obo"), args.terms)
+
+    serial, reference = timed_load(obo, 0)
+    expected = [o.id for o in reference]
+    del reference
+
+    print "ontology: %s (%.1f MB, %d cpus)" % (obo, 
+                os.path.getsize(obo) / 1048576.0, multiprocessing.cpu_count())
+    print "%6s %10s %9s" % ("jobs", "seconds", "speed-up")
+    print "%6s %10.2f %9.2f" % ("serial", serial, 1.0)
+
+    jobs = 2
+    while jobs <= max(2, args.max_jobs):
+        elapsed, ont = timed_load(obo, jobs)
+        assert [o.id for o in ont] == expected
+        print "%6d %10.2f %9.2f" % (jobs, elapsed, serial / elapsed)
+        jobs *= 2
+
+    if args.obo is None:
+        os.remove(obo)
+
+
+if __name__ == "__main__":
+    main()
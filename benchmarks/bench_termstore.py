@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Compares the memory footprint and lookup speed of the default
+OBOOntology (OBOObject terms) against CompactOntology (TermRecord
+terms and CSR relation arrays).
+
+    python benchmarks/bench_termstore.py [--obo go-basic.obo]
+
+Without --obo a synthetic GO-sized ontology is generated.
+"""
+
+import os, sys, argparse, random, resource, tempfile, timeit
+from multiprocessing import Pool
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+from GOldwasher.libraries.ontology import OBOOntology
+from GOldwasher.libraries.compact import CompactOntology
+import synthetic
+
+KINDS = {"OBOOntology": OBOOntology, "CompactOntology": CompactOntology}
+
+
+def maxrss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def measure(args):
+
+    """
+    Loads the ontology (in a fresh process) and reports the resident
+    memory it added plus the mean time of the main query methods.
+    """
+
+    kind, obo, nsample = args
+
+    before = maxrss_mb()
+    ont = KINDS[kind](obo)
+    ont.child_terms(ont.terms()[0])  # builds the relation caches
+    after = maxrss_mb()
+
+    rnd = random.Random(0)
+    ids = rnd.sample([t.id for t in ont.terms()], nsample)
+
+    queries = [("__getitem__", lambda: [ont[i] for i in ids]),
+               ("term", lambda: [ont.term(i) for i in ids]),
+               ("parent_edges", lambda: [ont.parent_edges(i) for i in ids]),
+               ("child_terms", lambda: [ont.child_terms(i) for i in ids]),
+               ("super_terms", lambda: [ont.super_terms(i) for i in ids])]
+
+    timings = []
+    for name, query in queries:
+        best = min(timeit.repeat(query, number=1, repeat=3))
+        timings.append((name, best / nsample * 1e6))
+
+    return kind, after - before, timings
+
+
+def main():
+
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--obo", help="OBO file (default: synthetic)")
+    parser.add_argument("--terms", type=int, default=45000,
+                        help="size of the synthetic ontology")
+    parser.add_argument("--sample", type=int, default=2000,
+                        help="number of terms queried")
+    args = parser.parse_args()
+
+    obo = args.obo
+    if obo is None:
+        obo = synthetic.write_obo(tempfile.mktemp(suffix=".obo"), args.terms)
+
+    # each kind is measured in its own process (maxrss is per process)
+    pool = Pool(1, maxtasksperchild=1)
+    results = pool.map(measure, [(k, obo, args.sample) for k in 
+                                 ("OBOOntology", "CompactOntology")], 1)
+    pool.close()
+
+    print "ontology: %s" % obo
+    for kind, mem, timings in results:
+        print "\n%s\n  resident memory: %8.1f MB" % (kind, mem)
+        for name, usec in timings:
+            print "  %-13s %10.2f us/term" % (name, usec)
+
+    if args.obo is None:
+        os.remove(obo)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+Generators of synthetic GO-like inputs (OBO ontologies, gene-to-GO maps,
+gene lists) for the benchmark scripts, so that they can run without the
+real go-basic.obo and annotation files.
+"""
+
+import random
+
+NAMESPACES = [("GO:0008150", "biological_process"),
+              ("GO:0003674", "molecular_function"),
+              ("GO:0005575", "cellular_component")]
+
+
+def write_obo(path, nterms=45000, seed=1):
+
+    """
+    Writes a random GO-shaped DAG (three namespaces, 'is_a' and 'part_of'
+    edges, alt_ids, obsolete terms) with roughly 'nterms' terms.
+    """
+
+    rnd = random.Random(seed)
+    members = dict((ns, [root]) for root, ns in NAMESPACES)
+
+    with open(path, "w") as fh:
+        fh.write("format-version: 1.2\ndata-version: synthetic/%d\n" % seed)
+
+        for root, ns in NAMESPACES:
+            fh.write("\n[Term]\nid: %s\nname: %s\nnamespace: %s\n" 
+                                                            % (root, ns, ns))
+
+        for i in xrange(1, nterms):
+            ns = NAMESPACES[i % 3][1]
+            goid = "GO:%07d" % (100000 + i)
+            fh.write("\n[Term]\nid: %s\nname: synthetic term %d of %s\n"
+                     "namespace: %s\n" % (goid, i, ns, ns))
+            fh.write('def: "A synthetic term used for benchmarking." '
+                     '[GOC:bench]\n')
+            fh.write('synonym: "term %d" EXACT []\n' % i)
+
+            if rnd.random() < 0.02:
+                fh.write("is_obsolete: true\n")
+                continue
+            if rnd.random() < 0.05:
+                fh.write("alt_id: GO:%07d\n" % (900000 + i))
+
+            pool = members[ns]
+            # uniformly drawn parents give GO-like (logarithmic) depths
+            nparents = rnd.choice([1, 1, 1, 2, 2, 3])
+            parents = set(rnd.choice(pool) for _ in range(nparents))
+            for n, parent in enumerate(sorted(parents)):
+                if n > 0 and rnd.random() < 0.3:
+                    fh.write("relationship: part_of %s\n" % parent)
+                else:
+                    fh.write("is_a: %s\n" % parent)
+            pool.append(goid)
+
+        fh.write("\n[Typedef]\nid: part_of\nname: part of\n")
+
+    return path
+
+
+def write_gene_map(path, ontology, ngenes=20000, seed=1):
+
+    """
+    Writes a tab-separated gene to GO accessions map annotating random
+    (non-obsolete) terms of 'ontology'.
+    """
+
+    rnd = random.Random(seed)
+    terms = [t.id for t in ontology.terms()
+             if t.id.startswith("GO:") and not t.get_values("is_obsolete")]
+    genes = ["gene%05d" % i for i in xrange(ngenes)]
+
+    with open(path, "w") as fh:
+        for gene in genes:
+            goes = rnd.sample(terms, rnd.randint(1, 8))
+            fh.write("%s\t%s\n" % (gene, ",".join(goes)))
+
+    return genes
+
+
+def gene_lists(genes, nlists, size=200, seed=1):
+
+    """
+    Returns 'nlists' random gene lists drawn from 'genes'.
+    """
+
+    rnd = random.Random(seed)
+    return [rnd.sample(genes, size) for _ in xrange(nlists)]